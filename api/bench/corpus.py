@@ -0,0 +1,131 @@
+import copy
+import json
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+# How the document's doi can be found, the same tiers process_file goes through
+METADATA_DOI = "metadata_doi"
+TITLE_ONLY = "title_only"
+TEXT_LAYER = "text_layer"
+KINDS = (METADATA_DOI, TITLE_ONLY, TEXT_LAYER)
+
+SAMPLE_WORK = Path(__file__).resolve().parents[2] / "crc.json"
+
+WORDS = (
+    "modeling vaccination epidemic dynamics optimal control network stochastic "
+    "fractional homogenization composite elastic wave numerical method analysis "
+    "population transmission stability bifurcation Cuba Havana data learning"
+).split()
+
+FAMILY_NAMES = ("Pérez", "García", "Rodríguez", "Smith", "Müller", "Rossi", "Chen", "Ivanov")
+GIVEN_NAMES = ("Ana", "Juan", "María", "Luis", "John", "Anna", "Wei", "Olga")
+
+
+@dataclass
+class CorpusFile:
+    path: str
+    doi: str
+    title: str
+    kind: str
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(path: str, pages: list[str], info: dict[str, str] | None = None):
+    """Minimal valid pdf with one line of Helvetica text per page and an optional Info dictionary
+
+    Args:
+        path (str): _description_
+        pages (list[str]): ASCII text of each page
+        info (dict[str, str], optional): metadata, for example {"Title": ..., "doi": ...}
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * index} 0 R" for index in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_id = 3 + 2 * len(pages)
+    for index, text in enumerate(pages):
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * index} 0 R >>"
+        )
+        stream = f"BT /F1 10 Tf 40 720 Td ({_escape(text)}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    if info:
+        entries = " ".join(f"/{key} ({_escape(value)})" for key, value in info.items())
+        objects.append(f"<< {entries} >>")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out.encode("latin-1")))
+        out += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref = len(out.encode("latin-1"))
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    info_ref = f" /Info {len(objects)} 0 R" if info else ""
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R{info_ref} >>\nstartxref\n{xref}\n%%EOF\n"
+    Path(path).write_bytes(out.encode("latin-1"))
+
+
+def _ascii(text: str) -> str:
+    return text.encode("ascii", "ignore").decode()
+
+
+def make_work(template: dict, doi: str, title: str, authors: list[tuple[str, str]]) -> dict:
+    """
+    Crossref work message like the template (crc.json) with another doi, title and authors
+    """
+    work = copy.deepcopy(template)
+    work["DOI"] = doi
+    work["title"] = [title]
+    affiliations = [[{"name": "Universidad de La Habana"}], [{"name": "University of Elsewhere"}]]
+    work["author"] = [
+        {
+            "given": given,
+            "family": family,
+            "sequence": "first" if index == 0 else "additional",
+            "affiliation": affiliations[index % 2],
+        }
+        for index, (given, family) in enumerate(authors)
+    ]
+    return work
+
+
+def generate_corpus(
+    directory: str, count: int, seed: int = 0, pages: int = 4
+) -> tuple[list[CorpusFile], list[dict]]:
+    """Synthetic pdfs and the Crossref works they refer to
+
+    The pdfs cycle through the kinds: doi in the metadata, only the title in the
+    metadata, and the doi only in the text of the first page.
+
+    Returns:
+        tuple[list[CorpusFile], list[dict]]: the files and the works for MockCrossref
+    """
+    rng = random.Random(seed)
+    template = json.loads(SAMPLE_WORK.read_text(encoding="utf-8"))["message"]["items"][0]
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    files, works = [], []
+    for index in range(count):
+        kind = KINDS[index % len(KINDS)]
+        doi = f"10.5555/bench.{seed}.{index:06d}"
+        title = " ".join(rng.choice(WORDS) for _ in range(8)).capitalize() + f" {index}"
+        authors = [(rng.choice(GIVEN_NAMES), rng.choice(FAMILY_NAMES)) for _ in range(rng.randint(1, 6))]
+        works.append(make_work(template, doi, title, authors))
+
+        author_names = ", ".join(_ascii(f"{given} {family}") for given, family in authors)
+        info = {"Title": title, "Author": author_names}
+        body = [f"Page {page + 1} of {title}. " + " ".join(rng.choice(WORDS) for _ in range(40)) for page in range(pages)]
+        if kind == METADATA_DOI:
+            info["doi"] = doi
+        elif kind == TEXT_LAYER:
+            info = None
+            body[0] = f"{title}. https://doi.org/{doi} " + body[0]
+        path = str(Path(directory) / f"paper_{index:06d}.pdf")
+        make_pdf(path, body, info)
+        files.append(CorpusFile(path, doi, title, kind))
+    return files, works
@@ -0,0 +1,262 @@
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of a stand-in server
+
+    latency: seconds added to every response, plus up to `jitter` random seconds
+    rate_limit: requests per second allowed (token bucket), None for unlimited. Above
+        it the server answers 429 with Retry-After
+    error_rate: fraction of the requests answered with `error_status`
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    rate_limit: float | None = None
+    burst: int = 10
+    error_rate: float = 0.0
+    error_status: int = 503
+    seed: int = 0
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate: float = rate
+        self.capacity: float = burst
+        self.tokens: float = burst
+        self.updated: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class MockServer:
+    """ThreadingHTTPServer in a background thread with latency, rate limit and error injection.
+
+    Subclasses implement `route(method, path, query, body) -> (status, payload)`.
+    """
+
+    def __init__(self, config: MockConfig | None = None):
+        self.config: MockConfig = config or MockConfig()
+        self.random = random.Random(self.config.seed)
+        self.bucket = (
+            _TokenBucket(self.config.rate_limit, self.config.burst)
+            if self.config.rate_limit
+            else None
+        )
+        self.counts: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method: str, path: str, query: dict, body: bytes) -> tuple[int, object]:
+        raise NotImplementedError
+
+    def _count(self, status: int):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def _injected(self) -> tuple[int, dict, object] | None:
+        if self.bucket is not None and not self.bucket.take():
+            return 429, {"Retry-After": "1"}, {"message": "rate limited"}
+        with self._lock:
+            failed = self.random.random() < self.config.error_rate
+        if failed:
+            return self.config.error_status, {}, {"message": "injected error"}
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, status: int, headers: dict, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+                server._count(status)
+
+            def _handle(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                delay = server.config.latency
+                if server.config.jitter:
+                    with server._lock:
+                        delay += server.random.uniform(0, server.config.jitter)
+                if delay:
+                    time.sleep(delay)
+                injected = server._injected()
+                if injected is not None:
+                    self._respond(*injected)
+                    return
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                try:
+                    status, payload = server.route(method, unquote(parsed.path), query, body)
+                except Exception as e:
+                    status, payload = 500, {"message": f"{type(e).__name__}: {e}"}
+                self._respond(status, {}, payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        return Handler
+
+    def start(self) -> "MockServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _project(work: dict, select: str | None) -> dict:
+    if not select:
+        return work
+    fields = select.split(",")
+    return {key: value for key, value in work.items() if key in fields}
+
+
+class MockCrossref(MockServer):
+    """Crossref REST api stand-in: /works/{doi}, /works list queries (filter=doi:...,
+    query.bibliographic, select=, rows=), /members/{id} and /journals/{issn}"""
+
+    def __init__(
+        self,
+        works: list[dict],
+        members: list[dict] | None = None,
+        journals: list[dict] | None = None,
+        config: MockConfig | None = None,
+    ):
+        super().__init__(config)
+        self.works: dict[str, dict] = {work["DOI"].lower(): work for work in works}
+        self.members: dict[str, dict] = {str(member["id"]): member for member in members or []}
+        self.journals: dict[str, dict] = {}
+        for journal in journals or []:
+            for issn in journal["ISSN"]:
+                self.journals[issn.upper()] = journal
+
+    @staticmethod
+    def _message(message) -> dict:
+        return {"status": "ok", "message-type": "work", "message": message}
+
+    def _list(self, query: dict) -> dict:
+        rows = int(query.get("rows", 20))
+        if "filter" in query:
+            dois = [
+                item.removeprefix("doi:").lower()
+                for item in query["filter"].split(",")
+                if item.startswith("doi:")
+            ]
+            items = [self.works[doi] for doi in dois if doi in self.works]
+        elif "query.bibliographic" in query or "query.title" in query:
+            text = (query.get("query.bibliographic") or query.get("query.title")).lower()
+            items = sorted(
+                self.works.values(),
+                key=lambda work: SequenceMatcher(None, text, work["title"][0].lower()).ratio(),
+                reverse=True,
+            )
+        else:
+            items = list(self.works.values())
+        items = [_project(item, query.get("select")) for item in items[:rows]]
+        return {"total-results": len(items), "items": items}
+
+    def route(self, method, path, query, body):
+        parts = path.strip("/").split("/", 1)
+        if parts == ["works"]:
+            return 200, self._message(self._list(query))
+        if len(parts) != 2:
+            return 404, {"message": "not found"}
+        endpoint, identifier = parts
+        table = {"works": self.works, "members": self.members, "journals": self.journals}.get(endpoint)
+        if table is None:
+            return 404, {"message": "not found"}
+        key = identifier.upper() if endpoint == "journals" else identifier.lower()
+        if key not in table:
+            return 404, {"message": "Resource not found."}
+        return 200, self._message(table[key])
+
+
+class MockNextcloudTables(MockServer):
+    """Nextcloud Tables api stand-in: list tables, columns and rows, create rows"""
+
+    PREFIX = "/index.php/apps/tables/api/1/tables"
+
+    def __init__(
+        self,
+        column_ids: list[int],
+        table_title: str = "Publicaciones",
+        table_id: int = 1,
+        config: MockConfig | None = None,
+    ):
+        super().__init__(config)
+        self.table_title: str = table_title
+        self.table_id: int = table_id
+        self.column_ids: list[int] = column_ids
+        self.rows: list[dict] = []
+        self._rows_lock = threading.Lock()
+
+    def route(self, method, path, query, body):
+        table = f"{self.PREFIX}/{self.table_id}"
+        if method == "GET" and path == self.PREFIX:
+            return 200, [{"id": self.table_id, "title": self.table_title}]
+        if method == "GET" and path == f"{table}/columns":
+            return 200, [{"id": column_id, "title": str(column_id)} for column_id in self.column_ids]
+        if method == "GET" and path == f"{table}/rows":
+            with self._rows_lock:
+                return 200, list(self.rows)
+        if method == "POST" and path == f"{table}/rows":
+            data = json.loads(body)["data"]
+            unknown = [key for key in data if int(key) not in self.column_ids]
+            if unknown:
+                return 400, {"message": f"Unknown columns {unknown}"}
+            with self._rows_lock:
+                row = {
+                    "id": len(self.rows) + 1,
+                    "data": [{"columnId": int(key), "value": value} for key, value in data.items()],
+                }
+                self.rows.append(row)
+            return 200, row
+        return 404, {"message": "not found"}
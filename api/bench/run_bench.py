@@ -0,0 +1,215 @@
+"""End-to-end benchmark of extract_data and ExtractInfo.upload_data against local stand-in servers.
+
+    python api/bench/run_bench.py --pdfs 60 --latency 0.05 --rate-limit 50 --error-rate 0.02
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from corpus import generate_corpus
+from mock_servers import MockConfig, MockCrossref, MockNextcloudTables
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+
+@dataclass
+class BenchResult:
+    name: str
+    count: int
+    seconds: float
+    throughput: float  # items per second
+    p50: float | None
+    p99: float | None
+    failures: int
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    """
+    Nearest-rank percentile, None for no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _result(name: str, latencies: list[float], seconds: float, failures: int) -> BenchResult:
+    count = len(latencies)
+    return BenchResult(
+        name,
+        count,
+        seconds,
+        count / seconds if seconds else 0.0,
+        percentile(latencies, 0.50),
+        percentile(latencies, 0.99),
+        failures,
+    )
+
+
+@contextlib.contextmanager
+def _quiet(verbose: bool):
+    if verbose:
+        yield
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+
+def _configure_env(workdir: Path, crossref_url: str, nextcloud_url: str, max_retries: int):
+    # Read by the modules when their default instances are created or, the urls, on each request
+    os.environ.update(
+        CROSSREF_API_URL=crossref_url,
+        NEXTCLOUD_URL=nextcloud_url,
+        UH_CLOUD_ID="bench",
+        UH_CLOUD_PASSWORD="bench",
+        CROSSREF_CACHE_PATH=str(workdir / "crossref_cache.sqlite"),
+        MARKDOWN_CACHE_DIR=str(workdir / "markdown_cache"),
+        HTTP_MAX_RETRIES=str(max_retries),
+        PIPELINE_OCR_PAGES="0",
+    )
+    for name in ("CROSSREF_STORE_PATH", "CROSSREF_OFFLINE"):
+        os.environ.pop(name, None)
+    sys.path.append(str(SRC))
+
+
+def _reset(nextcloud: MockNextcloudTables):
+    from crossref_cache import get_default_cache
+
+    get_default_cache().clear()
+    with nextcloud._rows_lock:
+        nextcloud.rows.clear()
+
+
+def bench_upload_data(dois: list[str], verbose: bool) -> BenchResult:
+    from extract_metadata import _get_extract_info
+
+    extract_info = _get_extract_info()
+    latencies, failures = [], 0
+    start = time.perf_counter()
+    for doi in dois:
+        began = time.perf_counter()
+        with _quiet(verbose):
+            ok = extract_info.upload_data(doi)
+        latencies.append(time.perf_counter() - began)
+        failures += not ok
+    return _result("upload_data", latencies, time.perf_counter() - start, failures)
+
+
+def bench_upload_many(dois: list[str], workers: int, verbose: bool) -> BenchResult:
+    from extract_metadata import _get_extract_info
+
+    extract_info = _get_extract_info()
+    start = time.perf_counter()
+    with _quiet(verbose):
+        report = extract_info.upload_many(dois, workers)
+    seconds = time.perf_counter() - start
+    failures = sum(not result.ok for result in report.values())
+    # Per-item latency is not observable inside the batch
+    return BenchResult("upload_many", len(dois), seconds, len(dois) / seconds, None, None, failures)
+
+
+def bench_process_file(paths: list[str], workdir: Path, verbose: bool) -> BenchResult:
+    from extract_metadata import _get_extract_info, process_file
+    from manifest import IngestManifest
+
+    extract_info = _get_extract_info()
+    manifest = IngestManifest(str(workdir / "manifest_sequential.sqlite"))
+    latencies, failures = [], 0
+    start = time.perf_counter()
+    for path in paths:
+        began = time.perf_counter()
+        with _quiet(verbose):
+            ok = process_file(path, extract_info, manifest)
+        latencies.append(time.perf_counter() - began)
+        failures += not ok
+    return _result("extract_data (sequential, per file)", latencies, time.perf_counter() - start, failures)
+
+
+def bench_extract_data(paths: list[str], workdir: Path, verbose: bool) -> BenchResult:
+    from extract_metadata import PipelineConfig, extract_data
+    from manifest import IngestManifest
+
+    manifest = IngestManifest(str(workdir / "manifest_pipeline.sqlite"))
+    start = time.perf_counter()
+    with _quiet(verbose):
+        items = extract_data(PipelineConfig.from_env(), manifest, paths)
+    seconds = time.perf_counter() - start
+    failures = sum(1 for item in items if item.error)
+    return BenchResult("extract_data (pipeline)", len(items), seconds, len(items) / seconds, None, None, failures)
+
+
+def _print(results: list[BenchResult], servers: dict[str, MockCrossref | MockNextcloudTables]):
+    def ms(value: float | None) -> str:
+        return "-" if value is None else f"{value * 1000:.1f}"
+
+    print(f"{'scenario':40} {'items':>6} {'seconds':>8} {'items/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'failed':>6}")
+    for result in results:
+        print(
+            f"{result.name:40} {result.count:>6} {result.seconds:>8.2f} {result.throughput:>8.2f} "
+            f"{ms(result.p50):>8} {ms(result.p99):>8} {result.failures:>6}"
+        )
+    for name, server in servers.items():
+        print(f"{name} responses by status: {dict(sorted(server.counts.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdfs", type=int, default=30, help="synthetic pdfs in the corpus")
+    parser.add_argument("--uploads", type=int, default=30, help="dois for the upload benchmarks")
+    parser.add_argument("--workers", type=int, default=4, help="workers of upload_many")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per response of both servers")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--rate-limit", type=float, default=None, help="Crossref requests per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of injected 503s")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the pipeline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ocr_nodo_bench_") as tmp:
+        workdir = Path(tmp)
+        files, works = generate_corpus(str(workdir / "pdfs"), max(args.pdfs, args.uploads), args.seed)
+        template = works[0]
+        member = {"id": int(template["member"]), "primary-name": template["publisher"], "location": "United Kingdom"}
+        journal = {"ISSN": template["ISSN"], "title": template["container-title"][0], "publisher": template["publisher"]}
+
+        crossref_config = MockConfig(args.latency, args.jitter, args.rate_limit, 10, args.error_rate, seed=args.seed)
+        nextcloud_config = MockConfig(args.latency, args.jitter, None, 10, args.error_rate, seed=args.seed + 1)
+        with MockCrossref(works, [member], [journal], crossref_config) as crossref, MockNextcloudTables(
+            [], config=nextcloud_config
+        ) as nextcloud:
+            # The modules can only be imported once the env points to the stand-in servers
+            _configure_env(workdir, crossref.url, nextcloud.url, args.max_retries)
+            from columns import PUBLICATIONS_COLUMNS
+
+            nextcloud.column_ids = [spec.column_id for spec in PUBLICATIONS_COLUMNS]
+            dois = [file.doi for file in files[: args.uploads]]
+            paths = [file.path for file in files[: args.pdfs]]
+
+            results = []
+            for bench in (
+                lambda: bench_upload_data(dois, args.verbose),
+                lambda: bench_upload_many(dois, args.workers, args.verbose),
+                lambda: bench_process_file(paths, workdir, args.verbose),
+                lambda: bench_extract_data(paths, workdir, args.verbose),
+            ):
+                _reset(nextcloud)
+                results.append(bench())
+            _print(results, {"crossref": crossref, "nextcloud": nextcloud})
+
+    if args.output:
+        Path(args.output).write_text(json.dumps([asdict(result) for result in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import random
+import weakref
+from typing import Type
+
+import instructor
+import openai
+from pydantic import BaseModel, ValidationError
+
+from llm_structure import BasicResult, BooleanResult, DocumentChat, T
+from metrics import get_metrics
+
+# Per event loop, dropped with the loop (each asyncio.run creates a new one)
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_limiter(key: str, max_concurrency: int) -> asyncio.Semaphore:
+    """
+    Semaphore shared by every AsyncDocumentChat of the same server in the running event loop
+    """
+    limiters = _limiters.setdefault(asyncio.get_running_loop(), {})
+    if key not in limiters:
+        limiters[key] = asyncio.Semaphore(max_concurrency)
+    return limiters[key]
+
+
+def _retry_after(error: openai.APIStatusError) -> float | None:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncDocumentChat(DocumentChat):
+    """DocumentChat with async queries, to fan out many questions and documents at once.
+
+    Every request to the same base url goes through a shared semaphore of
+    `max_concurrency` slots, and rate limits (429), server errors and connection
+    errors are retried with exponential backoff honoring Retry-After.
+    """
+
+    def __init__(
+        self,
+        document_path: str,
+        openai_base_url: str,
+        openai_api_key: str,
+        llm_model: str,
+        system_prompt: str,
+        default_json_schema: BaseModel = BasicResult,
+        temperature: float = 0,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        **kwargs,
+    ):
+        super().__init__(
+            document_path,
+            openai_base_url,
+            openai_api_key,
+            llm_model,
+            system_prompt,
+            default_json_schema,
+            temperature,
+            **kwargs,
+        )
+        # Retries are done here so they also wait for a free slot of the limiter
+        self.async_client = openai.AsyncOpenAI(
+            base_url=openai_base_url, api_key=openai_api_key, max_retries=0
+        )
+        self.max_concurrency: int = max_concurrency
+        self.max_retries: int = max_retries
+
+    async def _ask_document(self, query: str, response_format: dict):
+        key, cached = self._cached_response(query, response_format)
+        if cached is not None:
+            return cached
+        attempt = 0
+        while True:
+            try:
+                async with get_limiter(self.openai_base_url, self.max_concurrency):
+                    with get_metrics().span("llm_query", model=self.llm_model) as span:
+                        chat_completion = await self.async_client.chat.completions.create(
+                            model=self.llm_model,
+                            response_format=response_format,
+                            messages=self._messages(query, response_format),
+                            temperature=self.temperature,
+                            **self._completion_kwargs(),
+                        )
+                        span.fields.update(self._record_usage(chat_completion))
+                content = chat_completion.choices[0].message.content
+                self._store_response(key, content)
+                return content
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                get_metrics().inc("llm_retries", model=self.llm_model, reason=type(e).__name__)
+                delay = None
+                if isinstance(e, openai.APIStatusError):
+                    delay = _retry_after(e)
+                if delay is None:
+                    delay = min(60, 0.5 * 2**attempt) * random.uniform(1, 1.5)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def ask_with_gbnf_grammar(self, query: str, grammar: str):
+        response_format = {"type": "grammar", "grammar": grammar}
+        return await self._ask_document(query, response_format)
+
+    async def ask_with_json_format(self, query: str, jsonSchema: Type[T]) -> T:
+        if not issubclass(jsonSchema, BaseModel):
+            raise Exception(
+                f"jsonSchema must be subclass of BaseModel pydantic object not {type(jsonSchema)}"
+            )
+        response = await self._ask_document(
+            query,
+            {
+                "type": "json_object",
+                "schema": jsonSchema.model_json_schema(),
+            },
+        )
+        return jsonSchema.model_validate_json(response)
+
+    async def ask_document(self, query: str) -> str:
+        temp = await self.ask_with_json_format(query, self.default_json_schema)
+        return temp.result
+
+    async def boolean_ask_document(self, query: str) -> bool:
+        temp = await self.ask_with_json_format(query, BooleanResult)
+        return temp.result
+
+    async def ask_batch(self, questions: list[tuple[str, Type[BaseModel]]]) -> list[BaseModel]:
+        """
+        Ask the first query of each schema before the rest so the server caches the shared
+        prefix, then the remaining ones concurrently. The answers keep the input order
+        """
+        answers = [None] * len(questions)
+        first_of_schema: dict[str, int] = {}
+        for index, (_, jsonSchema) in enumerate(questions):
+            first_of_schema.setdefault(json.dumps(jsonSchema.model_json_schema(), sort_keys=True), index)
+
+        async def ask(index: int):
+            query, jsonSchema = questions[index]
+            answers[index] = await self.ask_with_json_format(query, jsonSchema)
+
+        await asyncio.gather(*(ask(index) for index in first_of_schema.values()))
+        warmed = set(first_of_schema.values())
+        await asyncio.gather(*(ask(index) for index in range(len(questions)) if index not in warmed))
+        return answers
+
+    async def ask_many(self, queries: list[str]) -> list[str]:
+        """
+        Ask all the queries at once, the answers are in the same order
+        """
+        return await asyncio.gather(*(self.ask_document(query) for query in queries))
+
+    async def extract_record(
+        self, jsonSchema: Type[T], fields_per_call: int | None = None
+    ) -> T:
+        """
+        Same as DocumentChat.extract_record but the groups and the re-asks run concurrently
+        """
+        groups = self._record_groups(jsonSchema, fields_per_call)
+        responses = await asyncio.gather(
+            *(
+                self._ask_document(
+                    self._record_query(jsonSchema, group),
+                    {"type": "json_object", "schema": group_schema.model_json_schema()},
+                )
+                for group, group_schema in groups
+            )
+        )
+        data: dict = {}
+        for (group, _), response in zip(groups, responses):
+            self._merge_answer(data, group, response)
+
+        failed = self._failed_fields(jsonSchema, data)
+        if not failed:
+            return jsonSchema.model_validate(data)
+
+        async def ask_again(name: str):
+            try:
+                answer = await self.ask_with_json_format(
+                    self._record_query(jsonSchema, [name]),
+                    self._single_field_schema(jsonSchema, name),
+                )
+                data[name] = answer.result
+            except ValidationError:
+                data.pop(name, None)
+
+        await asyncio.gather(*(ask_again(name) for name in failed))
+        return jsonSchema.model_validate(data)
+
+
+class AsyncDocumentChatOllama(AsyncDocumentChat):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_client = instructor.from_openai(
+            self.async_client,
+            mode=instructor.Mode.JSON,
+        )
+
+
+async def ask_documents(chats: list[AsyncDocumentChat], queries: list[str]) -> list[list[str]]:
+    """
+    Ask the same queries to many documents at once, one list of answers per chat
+    """
+    return await asyncio.gather(*(chat.ask_many(queries) for chat in chats))
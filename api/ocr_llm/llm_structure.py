@@ -1,9 +1,23 @@
 from markitdown import MarkItDown
 import openai
 import instructor
-from pydantic import BaseModel
+import json
+import sys
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from pydantic import BaseModel, ValidationError, create_model
 from typing import Type, TypeVar, List
 
+# Shared infrastructure (caches) lives with the ingest code in api/src
+sys.path.append(str(Path(__file__).resolve().parent.parent / "src"))
+from manifest import file_hash
+from markdown_cache import get_default_markdown_cache
+from metrics import get_metrics
+from utils import pdf_pages_text
+from response_cache import ResponseCache, get_default_response_cache, response_key
+from retrieval import DocumentRetriever
+
 
 class BasicResult(BaseModel):
     result: str
@@ -12,34 +26,194 @@ class BooleanResult(BaseModel):
     result:bool
 
 def file_to_markdown_str(
-    file_path: str, openai_client: openai.OpenAI = None, llm_model: str = None
+    file_path: str,
+    openai_client: openai.OpenAI = None,
+    llm_model: str = None,
+    max_pages: int | None = None,
+    max_chars: int | None = None,
+    sha256: str | None = None,
 ) -> str:
+    """Markdown of the document, converted once per file content (markdown cache)
+
+    Args:
+        max_pages (int, optional): at most the first max_pages pages
+        max_chars (int, optional): at most this many characters, read only that far from the cache
+        sha256 (str, optional): file_hash of the file if already known, so it is not read again
+
+    With a cap, pdfs are converted from their text layer streamed page by page (stopping
+    at the caps) instead of whole by MarkItDown.
+    """
+    capped = max_pages is not None or max_chars is not None
+    if capped and file_path.lower().endswith(".pdf") and openai_client is None:
+        # Only the caps given apply, not the PDF_MAX_TEXT_* defaults of the ingest
+        pages = sys.maxsize if max_pages is None else max_pages
+        chars = sys.maxsize if max_chars is None else max_chars
+        return get_default_markdown_cache().get_or_convert(
+            file_path,
+            lambda path: pdf_pages_text(path, pages, chars),
+            f"pages-{max_pages}-{max_chars}",
+            max_chars,
+            sha256,
+        )
     if openai_client is None or llm_model is None:
         md = MarkItDown(enable_plugins=False)  # Set to True to enable plugins
+        variant = "plain"
     else:
         md = MarkItDown(llm_client=openai_client, llm_model=llm_model)
+        variant = f"llm-{llm_model}"
 
-    result = md.convert(file_path)
-    return str(result)
+    def convert(path: str) -> str:
+        return str(md.convert(path))
+
+    return get_default_markdown_cache().get_or_convert(file_path, convert, variant, max_chars, sha256)
 
 
 T = TypeVar("T", bound=BaseModel)
 
 
+@dataclass
+class PromptUsage:
+    """Tokens reported by the server, cached_prompt_tokens are the ones served from its prompt cache"""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def uncached_prompt_tokens(self) -> int:
+        return self.prompt_tokens - self.cached_prompt_tokens
+
+    @property
+    def cache_ratio(self) -> float:
+        return self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+def _cached_tokens(chat_completion) -> int:
+    usage = getattr(chat_completion, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None)
+    if cached is None:
+        # llama.cpp server reports the reused KV cache in its timings
+        timings = getattr(chat_completion, "timings", None) or {}
+        cached = timings.get("cache_n") if isinstance(timings, dict) else None
+    return cached or 0
+
+
 class DocumentChat:
-    def _ask_document(self,query:str,response_format:dict):
-        chat_completion = self.api_client.chat.completions.create(
-            model=self.llm_model,
-            response_format=response_format,
-            messages=[
-                {"role": "system", "content": f"{self.system_prompt}"},
-                {"role": "system", "content": self.file_context},
-                {"role": "user", "content": f"{query} /n  remember the json format {str(response_format)} /n the json:"},
-            ],
-            temperature=self.temperature
-            
+    @property
+    def file_context(self) -> str:
+        """
+        Markdown of the document, read back from the markdown cache if it is not kept in memory
+        """
+        if self._file_context is not None:
+            return self._file_context
+        # With the hash of __init__, not re-reading the whole file on every query
+        return file_to_markdown_str(
+            self.original_path,
+            max_pages=self.max_context_pages,
+            max_chars=self.max_context_chars,
+            sha256=self.document_hash,
         )
-        return  chat_completion.choices[0].message.content
+
+    def _context_for(self, query: str) -> str:
+        """
+        The whole document, or only the chunks relevant to the query in retrieval mode
+        """
+        if self.retriever is None or self.stable_prefix:
+            return self.file_context
+        return self.retriever.context(query, self.retrieval_top_k, self.context_token_budget)
+
+    def _messages(self, query: str, response_format: dict) -> list[dict]:
+        if self.stable_prefix:
+            # The schema goes before the query so queries sharing a schema share a longer prefix
+            user = f"remember the json format {str(response_format)} /n {query} /n the json:"
+        else:
+            user = f"{query} /n  remember the json format {str(response_format)} /n the json:"
+        return [
+            {"role": "system", "content": f"{self.system_prompt}"},
+            {"role": "system", "content": self._context_for(query)},
+            {"role": "user", "content": user},
+        ]
+
+    def _completion_kwargs(self) -> dict:
+        if not self.stable_prefix:
+            return {}
+        # Ask llama.cpp servers to reuse the KV cache of the common prefix
+        return {"extra_body": {"cache_prompt": True}}
+
+    def _record_usage(self, chat_completion) -> dict:
+        """
+        Add the token usage of the completion to self.usage and the metrics, and return it
+        """
+        usage = getattr(chat_completion, "usage", None)
+        if usage is None:
+            return {}
+        tokens = {
+            "prompt_tokens": usage.prompt_tokens or 0,
+            "completion_tokens": usage.completion_tokens or 0,
+            "cached_prompt_tokens": _cached_tokens(chat_completion),
+        }
+        with self._usage_lock:
+            self.usage.calls += 1
+            self.usage.prompt_tokens += tokens["prompt_tokens"]
+            self.usage.completion_tokens += tokens["completion_tokens"]
+            self.usage.cached_prompt_tokens += tokens["cached_prompt_tokens"]
+        metrics = get_metrics()
+        for name, value in tokens.items():
+            metrics.inc(f"llm_{name}", value, model=self.llm_model)
+        return tokens
+
+    def _cache_key(self, query: str, response_format: dict) -> str:
+        return response_key(
+            self.document_hash,
+            self.openai_base_url,
+            self.llm_model,
+            self.system_prompt,
+            query,
+            response_format,
+            self.temperature,
+            self.retrieval_top_k,
+            self.context_token_budget,
+            self.embedding_model,
+            self.stable_prefix,
+            self.max_context_chars,
+            self.max_context_pages,
+        )
+
+    def _cached_response(self, query: str, response_format: dict) -> tuple[str, str | None]:
+        """
+        The cache key of the query and the stored answer, None if missing or use_cache is False
+        """
+        key = self._cache_key(query, response_format)
+        if self.response_cache is None or not self.use_cache:
+            return key, None
+        cached = self.response_cache.get(key)
+        outcome = "llm_cache_hits" if cached is not None else "llm_cache_misses"
+        get_metrics().inc(outcome, model=self.llm_model)
+        return key, cached
+
+    def _store_response(self, key: str, content: str | None):
+        # Written even when use_cache is False so a bypassed query refreshes the entry
+        if self.response_cache is not None and content is not None:
+            self.response_cache.set(key, content)
+
+    def _ask_document(self,query:str,response_format:dict):
+        key, cached = self._cached_response(query, response_format)
+        if cached is not None:
+            return cached
+        with get_metrics().span("llm_query", model=self.llm_model) as span:
+            chat_completion = self.api_client.chat.completions.create(
+                model=self.llm_model,
+                response_format=response_format,
+                messages=self._messages(query, response_format),
+                temperature=self.temperature,
+                **self._completion_kwargs(),
+            )
+            span.fields.update(self._record_usage(chat_completion))
+        content = chat_completion.choices[0].message.content
+        self._store_response(key, content)
+        return content
     def ask_with_gbnf_grammar(self,query:str, grammar:str):
         
         #TODO: Comprobar que la gramatica es gbnf
@@ -75,6 +249,113 @@ class DocumentChat:
         )
 
     
+    def _record_query(self, jsonSchema: Type[BaseModel], fields: list[str]) -> str:
+        lines = [
+            f"- {name}: {jsonSchema.model_fields[name].description or name}"
+            for name in fields
+        ]
+        return "Extract the following fields of the document:\n" + "\n".join(lines)
+
+    @staticmethod
+    def _record_groups(
+        jsonSchema: Type[BaseModel], fields_per_call: int | None
+    ) -> list[tuple[list[str], Type[BaseModel]]]:
+        """
+        Split the fields in groups of fields_per_call, each one with a model of only those fields
+        """
+        names = list(jsonSchema.model_fields)
+        size = fields_per_call or len(names)
+        groups = []
+        for start in range(0, len(names), size):
+            group = names[start : start + size]
+            group_schema = jsonSchema
+            if len(group) < len(names):
+                group_schema = create_model(
+                    f"{jsonSchema.__name__}Part",
+                    **{name: (jsonSchema.model_fields[name].annotation, jsonSchema.model_fields[name]) for name in group},
+                )
+            groups.append((group, group_schema))
+        return groups
+
+    @staticmethod
+    def _merge_answer(data: dict, group: list[str], response: str):
+        try:
+            answer = json.loads(response)
+        except (json.JSONDecodeError, TypeError):
+            return
+        if isinstance(answer, dict):
+            data.update({name: answer[name] for name in group if name in answer})
+
+    @staticmethod
+    def _failed_fields(jsonSchema: Type[BaseModel], data: dict) -> list[str]:
+        try:
+            jsonSchema.model_validate(data)
+            return []
+        except ValidationError as e:
+            failed = {error["loc"][0] for error in e.errors() if error["loc"]}
+            return [name for name in jsonSchema.model_fields if name in failed]
+
+    @staticmethod
+    def _single_field_schema(jsonSchema: Type[BaseModel], name: str) -> Type[BaseModel]:
+        field = jsonSchema.model_fields[name]
+        return create_model(f"{jsonSchema.__name__}_{name}", result=(field.annotation, field))
+
+    def extract_record(
+        self, jsonSchema: Type[T], fields_per_call: int | None = None
+    ) -> T:
+        """
+        Fill every field of the schema in one call (or one call per group of fields_per_call
+        fields), then ask again one by one only for the fields that fail validation
+
+        Args:
+            jsonSchema (BaseModel): pydantic model with all the fields, their descriptions
+                are used as the questions
+            fields_per_call (int, optional): split long schemas in several calls
+
+        Raises:
+            ValidationError: if the record is still invalid after the re-asks
+
+        Returns:
+            BaseModel: _description_
+        """
+        data: dict = {}
+        for group, group_schema in self._record_groups(jsonSchema, fields_per_call):
+            response = self._ask_document(
+                self._record_query(jsonSchema, group),
+                {"type": "json_object", "schema": group_schema.model_json_schema()},
+            )
+            self._merge_answer(data, group, response)
+
+        failed = self._failed_fields(jsonSchema, data)
+        if not failed:
+            return jsonSchema.model_validate(data)
+
+        # Fallback: ask only for the invalid or missing fields
+        for name in failed:
+            try:
+                data[name] = self.ask_with_json_format(
+                    self._record_query(jsonSchema, [name]),
+                    self._single_field_schema(jsonSchema, name),
+                ).result
+            except ValidationError:
+                data.pop(name, None)
+        return jsonSchema.model_validate(data)
+
+    def ask_batch(self, questions: list[tuple[str, Type[BaseModel]]]) -> list[BaseModel]:
+        """
+        Ask many (query, schema) pairs sending the ones that share a schema one after the
+        other, so the server can reuse the cached prefix. The answers keep the input order
+        """
+        order = sorted(
+            range(len(questions)),
+            key=lambda index: json.dumps(questions[index][1].model_json_schema(), sort_keys=True),
+        )
+        answers = [None] * len(questions)
+        for index in order:
+            query, jsonSchema = questions[index]
+            answers[index] = self.ask_with_json_format(query, jsonSchema)
+        return answers
+
     def ask_document(self, query: str)->str:
         temp = self.ask_with_json_format(query, self.default_json_schema)
         return temp.result
@@ -91,10 +372,48 @@ class DocumentChat:
         llm_model: str,
         system_prompt: str,
         default_json_schema: BaseModel = BasicResult,
-        temperature:float=0
+        temperature:float=0,
+        retrieval_top_k: int | None = None,
+        context_token_budget: int = 2000,
+        embedding_model: str | None = None,
+        response_cache: ResponseCache | None = None,
+        use_cache: bool = True,
+        stable_prefix: bool = False,
+        keep_context: bool = True,
+        max_context_chars: int | None = None,
+        max_context_pages: int | None = None,
     ):
+        """
+        Args:
+            retrieval_top_k (int, optional): if given only the top k chunks of the document
+                relevant to each query are sent (BM25, fused with embeddings if
+                embedding_model is given) instead of the whole document
+            context_token_budget (int, optional): max tokens of document chunks per query
+            embedding_model (str, optional): embeddings model served by the same api
+            response_cache (ResponseCache, optional): store of the answers, by default the
+                one at LLM_CACHE_PATH
+            use_cache (bool, optional): False to always ask the model (answers are still stored)
+            stable_prefix (bool, optional): keep the system prompt and the whole document as a
+                byte-identical prefix of every query (overrides retrieval) so servers with
+                prompt / KV cache reuse only prefill the document once. See `usage`
+            keep_context (bool, optional): False to not hold the markdown of the document for
+                the life of the chat, its (capped) prefix is read from the markdown cache when
+                a query needs it. For many big documents open at once
+            max_context_chars (int, optional): use at most this many characters of the document
+            max_context_pages (int, optional): build the context of a pdf from the text of its
+                first pages only, page by page, instead of converting the whole document
+        """
         self.original_path: str = document_path
-        self.file_context: str = file_to_markdown_str(document_path)
+        self.document_hash: str = file_hash(document_path)
+        self.max_context_chars: int | None = max_context_chars
+        self.max_context_pages: int | None = max_context_pages
+        file_context = file_to_markdown_str(
+            document_path,
+            max_pages=max_context_pages,
+            max_chars=max_context_chars,
+            sha256=self.document_hash,
+        )
+        self._file_context: str | None = file_context if keep_context else None
         self.api_client: openai.OpenAI = openai.OpenAI(
             base_url=openai_base_url, api_key=openai_api_key
         )
@@ -102,6 +421,23 @@ class DocumentChat:
         self.llm_model: str = llm_model
         self.default_json_schema: BaseModel = default_json_schema
         self.temperature:float=temperature
+        # Two servers may serve different models under the same name
+        self.openai_base_url: str = openai_base_url
+        self.retrieval_top_k: int | None = retrieval_top_k
+        self.embedding_model: str | None = embedding_model
+        self.context_token_budget: int = context_token_budget
+        self.retriever: DocumentRetriever | None = None
+        if retrieval_top_k is not None:
+            self.retriever = DocumentRetriever(
+                file_context,
+                api_client=self.api_client if embedding_model else None,
+                embedding_model=embedding_model,
+            )
+        self.response_cache: ResponseCache = response_cache or get_default_response_cache()
+        self.use_cache: bool = use_cache
+        self.stable_prefix: bool = stable_prefix
+        self.usage: PromptUsage = PromptUsage()
+        self._usage_lock = threading.Lock()
         
         
 
@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+from typing import Literal
+from pydantic import BaseModel, Field
 from llm_structure import DocumentChat
 
 
@@ -17,6 +19,9 @@ chat = DocumentChat(
     os.environ.get("FIREWORKS_API"),
     "accounts/fireworks/models/llama-v3p1-8b-instruct",
     system_prompt,
+    # Everything asked is in the first pages, a long thesis is not sent (or converted) whole
+    max_context_pages=int(os.environ.get("LLM_MAX_CONTEXT_PAGES", 10)),
+    max_context_chars=int(os.environ.get("LLM_MAX_CONTEXT_CHARS", 60000)),
 )
 
 
@@ -27,68 +32,46 @@ query = chat.ask_document
 
 query_boolean = chat.boolean_ask_document
 
-is_in_english=query_boolean("The document is in English?")
-
-# ## Titulo del documento
-
-
-title = query("Give me the title of the document")
-
-
-# ## Autores
-
-
-authors = query("Dime los nombres de los autores?")
-
-
-# ## Decir si es un articulo o una publicacion
-
-
-def query_grammar(query, prepositions: list[str]):
-    root_grammar = f"""
-    root ::= response
-    response ::= {' | '.join(f'"{item}"' for item in prepositions)}
-    """
-    return chat.ask_with_gbnf_grammar(query, root_grammar)
-
-
-query_grammar(
-    "Es documento es un articulo cientifico o es un libro?", ["Libro", "Articulo"]
-)
-
-
-year = query("En que año se publico el articulo?")
-
-
-editor = query("Cual es el nombre de la editorial?")
-
-
-country = query("Cual es el pais de publicacion?")
-
-
-publish_url = query("Cual es la url de publicación?")
-
-
-author_ocid = query("Cual es el orcid de cada autor?")
-
-
-document_doi = query("Cual es el doi del documento?")
-
-
-is_paper = query("Cual es el tipo de medio de divulgación?")
 
+class PaperRecord(BaseModel):
+    is_in_english: bool = Field(description="The document is in English?")
+    title: str = Field(description="Give me the title of the document")
+    authors: str = Field(description="Dime los nombres de los autores?")
+    document_type: Literal["Libro", "Articulo"] = Field(
+        description="Es documento es un articulo cientifico o es un libro?"
+    )
+    year: int = Field(description="En que año se publico el articulo?")
+    editor: str = Field(description="Cual es el nombre de la editorial?")
+    country: str = Field(description="Cual es el pais de publicacion?")
+    publish_url: str = Field(description="Cual es la url de publicación?")
+    author_ocid: str = Field(description="Cual es el orcid de cada autor?")
+    document_doi: str = Field(description="Cual es el doi del documento?")
+    is_paper: str = Field(description="Cual es el tipo de medio de divulgación?")
+    location_in_uh: str = Field(description="Desde que area se reporta?")
+    is_from_a_proyect: bool = Field(
+        description="El documento tributa a algun proyecto de ciencia o investigación? no vale la revista tipo"
+    )
+    proyects_name: str | None = Field(
+        None,
+        description="Cual es el proyecto de ciencia e investigacion al que tributa? No vale la revista tipo ",
+    )
 
-location_in_uh = query("Desde que area se reporta?")
 
+# Todos los campos en una sola consulta, solo se repreguntan los que no validan
+record = chat.extract_record(PaperRecord)
 
-is_from_a_proyect = query_boolean(
-    "El documento tributa a algun proyecto de ciencia o investigación? no vale la revista tipo"
-)
+is_in_english = record.is_in_english
+title = record.title
+authors = record.authors
+year = record.year
+editor = record.editor
+country = record.country
+publish_url = record.publish_url
+author_ocid = record.author_ocid
+document_doi = record.document_doi
+is_paper = record.is_paper
+location_in_uh = record.location_in_uh
+is_from_a_proyect = record.is_from_a_proyect
 
 if is_from_a_proyect:
-    proyects_name = query(
-        "Cual es el proyecto de ciencia e investigacion al que tributa? No vale la revista tipo "
-    )
-
-
-
+    proyects_name = record.proyects_name
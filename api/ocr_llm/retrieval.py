@@ -0,0 +1,152 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+import openai
+
+HEADING = re.compile(r"^#{1,6}\s", re.MULTILINE)
+WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for English and Spanish text
+    return len(text) // 4 + 1
+
+
+def tokenize(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return WORD.findall(text)
+
+
+def split_markdown(text: str, max_chars: int = 2000) -> list[str]:
+    """Split a Markdown document in chunks of at most max_chars
+
+    Sections (headings) are kept together when they fit, otherwise they are split
+    by paragraphs and, as a last resort, by characters.
+    """
+    starts = [match.start() for match in HEADING.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+
+    chunks = []
+    for section in sections:
+        current = ""
+        for paragraph in re.split(r"\n\s*\n", section):
+            while len(paragraph) > max_chars:
+                chunks.append(paragraph[:max_chars])
+                paragraph = paragraph[max_chars:]
+            if current and len(current) + len(paragraph) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current:
+            chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+class BM25Index:
+    def __init__(self, chunks: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1: float = k1
+        self.b: float = b
+        self.term_frequencies: list[Counter] = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths: list[int] = [sum(tf.values()) for tf in self.term_frequencies]
+        self.average_length: float = sum(self.lengths) / max(1, len(chunks))
+        document_frequency = Counter()
+        for tf in self.term_frequencies:
+            document_frequency.update(tf.keys())
+        total = len(chunks)
+        self.idf: dict[str, float] = {
+            term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for term, count in document_frequency.items()
+        }
+
+    def scores(self, query: str) -> list[float]:
+        terms = [term for term in tokenize(query) if term in self.idf]
+        scores = []
+        for tf, length in zip(self.term_frequencies, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            scores.append(
+                sum(
+                    self.idf[term] * tf[term] * (self.k1 + 1) / (tf[term] + norm)
+                    for term in terms
+                    if term in tf
+                )
+            )
+        return scores
+
+
+class EmbeddingIndex:
+    """Cosine similarity over the embeddings of the chunks, computed once per document"""
+
+    def __init__(self, chunks: list[str], api_client: openai.OpenAI, embedding_model: str):
+        self.api_client: openai.OpenAI = api_client
+        self.embedding_model: str = embedding_model
+        self.vectors: list[list[float]] = self._embed(chunks) if chunks else []
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        response = self.api_client.embeddings.create(model=self.embedding_model, input=texts)
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return [self._normalize(vector) for vector in vectors]
+
+    @staticmethod
+    def _normalize(vector: list[float]) -> list[float]:
+        norm = math.sqrt(sum(value * value for value in vector)) or 1
+        return [value / norm for value in vector]
+
+    def scores(self, query: str) -> list[float]:
+        (query_vector,) = self._embed([query])
+        return [
+            sum(a * b for a, b in zip(query_vector, vector)) for vector in self.vectors
+        ]
+
+
+def _ranking(scores: list[float]) -> list[int]:
+    return sorted(range(len(scores)), key=lambda index: scores[index], reverse=True)
+
+
+class DocumentRetriever:
+    """Select the chunks of a document most relevant to a query.
+
+    Uses BM25 and, if an embedding model is given, fuses both rankings with
+    reciprocal rank fusion.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        chunk_chars: int = 2000,
+        api_client: openai.OpenAI | None = None,
+        embedding_model: str | None = None,
+    ):
+        self.chunks: list[str] = split_markdown(text, chunk_chars)
+        self.bm25 = BM25Index(self.chunks)
+        self.embeddings: EmbeddingIndex | None = None
+        if api_client is not None and embedding_model is not None:
+            self.embeddings = EmbeddingIndex(self.chunks, api_client, embedding_model)
+
+    def rank(self, query: str) -> list[int]:
+        rankings = [_ranking(self.bm25.scores(query))]
+        if self.embeddings is not None:
+            rankings.append(_ranking(self.embeddings.scores(query)))
+        fused = Counter()
+        for ranking in rankings:
+            for position, index in enumerate(ranking):
+                fused[index] += 1 / (60 + position)
+        return [index for index, _ in fused.most_common()]
+
+    def context(self, query: str, top_k: int = 4, token_budget: int = 2000) -> str:
+        """
+        The top_k chunks for the query that fit in token_budget, in document order
+        """
+        selected = []
+        used = 0
+        for index in self.rank(query)[:top_k]:
+            tokens = estimate_tokens(self.chunks[index])
+            if selected and used + tokens > token_budget:
+                continue
+            selected.append(index)
+            used += tokens
+        return "\n\n".join(self.chunks[index] for index in sorted(selected))
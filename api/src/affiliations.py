@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from crossref_store import normalize_text
+from work_model import Author, CrossrefWork
+
+# Ways Crossref records write the university and the centers that only exist in it
+DEFAULT_ALIASES = (
+    "Universidad de La Habana",
+    "Universidad Habana",
+    "Univ. de La Habana",
+    "University of Havana",
+    "University of La Habana",
+    "Havana University",
+    "Univ. Havana",
+    "UH",
+    "UHavana",
+    "MATCOM",
+    "IMRE",
+    "Instituto de Ciencia y Tecnología de Materiales",
+)
+
+# The other universities of the city, their names contain "Universidad ... de La Habana" too
+EXCLUDED_AFFILIATIONS = (
+    "CUJAE",
+    "Universidad Tecnológica de La Habana",
+    "Technological University of Havana",
+    "Instituto Superior Politécnico José Antonio Echeverría",
+    "UCM Habana",
+    "Universidad de Ciencias Médicas de La Habana",
+    "Medical University of Havana",
+    "Havana University of Medical Sciences",
+    "UNAH",
+    "Universidad Agraria de La Habana",
+    "Agrarian University of Havana",
+)
+
+# Short aliases ("UH", "IMRE") also name other institutions, they only count next to one of these
+CONTEXT_TOKENS = frozenset({"habana", "havana", "cuba"})
+
+# An affiliation lists its parts (department, institution, city) separated by these
+SEGMENT_SEPARATORS = re.compile(r"[,;()\[\]|/\n]")
+
+SHORT_ALIAS_LENGTH = 4
+
+
+@dataclass
+class AuthorClasses:
+    internal: list[Author]
+    external: list[Author]
+    first_is_internal: bool
+
+
+class AffiliationMatcher:
+    """Decide if an affiliation belongs to the university.
+
+    Aliases are normalized (case, accents and punctuation) and indexed by their first
+    token. An alias must be a whole part of the affiliation (the text between commas,
+    maybe followed by a postal code or the city), so "Medical University of Havana"
+    is not "University of Havana". Parts naming one of the excluded institutions
+    never match. ROR ids, when Crossref has them, match directly. The decisions of the
+    last affiliation strings and the classification of the last works are cached, the
+    latter for the other columns of the row.
+    """
+
+    def __init__(
+        self,
+        aliases: tuple[str, ...] = DEFAULT_ALIASES,
+        ror_ids: tuple[str, ...] = (),
+        context_tokens: frozenset[str] = CONTEXT_TOKENS,
+        max_works: int = 1024,
+        excluded: tuple[str, ...] = EXCLUDED_AFFILIATIONS,
+        max_names: int = 8192,
+    ):
+        self.index: dict[str, list[tuple[str, ...]]] = _token_index(aliases)
+        self.excluded: dict[str, list[tuple[str, ...]]] = _token_index(excluded)
+        self.ror_ids: frozenset[str] = frozenset(_ror_key(ror_id) for ror_id in ror_ids)
+        self.context_tokens: frozenset[str] = context_tokens
+        self.max_works: int = max_works
+        self.max_names: int = max_names
+        self._names: OrderedDict[str, bool] = OrderedDict()
+        self._works: OrderedDict[str, AuthorClasses] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_address(self, tokens: list[str]) -> bool:
+        # What may follow the institution in the same part: "10400", "La Habana", "Cuba"
+        return all(token.isdigit() or token in self.context_tokens or token == "la" for token in tokens)
+
+    def _match_segment(self, tokens: list[str], has_context: bool) -> bool:
+        if _find_run(tokens, self.excluded):
+            return False
+        for alias in self.index.get(tokens[0], ()):
+            if tuple(tokens[: len(alias)]) != alias or not self._is_address(tokens[len(alias) :]):
+                continue
+            short = len(alias) == 1 and len(alias[0]) <= SHORT_ALIAS_LENGTH
+            if not short or has_context:
+                return True
+        return False
+
+    def _match_name(self, name: str) -> bool:
+        segments = [normalize_text(part).split() for part in SEGMENT_SEPARATORS.split(name)]
+        segments = [tokens for tokens in segments if tokens]
+        has_context = any(not self.context_tokens.isdisjoint(tokens) for tokens in segments)
+        return any(self._match_segment(tokens, has_context) for tokens in segments)
+
+    def is_internal_affiliation(self, name: str) -> bool:
+        with self._lock:
+            value = self._names.get(name)
+            if value is not None:
+                self._names.move_to_end(name)
+                return value
+        value = self._match_name(name)
+        with self._lock:
+            self._names[name] = value
+            if len(self._names) > self.max_names:
+                self._names.popitem(last=False)
+        return value
+
+    def is_internal(self, author: Author) -> bool:
+        if self.ror_ids and any(_ror_key(ror) in self.ror_ids for ror in author.affiliation_ids):
+            return True
+        return any(self.is_internal_affiliation(name) for name in author.affiliations)
+
+    def classify(self, work: CrossrefWork) -> AuthorClasses:
+        """
+        Internal and external authors of the work (in order) and whether the first author is internal
+        """
+        with self._lock:
+            classes = self._works.get(work.doi)
+            if classes is not None:
+                self._works.move_to_end(work.doi)
+                return classes
+        internal, external = [], []
+        first_is_internal = None
+        for author in work.authors:
+            is_internal = self.is_internal(author)
+            (internal if is_internal else external).append(author)
+            if author.sequence == "first" and first_is_internal is None:
+                first_is_internal = is_internal
+        classes = AuthorClasses(internal, external, bool(first_is_internal))
+        with self._lock:
+            self._works[work.doi] = classes
+            if len(self._works) > self.max_works:
+                self._works.popitem(last=False)
+        return classes
+
+
+def _token_index(names: tuple[str, ...]) -> dict[str, list[tuple[str, ...]]]:
+    index: dict[str, list[tuple[str, ...]]] = {}
+    for name in names:
+        tokens = tuple(normalize_text(name).split())
+        if tokens and tokens not in index.get(tokens[0], []):
+            index.setdefault(tokens[0], []).append(tokens)
+    return index
+
+
+def _find_run(tokens: list[str], index: dict[str, list[tuple[str, ...]]]) -> bool:
+    """
+    True if one of the indexed names is a run of consecutive tokens
+    """
+    for start, token in enumerate(tokens):
+        for name in index.get(token, ()):
+            if tuple(tokens[start : start + len(name)]) == name:
+                return True
+    return False
+
+
+def _ror_key(ror_id: str) -> str:
+    return ror_id.strip().lower().removeprefix("https://ror.org/").removeprefix("http://ror.org/")
+
+
+_default_matcher: AffiliationMatcher | None = None
+_default_matcher_lock = threading.Lock()
+
+
+def get_default_affiliation_matcher() -> AffiliationMatcher:
+    """
+    Shared matcher, AFFILIATION_ALIASES (";" separated) are added to the default aliases
+    and AFFILIATION_ROR_IDS ("," separated) enable the ROR match
+    """
+    global _default_matcher
+    with _default_matcher_lock:
+        if _default_matcher is None:
+            extra = os.environ.get("AFFILIATION_ALIASES", "")
+            ror_ids = os.environ.get("AFFILIATION_ROR_IDS", "")
+            _default_matcher = AffiliationMatcher(
+                DEFAULT_ALIASES + tuple(alias for alias in extra.split(";") if alias.strip()),
+                tuple(ror_id for ror_id in ror_ids.split(",") if ror_id.strip()),
+            )
+    return _default_matcher
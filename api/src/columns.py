@@ -0,0 +1,121 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable
+
+from work_model import CrossrefWork
+
+if TYPE_CHECKING:
+    from extract_info import ExtractInfo
+
+# (extract_info, parsed work, doi url) -> value of the cell
+Extractor = Callable[["ExtractInfo", CrossrefWork, str], Any]
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    column_id: int
+    name: str
+    extract: Extractor
+
+
+def constant(value) -> Extractor:
+    return lambda info, work, doi: value
+
+
+def _authors(authors) -> str:
+    temp: str = ""
+    for author in authors:
+        temp += f"{author.family} {author.given[:1]}, "
+    return temp
+
+
+def title(info, work: CrossrefWork, doi: str) -> str:
+    return work.title
+
+
+def external_authors(info, work: CrossrefWork, doi: str) -> str:
+    return _authors(info.affiliation_matcher.classify(work).external)
+
+
+def internal_authors(info, work: CrossrefWork, doi: str) -> str:
+    return _authors(info.affiliation_matcher.classify(work).internal)
+
+
+def editorial(info, work: CrossrefWork, doi: str) -> str:
+    return info.editorial_name(work.issns[0])
+
+
+def issns(info, work: CrossrefWork, doi: str) -> str:
+    return f"{work.issn_of_type('electronic')}, {work.issn_of_type('print')}"
+
+
+def country(info, work: CrossrefWork, doi: str) -> str:
+    return info.publisher_country(work.member)
+
+
+def url(info, work: CrossrefWork, doi: str) -> str:
+    # Same (unclosed) link object the table already has, manifest.seed_from_table parses it
+    return '{"title":"' + doi + '","subline":"URL","providerId":url,"value":"' + doi + '"'
+
+
+def funders(info, work: CrossrefWork, doi: str) -> str:
+    temp = ""
+    for funder in work.funders:
+        awards = list(funder.awards) if funder.awards is not None else ""
+        temp += f"{funder.name}, {awards}, \n"
+    return temp
+
+
+def year(info, work: CrossrefWork, doi: str) -> int | None:
+    return work.indexed_year
+
+
+def is_external_principal_author(info, work: CrossrefWork, doi: str) -> int:
+    # As the original row builder: 1 when the first author is from the university
+    return 1 if info.affiliation_matcher.classify(work).first_is_internal else 0
+
+
+# Columns of the "Publicaciones" table, in the order of the original row builder
+PUBLICATIONS_COLUMNS: tuple[ColumnSpec, ...] = (
+    ColumnSpec(145, "Nombre publicacion", title),
+    ColumnSpec(150, "Autores externos", external_authors),
+    ColumnSpec(151, "Revista", editorial),
+    ColumnSpec(153, "ISSN", issns),
+    ColumnSpec(154, "Pais editorial", country),
+    ColumnSpec(155, "URL", url),
+    ColumnSpec(175, "Autores internos", internal_authors),
+    ColumnSpec(535, "Red cientifica", constant("Modelación Biomatemática")),
+    ColumnSpec(536, "Financiadores", funders),
+    ColumnSpec(148, "Año", year),
+    ColumnSpec(146, "Tipo de publicacion", constant(0)),
+    ColumnSpec(147, "Grupo de publicacion", constant(0)),
+    ColumnSpec(152, "Tipo de serie", constant([0])),
+    ColumnSpec(156, "Internacional", constant(1)),
+    ColumnSpec(157, "Origen autores externos", constant(0)),
+    ColumnSpec(158, "Autor principal externo", is_external_principal_author),
+    ColumnSpec(159, "Medio de divulgacion", constant(0)),
+    ColumnSpec(534, "Cuartil", constant(0)),
+    ColumnSpec(160, "Area", constant([{"id": "MATCOM", "type": 1, "displayName": "MATCOM"}])),
+)
+
+
+class ColumnSet:
+    """Declarative mapping of Nextcloud Tables column ids to extractors of the parsed work."""
+
+    def __init__(self, specs: tuple[ColumnSpec, ...] = PUBLICATIONS_COLUMNS):
+        ids = [spec.column_id for spec in specs]
+        if len(ids) != len(set(ids)):
+            raise Exception(f"Repeated column ids in {ids}")
+        self.specs: tuple[ColumnSpec, ...] = specs
+
+    def build_row(self, info: "ExtractInfo", work: CrossrefWork, doi: str) -> dict[str, Any]:
+        """
+        {"column id": value} of one work, the "data" of a create-row request
+        """
+        return {str(spec.column_id): spec.extract(info, work, doi) for spec in self.specs}
+
+    def missing_columns(self, table_columns: list[dict]) -> list[ColumnSpec]:
+        """
+        Specs whose column id is not in the table metadata (/tables/{id}/columns)
+        """
+        existing = {column["id"] for column in table_columns}
+        return [spec for spec in self.specs if spec.column_id not in existing]
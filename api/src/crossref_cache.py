@@ -0,0 +1,140 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import get_metrics
+
+DAY = 24 * 60 * 60
+
+# Works records change (citations, indexed date) more often than members or journals.
+DEFAULT_TTLS: dict[str, int] = {
+    "works": 30 * DAY,
+    "members": 90 * DAY,
+    "journals": 90 * DAY,
+    "queries": 7 * DAY,
+}
+
+
+class CrossrefCache:
+    """Persistent SQLite cache for Crossref responses.
+
+    Entries are keyed by (endpoint, identifier), expire after a per-endpoint TTL
+    and the least recently used ones are evicted once `max_entries` is exceeded.
+    """
+
+    def __init__(
+        self,
+        path: str = ".crossref_cache.sqlite",
+        max_entries: int = 50_000,
+        ttls: dict[str, int] | None = None,
+        default_ttl: int = 30 * DAY,
+    ):
+        self.path: str = path
+        self.max_entries: int = max_entries
+        self.ttls: dict[str, int] = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl: int = default_ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                endpoint TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (endpoint, identifier)
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self._connection.commit()
+
+    def _ttl(self, endpoint: str) -> int:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, endpoint: str, identifier: str) -> dict | None:
+        """
+        Return the cached message or None if it is missing or expired
+        """
+        identifier = identifier.strip().lower()
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM responses WHERE endpoint = ? AND identifier = ?",
+                (endpoint, identifier),
+            ).fetchone()
+            if row is None or now - row[1] > self._ttl(endpoint):
+                self.misses += 1
+                get_metrics().inc("crossref_cache_misses", endpoint=endpoint)
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_access = ? WHERE endpoint = ? AND identifier = ?",
+                (now, endpoint, identifier),
+            )
+            self._connection.commit()
+            self.hits += 1
+            get_metrics().inc("crossref_cache_hits", endpoint=endpoint)
+            return json.loads(row[0])
+
+    def set(self, endpoint: str, identifier: str, value: dict):
+        identifier = identifier.strip().lower()
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (endpoint, identifier, json.dumps(value), now, now),
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count <= self.max_entries:
+            return
+        self._connection.execute(
+            """
+            DELETE FROM responses WHERE rowid IN (
+                SELECT rowid FROM responses ORDER BY last_access ASC LIMIT ?
+            )
+            """,
+            (count - self.max_entries,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count}
+
+
+_default_cache: CrossrefCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> CrossrefCache:
+    """
+    Shared cache configured from the CROSSREF_CACHE_PATH and CROSSREF_CACHE_MAX_ENTRIES env vars
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = CrossrefCache(
+                os.environ.get("CROSSREF_CACHE_PATH", ".crossref_cache.sqlite"),
+                int(os.environ.get("CROSSREF_CACHE_MAX_ENTRIES", 50_000)),
+            )
+    return _default_cache
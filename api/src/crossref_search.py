@@ -0,0 +1,201 @@
+import os
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from urllib.parse import urlencode
+
+from crossref_cache import get_default_cache
+from crossref_store import get_default_store, is_offline, normalize_text
+from http_client import get_http_client
+from identifiers import find_doi
+from metrics import get_metrics
+
+DEFAULT_CROSSREF_API_URL = "https://api.crossref.org"
+
+# Only the fields needed to confirm a doi or rank a title candidate
+VALIDATE_FIELDS = ("DOI", "title", "type")
+SEARCH_FIELDS = ("DOI", "title", "author")
+
+# Below this a title candidate is considered a different paper
+MIN_TITLE_CONFIDENCE = 0.8
+
+# Long filter lists make long urls, Crossref accepts them but proxies may not
+MAX_DOIS_PER_QUERY = 50
+
+
+def api_url() -> str:
+    """
+    Base url of the Crossref API, CROSSREF_API_URL points it to a mirror or to the benchmark
+    stand-in server. Read on each call so a change of the variable after import applies.
+    """
+    return os.environ.get("CROSSREF_API_URL", DEFAULT_CROSSREF_API_URL).rstrip("/")
+
+
+def _local_store():
+    """
+    The local store (CROSSREF_STORE_PATH), None if there is none
+
+    Raises:
+        Exception: in offline mode without a store, instead of silently going online
+    """
+    store = get_default_store()
+    if store is None and is_offline():
+        raise Exception("Offline mode needs a local store, set CROSSREF_STORE_PATH")
+    return store
+
+
+@dataclass
+class TitleMatch:
+    doi: str
+    title: str
+    confidence: float
+    title_score: float
+    author_score: float | None = None  # None if the pdf has no authors to compare
+
+
+def fetch_items(params: dict, use_cache: bool = True) -> list[dict]:
+    """
+    Items of a /works list query, going through the "queries" endpoint of the on-disk cache
+
+    Raises:
+        requests.HTTPError: if Crossref answers with an error status
+    """
+    url = f"{api_url()}/works?{urlencode(params)}"
+    cache = get_default_cache()
+    data = cache.get("queries", url) if use_cache else None
+    if data is None:
+        with get_metrics().span("crossref_request", endpoint="works_list") as span:
+            response = get_http_client().get(url)
+            span.labels["status"] = response.status_code
+        response.raise_for_status()
+        data = response.json()
+        if use_cache:
+            cache.set("queries", url, data)
+    return data.get("message", {}).get("items", [])
+
+
+def validate_dois(
+    dois: list[str], fields: tuple[str, ...] = VALIDATE_FIELDS
+) -> dict[str, dict | None]:
+    """Check many dois against Crossref with filter=doi:a,doi:b list queries
+
+    Args:
+        dois (list[str]): dois or doi urls
+        fields (tuple[str, ...], optional): fields of each work to request (select=)
+
+    Returns:
+        dict[str, dict | None]: normalized doi -> projected work, None if Crossref does not know it
+
+    Raises:
+        Exception: in offline mode (CROSSREF_OFFLINE) without a local store
+    """
+    keys = list(dict.fromkeys(filter(None, map(find_doi, dois))))
+    found: dict[str, dict | None] = dict.fromkeys(keys)
+    store = _local_store()
+    if store is not None:
+        for doi in keys:
+            found[doi] = store.get_work(doi)
+        keys = [doi for doi in keys if found[doi] is None]
+        if is_offline():
+            return found
+    for start in range(0, len(keys), MAX_DOIS_PER_QUERY):
+        batch = keys[start : start + MAX_DOIS_PER_QUERY]
+        items = fetch_items(
+            {
+                "filter": ",".join(f"doi:{doi}" for doi in batch),
+                "select": ",".join(fields),
+                "rows": len(batch),
+            }
+        )
+        for item in items:
+            doi = find_doi(item.get("DOI"))
+            if doi in found:
+                found[doi] = item
+    return found
+
+
+def first_valid_doi(dois: list[str]) -> str | None:
+    """
+    The first of the dois (in order) that Crossref knows, one request for all of them
+    """
+    if not dois:
+        return None
+    try:
+        found = validate_dois(dois)
+    except Exception as e:
+        print(f"Error validating dois: {e}")
+        return None
+    return next((doi for doi, item in found.items() if item is not None), None)
+
+
+def title_similarity(a: str, b: str) -> float:
+    return SequenceMatcher(None, normalize_text(a), normalize_text(b)).ratio()
+
+
+def _family_names(authors: list[str]) -> set[str]:
+    # "Juan Pérez García" or "Pérez García, Juan" -> every word, the order varies by publisher
+    names = set()
+    for author in authors:
+        names.update(word for word in normalize_text(author).split() if len(word) > 1)
+    return names
+
+
+def author_similarity(pdf_authors: list[str], work_authors: list[dict]) -> float | None:
+    """
+    Fraction of the work's family names that appear among the names of the pdf authors
+    """
+    pdf_names = _family_names(pdf_authors)
+    families = [
+        normalize_text(author.get("family") or author.get("name") or "")
+        for author in work_authors
+    ]
+    families = [family for family in families if family]
+    if not pdf_names or not families:
+        return None
+    matched = sum(1 for family in families if set(family.split()) & pdf_names)
+    return matched / len(families)
+
+
+def score_candidate(title: str, authors: list[str], item: dict) -> TitleMatch:
+    candidate_title = (item.get("title") or [""])[0]
+    title_score = title_similarity(title, candidate_title)
+    author_score = author_similarity(authors, item.get("author") or [])
+    if author_score is None:
+        confidence = title_score
+    else:
+        # Pdf author metadata is often a placeholder ("Admin", the editor...), so
+        # matching authors raise the confidence but missing ones never lower it
+        # below the title score alone
+        confidence = max(title_score, 0.8 * title_score + 0.2 * author_score)
+    return TitleMatch(item.get("DOI", ""), candidate_title, confidence, title_score, author_score)
+
+
+def search_title(title: str, authors: list[str] | None = None, rows: int = 5) -> TitleMatch | None:
+    """Best Crossref candidate for a title, ranked by title and author similarity
+
+    Args:
+        title (str): title from the pdf metadata
+        authors (list[str], optional): authors from the pdf metadata, used to break ties
+            between papers with similar titles
+        rows (int, optional): candidates to request
+
+    Returns:
+        TitleMatch | None: the best candidate with its confidence (0 to 1)
+
+    Raises:
+        Exception: in offline mode (CROSSREF_OFFLINE) without a local store
+    """
+    if not title or not title.strip():
+        return None
+    authors = authors or []
+    store = _local_store()
+    if store is not None:
+        works = filter(None, map(store.get_work, store.dois_by_title(title)))
+        local = [score_candidate(title, authors, work) for work in works]
+        if local or is_offline():
+            return max(local, key=lambda match: match.confidence, default=None)
+    params = {"query.bibliographic": title, "rows": rows, "select": ",".join(SEARCH_FIELDS)}
+    if authors:
+        params["query.author"] = " ".join(authors)
+    items = fetch_items(params)
+    matches = [score_candidate(title, authors, item) for item in items if item.get("DOI")]
+    return max(matches, key=lambda match: match.confidence, default=None)
@@ -0,0 +1,286 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Iterator
+
+from identifiers import find_doi
+
+WORD = re.compile(r"\w+")
+
+# Rows written per transaction while importing
+BATCH_SIZE = 1000
+
+
+def normalize_text(text: str) -> str:
+    """
+    Case, accent and punctuation insensitive form of a title or name
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(WORD.findall(text))
+
+
+def _open(path: str, binary: bool = False):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb") if binary else gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "rb") if binary else open(path, encoding="utf-8")
+
+
+def _unwrap(record: dict | list) -> Iterator[dict]:
+    """
+    The Crossref records inside an api response ({"message": ...}), a work list
+    ({"items": [...]}), a JSON array of any of them or a bare record
+    """
+    if isinstance(record, list):
+        for item in record:
+            yield from _unwrap(item)
+        return
+    if "message" in record and isinstance(record["message"], dict):
+        record = record["message"]
+    if isinstance(record.get("items"), list):
+        yield from record["items"]
+    else:
+        yield record
+
+
+def iter_records(path: str) -> Iterator[dict]:
+    """Records of a Crossref dump, read as a stream
+
+    .jsonl files (one response or record per line) never hold more than one line in
+    memory. .json files are streamed with ijson if it is installed, otherwise loaded
+    whole. Both may be gzip compressed.
+    """
+    if path.removesuffix(".gz").endswith(".jsonl"):
+        with _open(path) as file:
+            for line in file:
+                if line.strip():
+                    yield from _unwrap(json.loads(line))
+        return
+    try:
+        import ijson
+    except ImportError:
+        with _open(path) as file:
+            yield from _unwrap(json.load(file))
+        return
+    # Crossref snapshots are {"items": [...]}, api responses {"message": {"items": [...]}}
+    # and some exports a bare [...] of records or responses
+    with _open(path, binary=True) as file:
+        head = file.read(4096)
+    if head.lstrip().startswith(b"["):
+        with _open(path, binary=True) as file:
+            for record in ijson.items(file, "item", use_float=True):
+                yield from _unwrap(record)
+        return
+    prefix = "message.items.item" if b'"message"' in head else "items.item"
+    yielded = False
+    with _open(path, binary=True) as file:
+        for record in ijson.items(file, prefix, use_float=True):
+            yielded = True
+            yield record
+    if not yielded:  # a single record
+        with _open(path) as file:
+            yield from _unwrap(json.load(file))
+
+
+def record_kind(record: dict) -> str | None:
+    """
+    "works", "members" or "journals", None for anything else
+    """
+    if "DOI" in record:
+        return "works"
+    if "primary-name" in record and "id" in record:
+        return "members"
+    if "ISSN" in record and "title" in record:
+        return "journals"
+    return None
+
+
+class CrossrefStore:
+    """Local SQLite copy of Crossref works, members and journals for offline runs.
+
+    Works are indexed by DOI, ISSN, member and normalized title, journals by each of
+    their ISSNs and members by id. Filled with `import_file` from Crossref dumps.
+    """
+
+    def __init__(self, path: str = ".crossref_store.sqlite"):
+        self.path: str = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS works (
+                doi TEXT PRIMARY KEY,
+                member TEXT,
+                title_key TEXT,
+                value TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS works_member ON works (member);
+            CREATE INDEX IF NOT EXISTS works_title_key ON works (title_key);
+            CREATE TABLE IF NOT EXISTS work_issns (
+                issn TEXT NOT NULL,
+                doi TEXT NOT NULL,
+                PRIMARY KEY (issn, doi)
+            );
+            CREATE TABLE IF NOT EXISTS members (
+                id TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS journals (
+                issn TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        self._connection.commit()
+
+    def _work_rows(self, record: dict) -> tuple[tuple, list[tuple]] | None:
+        doi = find_doi(record.get("DOI"))
+        if doi is None:
+            return None
+        member = record.get("member")
+        title = (record.get("title") or [""])[0]
+        row = (
+            doi,
+            str(member).split("/")[-1] if member else None,
+            normalize_text(title) if title else None,
+            json.dumps(record),
+        )
+        return row, [(issn.upper(), doi) for issn in record.get("ISSN", [])]
+
+    def _write(self, works: list, issns: list, members: list, journals: list):
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO works VALUES (?, ?, ?, ?)", works)
+            self._connection.executemany("INSERT OR IGNORE INTO work_issns VALUES (?, ?)", issns)
+            self._connection.executemany("INSERT OR REPLACE INTO members VALUES (?, ?)", members)
+            self._connection.executemany("INSERT OR REPLACE INTO journals VALUES (?, ?)", journals)
+            self._connection.commit()
+
+    def import_file(self, path: str) -> dict[str, int]:
+        """Import a Crossref JSON / JSONL dump (works, members or journals, mixed or not)
+
+        Returns:
+            dict[str, int]: records imported of each kind, and the skipped ones
+        """
+        counts = {"works": 0, "members": 0, "journals": 0, "skipped": 0}
+        works, issns, members, journals = [], [], [], []
+        for record in iter_records(path):
+            kind = record_kind(record)
+            if kind == "works" and (rows := self._work_rows(record)) is not None:
+                works.append(rows[0])
+                issns += rows[1]
+            elif kind == "members":
+                members.append((str(record["id"]), json.dumps(record)))
+            elif kind == "journals":
+                value = json.dumps(record)
+                journals += [(issn.upper(), value) for issn in record["ISSN"]]
+            else:
+                counts["skipped"] += 1
+                continue
+            counts[kind] += 1
+            if len(works) + len(members) + len(journals) >= BATCH_SIZE:
+                self._write(works, issns, members, journals)
+                works, issns, members, journals = [], [], [], []
+        self._write(works, issns, members, journals)
+        return counts
+
+    def _get(self, query: str, key: str) -> dict | None:
+        with self._lock:
+            row = self._connection.execute(query, (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_work(self, doi: str) -> dict | None:
+        key = find_doi(doi)
+        return self._get("SELECT value FROM works WHERE doi = ?", key) if key else None
+
+    def get_member(self, member_id: str) -> dict | None:
+        return self._get("SELECT value FROM members WHERE id = ?", str(member_id))
+
+    def get_journal(self, issn: str) -> dict | None:
+        return self._get("SELECT value FROM journals WHERE issn = ?", issn.strip().upper())
+
+    def get(self, endpoint: str, identifier: str) -> dict | None:
+        """
+        Same endpoints as the Crossref api: "works", "members" or "journals"
+        """
+        getter = {
+            "works": self.get_work,
+            "members": self.get_member,
+            "journals": self.get_journal,
+        }.get(endpoint)
+        return getter(identifier) if getter else None
+
+    def dois_by_title(self, title: str) -> list[str]:
+        """
+        Dois of the works whose title is the same once case, accents and punctuation are ignored
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT doi FROM works WHERE title_key = ?", (normalize_text(title),)
+            ).fetchall()
+        return [doi for (doi,) in rows]
+
+    def dois_by_issn(self, issn: str) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT doi FROM work_issns WHERE issn = ?", (issn.strip().upper(),)
+            ).fetchall()
+        return [doi for (doi,) in rows]
+
+    def dois_by_member(self, member_id: str) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT doi FROM works WHERE member = ?", (str(member_id),)
+            ).fetchall()
+        return [doi for (doi,) in rows]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                table: self._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("works", "members", "journals")
+            }
+
+
+_default_store: CrossrefStore | None = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> CrossrefStore | None:
+    """
+    Store at CROSSREF_STORE_PATH, None if the env var is not set
+    """
+    global _default_store
+    path = os.environ.get("CROSSREF_STORE_PATH")
+    if not path:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CrossrefStore(path)
+    return _default_store
+
+
+def is_offline() -> bool:
+    """
+    CROSSREF_OFFLINE=1: resolve only from the local store, never call the Crossref api
+    """
+    return os.environ.get("CROSSREF_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import Crossref JSON / JSONL dumps into the local store")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--store", default=os.environ.get("CROSSREF_STORE_PATH", ".crossref_store.sqlite"))
+    args = parser.parse_args()
+    store = CrossrefStore(args.store)
+    for path in args.files:
+        print(f"{path}: {store.import_file(path)}")
+    print(f"Store {args.store}: {store.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from dataclasses import dataclass, field
+
+from identifiers import scan_pages
+from pdf_pages import iter_page_texts, scan_page_texts
+from pdf_pool import KillablePool
+
+TEXT_LAYER = "text_layer"
+OCR = "ocr"
+
+
+@dataclass
+class DoiFallbackResult:
+    path: str
+    dois: list[str] = field(default_factory=list)
+    tier: str | None = None  # TEXT_LAYER or OCR, the one that found the dois
+    error: str | None = None
+
+
+def text_layer_dois(pdf_path: str, first_pages: int = 2, last_pages: int = 1) -> list[str]:
+    """
+    DOIs in the text layer of the first and last pages, where papers print them.
+    The last pages are not read if the first ones already have a doi
+    """
+    return scan_page_texts(iter_page_texts(pdf_path, first_pages, last_pages)).dois
+
+
+def ocr_dois(pdf_path: str, max_pages: int = 3, dpi: int = 300, lang: str = "eng+spa") -> list[str]:
+    """DOIs found by OCR (Tesseract) of the first max_pages pages rendered as images
+
+    Raises:
+        ImportError: if pdf2image or pytesseract are not installed
+    """
+    from pdf2image import convert_from_path
+    import pytesseract
+
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=1, last_page=max_pages)
+    return scan_pages(pytesseract.image_to_string(image, lang=lang) for image in images).dois
+
+
+def find_dois(
+    pdf_path: str,
+    ocr_pages: int = 3,
+    ocr_executor: KillablePool | None = None,
+    ocr_timeout: float = 300,
+) -> DoiFallbackResult:
+    """Look for the DOIs of a pdf without usable metadata, cheapest tier first
+
+    1. the text layer of the first and last pages
+    2. OCR of the first ocr_pages pages, in ocr_executor if given (a KillablePool of ocr_dois)
+
+    Args:
+        pdf_path (str): _description_
+        ocr_pages (int, optional): pages to OCR, 0 disables the OCR tier
+        ocr_executor (KillablePool, optional): pool of ocr_dois, see make_ocr_pool
+        ocr_timeout (float, optional): seconds allowed for the OCR of the file, its worker
+            is killed after them
+
+    Returns:
+        DoiFallbackResult: _description_
+    """
+    result = DoiFallbackResult(pdf_path)
+    try:
+        result.dois = text_layer_dois(pdf_path)
+    except Exception as e:
+        result.error = f"{TEXT_LAYER}: {e}"
+    if result.dois:
+        result.tier = TEXT_LAYER
+        return result
+    if ocr_pages <= 0:
+        return result
+
+    try:
+        if ocr_executor is None:
+            result.dois = ocr_dois(pdf_path, ocr_pages)
+        else:
+            result.dois = ocr_executor.run(pdf_path, ocr_pages, timeout=ocr_timeout)
+    except Exception as e:
+        result.error = f"{OCR}: {type(e).__name__}: {e}"
+    if result.dois:
+        result.tier = OCR
+        result.error = None
+    return result
+
+
+def make_ocr_pool(workers: int) -> KillablePool:
+    return KillablePool(ocr_dois, workers)
+
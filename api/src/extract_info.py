@@ -1,60 +1,245 @@
 import requests
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from crossref_cache import get_default_cache
+from http_client import HttpClient, get_http_client
+from crossref_search import api_url
+from identifiers import find_doi
+from work_model import CrossrefWork, fetch_works
+from crossref_store import CrossrefStore, get_default_store, is_offline
+from affiliations import AffiliationMatcher, get_default_affiliation_matcher
+from columns import ColumnSet
+from metrics import get_metrics
 
 
-def get_country_editorial_by_doi(doi) -> str:
+def _normalize_doi(doi: str) -> str:
+    return doi.removeprefix("https://doi.org/").removeprefix("http://doi.org/")
+
+
+def _get_crossref_message(endpoint: str, identifier: str) -> dict:
+    """
+    Get the message of a Crossref endpoint (works, members, journals) going through the on-disk cache
+
+    Raises:
+        requests.HTTPError: if Crossref answers with an error status
+    """
+    cache = get_default_cache()
+    message = cache.get(endpoint, identifier)
+    if message is not None:
+        return message
+    with get_metrics().span("crossref_request", endpoint=endpoint) as span:
+        response = get_http_client().get(f"{api_url()}/{endpoint}/{identifier}")
+        span.labels["status"] = response.status_code
+    response.raise_for_status()
+    message = response.json()["message"]
+    cache.set(endpoint, identifier, message)
+    return message
+
+
+class NotStoredError(requests.HTTPError):
+    """A record missing from the local store in offline mode"""
+
+
+def _is_definitive(error: requests.HTTPError) -> bool:
+    """
+    Misses that another request would repeat (404, not in the local store), unlike rate
+    limits, server errors and timeouts
+    """
+    if isinstance(error, NotStoredError):
+        return True
+    return error.response is not None and error.response.status_code == 404
+
+
+class ResolutionContext:
+    """Per-run memo of Crossref works, members and journals.
+
+    Shared by every row of a batch so each record is fetched once, definitive misses
+    (404) included. Transient errors are not remembered, the next lookup tries again.
+    Records in the local store (CROSSREF_STORE_PATH) are read from it, and in offline
+    mode (CROSSREF_OFFLINE) nothing else is looked up.
+    """
+
+    def __init__(self, store: CrossrefStore | None = None, offline: bool | None = None):
+        self.resolved: dict[tuple[str, str], dict | requests.HTTPError] = {}
+        self._lock = threading.Lock()
+        self.store: CrossrefStore | None = store if store is not None else get_default_store()
+        self.offline: bool = is_offline() if offline is None else offline
+        if self.offline and self.store is None:
+            raise Exception("Offline mode needs a local store, set CROSSREF_STORE_PATH")
+
+    def _not_stored(self, endpoint: str, identifier: str) -> NotStoredError:
+        return NotStoredError(f"{endpoint}/{identifier} no está en el almacén local")
+
+    def _fetch(self, endpoint: str, identifier: str) -> dict:
+        if self.store is not None:
+            value = self.store.get(endpoint, identifier)
+            if value is not None:
+                return value
+            if self.offline:
+                raise self._not_stored(endpoint, identifier)
+        return _get_crossref_message(endpoint, identifier)
+
+    def get(self, endpoint: str, identifier: str) -> dict:
+        key = (endpoint, identifier.strip().lower())
+        with self._lock:
+            value = self.resolved.get(key)
+        if value is None:
+            try:
+                value = self._fetch(endpoint, identifier)
+            except requests.HTTPError as e:
+                if not _is_definitive(e):
+                    raise
+                value = e
+            with self._lock:
+                self.resolved[key] = value
+        if isinstance(value, requests.HTTPError):
+            raise value
+        return value
+
+    def get_work(self, doi: str) -> dict:
+        return self.get("works", _normalize_doi(doi))
+
+    def get_member(self, member_id: str) -> dict:
+        return self.get("members", member_id)
+
+    def get_journal(self, issn: str) -> dict:
+        return self.get("journals", issn)
+
+    def prefetch_works(self, dois: list[str]) -> dict[str, CrossrefWork | None]:
+        """
+        Fetch the parsed works of many dois in a few filter=doi:... requests and keep them
+        for get_parsed_work. Unknown dois are remembered as not found
+        """
+        missing = []
+        with self._lock:
+            for doi in dict.fromkeys(filter(None, map(find_doi, dois))):
+                if ("parsed", doi) not in self.resolved:
+                    missing.append(doi)
+        works = {}
+        if self.store is not None:
+            for doi in missing:
+                message = self.store.get_work(doi)
+                works[doi] = CrossrefWork.from_message(message) if message else None
+            missing = [doi for doi in missing if works[doi] is None]
+        if missing and not self.offline:
+            works.update(fetch_works(missing))
+        with self._lock:
+            for doi, work in works.items():
+                self.resolved[("parsed", doi)] = work or requests.HTTPError(
+                    f"DOI no encontrado: {doi}"
+                )
+            result = {}
+            for doi in dict.fromkeys(filter(None, map(find_doi, dois))):
+                value = self.resolved.get(("parsed", doi))
+                result[doi] = value if isinstance(value, CrossrefWork) else None
+        return result
+
+    def prefetch_related(self, works: list[CrossrefWork], workers: int = 4):
+        """
+        Fetch in parallel, once each, the journals and members the rows of the works look up
+        """
+        lookups = {}
+        for work in works:
+            if work.issns:
+                lookups[("journals", work.issns[0])] = None
+            if work.member:
+                lookups[("members", work.member)] = None
+
+        def fetch(lookup: tuple[str, str]):
+            try:
+                self.get(*lookup)
+            except Exception:
+                pass  # Reported by the row that needs it
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            list(executor.map(fetch, lookups))
+
+    def get_parsed_work(self, doi: str) -> CrossrefWork:
+        """
+        Compact parsed work of the doi, built from a select= projected response
+
+        Raises:
+            requests.HTTPError: if Crossref does not know the doi
+        """
+        key = find_doi(doi)
+        if key is None:
+            raise requests.HTTPError(f"DOI no valido: {doi}")
+        with self._lock:
+            value = self.resolved.get(("parsed", key))
+        if value is None:
+            self.prefetch_works([key])
+            with self._lock:
+                value = self.resolved[("parsed", key)]
+        if isinstance(value, requests.HTTPError):
+            raise value
+        return value
+
+
+def get_country_editorial_by_doi(doi, context: ResolutionContext | None = None) -> str:
+    context = context or ResolutionContext()
     # Paso 1: Obtener metadata del artículo
-    url_work = f"https://api.crossref.org/works/{doi}"
-    resp = requests.get(url_work)
-    if resp.status_code != 200:
+    try:
+        data = context.get_work(doi)
+    except requests.HTTPError:
         return "DOI no encontrado"
-    data = resp.json()
 
     # Paso 2: Extraer member_id
-    member_url = data["message"].get("member")
+    member_url = data.get("member")
     if not member_url:
         return "No se encontró el member_id"
-    member_id = member_url.split("/")[-1]
+    return get_country_by_member(member_url.split("/")[-1], context)
+
+
+def get_country_by_member(member_id: str | None, context: ResolutionContext | None = None) -> str:
+    context = context or ResolutionContext()
+    if not member_id:
+        return "No se encontró el member_id"
 
     # Paso 3: Consultar la API de miembros
-    url_member = f"https://api.crossref.org/members/{member_id}"
-    resp_member = requests.get(url_member)
-    if resp_member.status_code != 200:
+    try:
+        data_member = context.get_member(member_id)
+    except requests.HTTPError:
         return "No se encontró información del miembro"
-    data_member = resp_member.json()
 
     # Paso 4: Extraer país
-    country_code = data_member["message"].get("location", "País no disponible")
-    publisher = data_member["message"].get("primary-name", "Editorial desconocida")
+    country_code = data_member.get("location", "País no disponible")
+    publisher = data_member.get("primary-name", "Editorial desconocida")
 
     # return f"Editorial: {publisher}, País (código ISO): {country_code}"
     return country_code
 
 
-def get_from_crossref(doi: str) -> dict:
+def get_from_crossref(doi: str, context: ResolutionContext | None = None) -> dict:
     """
     Get Data from crossref
 
     Args:
         doi (str): _description_
+        context (ResolutionContext, optional): batch memo to reuse already fetched works
 
     Returns:
         dict: _description_
     """
-    url = f"https://api.crossref.org/works/{doi}"
-    response = requests.get(url)
-    data = response.json()
-    return data["message"]
+    return (context or ResolutionContext()).get_work(doi)
 
 
-def get_editorial_name_by_issn(issn: str):
-    url = f"https://api.crossref.org/journals/{issn}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        return data["message"].get("publisher", "Editorial no encontrada")
-    else:
-        return f"Error en la consulta: {response.status_code}"
+def get_editorial_name_by_issn(issn: str, context: ResolutionContext | None = None):
+    try:
+        data = (context or ResolutionContext()).get_journal(issn)
+    except requests.HTTPError as e:
+        return f"Error en la consulta: {e.response.status_code if e.response is not None else e}"
+    return data.get("publisher", "Editorial no encontrada")
+
+
+@dataclass
+class UploadResult:
+    doi: str
+    ok: bool
+    status_code: int | None = None
+    error: str | None = None
+    duplicate: bool = False
 
 
 class ExtractInfo:
@@ -64,17 +249,39 @@ class ExtractInfo:
         url_server: str,
         user_name_next_cloud_api: str,
         password_next_cloud_api: str,
+        context: ResolutionContext | None = None,
+        http_client: HttpClient | None = None,
+        affiliation_matcher: AffiliationMatcher | None = None,
+        columns: ColumnSet | None = None,
     ):
         self.table_name: str = table_name
         self.url_server: str = url_server
         self.user_name_next_cloud_api: str = user_name_next_cloud_api
         self.password_next_cloud_api: str = password_next_cloud_api
+        # Shared by every row built with this object
+        self.context: ResolutionContext = context or ResolutionContext()
+        self.http_client: HttpClient = http_client or get_http_client()
+        # Decides which authors are from the university, its cache is shared by the batch
+        self.affiliation_matcher: AffiliationMatcher = (
+            affiliation_matcher or get_default_affiliation_matcher()
+        )
+        self._table_id: int | None = None
+        self._table_id_lock = threading.Lock()
+        self.columns: ColumnSet = columns or ColumnSet()
+        self._columns_verified: bool = False
+        self._columns_lock = threading.Lock()
+
+    def new_context(self):
+        """
+        Start a new ResolutionContext (same store and mode), dropping the memo of the previous batch
+        """
+        self.context = ResolutionContext(self.context.store, self.context.offline)
 
     def get_from_next_cloud(self, sub_url: str) -> dict:
         try:
             url = f"{self.url_server}/{sub_url}"
             headers = {"OCS-APIRequest": "true"}
-            response = requests.get(
+            response = self.http_client.get(
                 url,
                 auth=(self.user_name_next_cloud_api, self.password_next_cloud_api),
                 headers=headers,
@@ -86,215 +293,176 @@ class ExtractInfo:
             raise Exception(e)
 
     def get_table_id(self):
-        tables = self.get_from_next_cloud("index.php/apps/tables/api/1/tables")
-        for table in tables:
-            name = table["title"]
-            if name == self.table_name:
-                return table["id"]
-
-        raise Exception(f"Don't exist table with title {name}")
+        """
+        Id of the table named table_name, looked up once and then cached
+        """
+        with self._table_id_lock:
+            if self._table_id is None:
+                tables = self.get_from_next_cloud("index.php/apps/tables/api/1/tables")
+                for table in tables:
+                    if table["title"] == self.table_name:
+                        self._table_id = table["id"]
+                        break
+                else:
+                    raise Exception(f"Don't exist table with title {self.table_name}")
+        return self._table_id
+
+    def get_rows(self) -> list[dict]:
+        """
+        Rows already in the table, each one as {"id": ..., "data": [{"columnId": ..., "value": ...}]}
+        """
+        return self.get_from_next_cloud(
+            f"index.php/apps/tables/api/1/tables/{self.get_table_id()}/rows"
+        )
 
     ############################
     #                          #
     #      OCR ZONE            #
     #                          #
     ############################
-    def get_title(self, data: dict):
-        return {"columnId": 145, "value": data["title"][0]}  # Nombre publicacion
-
-    def _get_authors(self, data: dict, is_internal: bool):
-
-        authors = data["author"]
-        lis = []
-        if is_internal:
-            lis = [
-                author
-                for author in authors
-                if any(
-                    aff["name"] == "Universidad de La Habana"
-                    for aff in author["affiliation"]
-                )
-            ]
-        else:
-            lis = [
-                author
-                for author in authors
-                if not any(
-                    aff["name"] == "Universidad de La Habana"
-                    for aff in author["affiliation"]
-                )
-            ]
-
-        temp: str = ""
-        for external in lis:
-            temp += f"{external["family"] } {external["given"][0]}, "
-        return temp
-
-    def get_external_authors(self, data: dict) -> str:
-        external_authors = self._get_authors(data, False)
-        return {"columnId": 150, "value": external_authors}
-
-    def get_internal_authors(self, data: dict) -> dict:
-        internal_authors = self._get_authors(data, True)
-        return {"columnId": 175, "value": internal_authors}
-
-    def get_editorials(self, data):
-        issn = data["ISSN"][0]
-        editorial = get_editorial_name_by_issn(issn)
-        return {"columnId": 151, "value": editorial}  # Revista
-
-    def get_issns(self, data) -> dict:
-        issns_type = data["issn-type"]
-        issns_print = None
-        issns_electronic = None
-        for item in issns_type:
-            value = item["value"]
-            item_type = item["type"]
-            if item_type == "electronic":
-                issns_electronic = value
-            elif item_type == "print":
-                issns_print = value
-        return {"columnId": 153, "value": f"{issns_electronic}, {issns_print}"}
-
-    def get_country_publish(self, doi) -> dict:
-        return {"columnId": 154, "value": get_country_editorial_by_doi(doi)}
-
-    def get_url(self, url) -> dict:
-        temp = f'{"{"}{"\""}title{"\""}:{"\""}{url}{"\""},{"\""}subline{"\""}:{"\""}URL{"\""},{"\""}providerId{"\""}:url,{"\""}value{"\""}:{"\""}{url}{"\""}'
-        return {
-            "columnId": 155,
-            "value": temp,
-        }
-
-    def get_science_network(self) -> dict:
-        return {"columnId": 535, "value": "Modelación Biomatemática"}
-
-    def get_founders(self, data: dict) -> dict:
-        founders = data["funder"]
-        temp = ""
-        for founder in founders:
-            temp += f"{founder["name"]}, {founder["award"] if "award" in founder else "" }, \n"
-
-        return {
-            "columnId": 536,
-            "value": temp,
-        }
-
-    def get_year(self, data):
-        return {"columnId": 148, "value": data["indexed"]["date-parts"][0][0]}
-
-    def get_publish_type(self, data) -> dict:
-        return {"columnId": 146, "value": 0}
-
-    def get_publish_group(self, data) -> dict:
-        return {"columnId": 147, "value": 0}
-
-    def get_serial_type(self, data) -> dict:
-        return {"columnId": 152, "value": [0]}
-
-    def get_is_international(self, data) -> dict:
-        return {"columnId": 156, "value": 1}
-
-    def get_origin_external_authors(self, data: dict) -> dict:
-        return {"columnId": 157, "value": 0}
-
-    def get_is_external_principal_author(self, data: dict) -> dict:
-        authors = data["author"]
-        principal_authors = [
-            author for author in authors if author["sequence"] == "first"
-        ]
-        external_authors = [
-            author
-            for author in authors
-            if not any(
-                aff["name"] == "Universidad de La Habana"
-                for aff in author["affiliation"]
+    def editorial_name(self, issn: str) -> str:
+        return get_editorial_name_by_issn(issn, self.context)
+
+    def publisher_country(self, member_id: str | None) -> str:
+        return get_country_by_member(member_id, self.context)
+
+    def verify_columns(self):
+        """
+        Check once that every column of the registry exists in the table
+
+        Raises:
+            Exception: with the missing columns, instead of rows silently losing cells
+        """
+        with self._columns_lock:
+            if self._columns_verified:
+                return
+            table_columns = self.get_from_next_cloud(
+                f"index.php/apps/tables/api/1/tables/{self.get_table_id()}/columns"
             )
-        ]
-        val = 0
-        if not principal_authors[0] in external_authors:
-            val = 1
-        return {"columnId": 158, "value": val}
-
-    def get_means_of_dissemination(self, data: dict) -> dict:
-        return {"columnId": 159, "value": 0}
-
-    def get_quartile(self, data: str) -> dict:
-        return {"columnId": 534, "value": 0}
-
-    def get_report_area(self, data: dict) -> dict:
-        return {
-            "columnId": 160,
-            "value": [{"id": "MATCOM", "type": 1, "displayName": "MATCOM"}],
-        }
+            missing = self.columns.missing_columns(table_columns)
+            if missing:
+                names = ", ".join(f"{spec.column_id} ({spec.name})" for spec in missing)
+                raise Exception(f"Columns not in table {self.table_name}: {names}")
+            self._columns_verified = True
 
     def get_new_row(self, doi: str):
-
-        data = get_from_crossref(doi)
-
-        name = self.get_title(data)
-        external_authors = self.get_external_authors(data)
-        editorial = self.get_editorials(data)
-        issns = self.get_issns(data)
-        country_editorial = self.get_country_publish(doi)
-        url_document: dict = self.get_url(doi)
-        internal_authors = self.get_internal_authors(data)
-        scient_network = self.get_science_network()
-        funders = self.get_founders(data)
-        year = self.get_year(data)
-        publish_type = self.get_publish_type(data)
-        publish_group = self.get_publish_group(data)
-        serial_type = self.get_serial_type(data)
-        is_international = self.get_is_international(data)
-        origin_external_authors = self.get_origin_external_authors(data)
-        is_external_principal_author = self.get_is_external_principal_author(data)
-        means_of_dissemination = self.get_means_of_dissemination(data)
-        quartile = self.get_quartile(data)
-        report_area = self.get_report_area(data)
-
-        table_colums = [
-            name,
-            external_authors,
-            editorial,
-            issns,
-            country_editorial,
-            url_document,
-            internal_authors,
-            scient_network,
-            funders,
-            year,
-            publish_type,
-            publish_group,
-            serial_type,
-            is_international,
-            origin_external_authors,
-            is_external_principal_author,
-            means_of_dissemination,
-            quartile,
-            report_area,
-        ]
-        return table_colums
+        work = self.context.get_parsed_work(doi)
+        row = self.columns.build_row(self, work, doi)
+        return [{"columnId": int(column_id), "value": value} for column_id, value in row.items()]
+
+    def build_payload(self, doi: str) -> dict:
+        """
+        Build the body of the Nextcloud Tables create-row request for the doi
+        """
+        self.verify_columns()
+        # filter the doi to add https://doi.org/
+        doi = f"https://doi.org/{doi}" if doi.startswith("10") else doi
+        with get_metrics().span("row_build"):
+            work = self.context.get_parsed_work(doi)
+            return {"data": self.columns.build_row(self, work, doi)}
+
+    def build_payloads(self, dois: list[str], workers: int = 4) -> dict[str, dict | Exception]:
+        """
+        Payloads of many dois, the works fetched in batch, their journals and members with
+        `workers` requests in flight, and then the rows built in one pass.
+        A doi whose row can not be built gets the exception instead
+        """
+        self.verify_columns()
+        urls = {doi: f"https://doi.org/{doi}" if doi.startswith("10") else doi for doi in dois}
+        payloads = {}
+        with get_metrics().span("row_build_batch") as span:
+            try:
+                works = self.context.prefetch_works(list(urls.values()))
+            except Exception as e:
+                # get_parsed_work fetches each work on its own
+                print(f"Error prefetching works: {e}")
+                works = {}
+            self.context.prefetch_related([work for work in works.values() if work], workers)
+            for doi, url in urls.items():
+                try:
+                    work = self.context.get_parsed_work(url)
+                    payloads[doi] = {"data": self.columns.build_row(self, work, url)}
+                except Exception as e:
+                    get_metrics().inc("row_build_failures")
+                    payloads[doi] = e
+            span.fields["rows"] = len(payloads)
+        return payloads
+
+    def _post_row(self, payload: dict) -> requests.Response:
+        # https://minube.uh.cu/index.php/apps/tables/api/1/tables/24/rows
+
+        url = f"{self.url_server}/index.php/apps/tables/api/1/tables/{self.get_table_id()}/rows"
+        auth = (self.user_name_next_cloud_api, self.password_next_cloud_api)
+
+        headers = {"OCS-APIRequest": "true", "Content-Type": "application/json"}
+
+        with get_metrics().span("upload") as span:
+            response = self.http_client.post(url, json=payload, auth=auth, headers=headers)
+            span.labels["status"] = response.status_code
+        return response
+
+    def upload_row(self, payload: dict) -> bool:
+        return self._post_row(payload).status_code == 200
 
     def upload_data(self, doi: str) -> bool:
         try:
-            # https://minube.uh.cu/index.php/apps/tables/api/1/tables/24/rows
-
-            url = f"{self.url_server}/index.php/apps/tables/api/1/tables/{self.get_table_id()}/rows"
-            auth = (self.user_name_next_cloud_api, self.password_next_cloud_api)
-            # filter the doi to add https://doi.org/
-            doi = f"https://doi.org/{doi}" if doi.startswith("10") else doi
-            datos = self.get_new_row(doi)
-
-            data_dict = {str(item["columnId"]): item["value"] for item in datos}
-
-            payload = {"data": data_dict}
-
-            headers = {"OCS-APIRequest": "true", "Content-Type": "application/json"}
-
-            response = requests.post(url, json=payload, auth=auth, headers=headers)
-
-            return response.status_code == 200
+            return self.upload_row(self.build_payload(doi))
 
         except Exception as e:
             print(f"Error in upload_data: {e}, traceback: \n {traceback.format_exc()} ")
             return False
+
+    def _upload_one(self, doi: str, payload: dict | Exception | None = None) -> UploadResult:
+        try:
+            if isinstance(payload, Exception):
+                raise payload
+            response = self._post_row(payload or self.build_payload(doi))
+        except Exception as e:
+            return UploadResult(doi, False, error=f"{type(e).__name__}: {e}")
+        ok = response.status_code == 200
+        return UploadResult(
+            doi, ok, response.status_code, None if ok else response.text[:500]
+        )
+
+    def upload_many(
+        self, dois: list[str], workers: int = 4, manifest=None
+    ) -> dict[str, UploadResult]:
+        """Upload a row for each doi with at most `workers` requests in flight
+
+        Args:
+            dois (list[str]): repeated dois are uploaded once
+            workers (int, optional): _description_
+            manifest (IngestManifest, optional): dois already in the table are reported
+                as duplicate and not uploaded, the uploaded ones are added to it
+
+        Returns:
+            dict[str, UploadResult]: result of each doi
+        """
+        dois = list(dict.fromkeys(dois))
+        report = {}
+        if manifest is not None:
+            for doi in dois:
+                if manifest.has_doi(doi):
+                    report[doi] = UploadResult(doi, True, duplicate=True)
+            dois = [doi for doi in dois if doi not in report]
+        # One filter=doi:... request per 50 dois validates them and fetches the works
+        # the rows are built from, instead of a works/{doi} request per row
+        try:
+            known = self.context.prefetch_works(dois)
+        except Exception as e:
+            print(f"Error validating dois: {e}")
+            known = None
+        if known is not None:
+            for doi in dois:
+                if known.get(find_doi(doi)) is None:
+                    report[doi] = UploadResult(doi, False, 404, "DOI not found in Crossref")
+            dois = [doi for doi in dois if doi not in report]
+        # Fail fast (and only once) if the table does not exist or lacks a column
+        self.get_table_id()
+        payloads = self.build_payloads(dois, workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(self._upload_one, dois, (payloads[doi] for doi in dois)):
+                report[result.doi] = result
+                if result.ok and manifest is not None:
+                    manifest.add_doi(result.doi)
+        return report
@@ -1,37 +1,17 @@
 from extract_info import ExtractInfo
-from pypdf import PdfReader
 from pathlib import Path
 from dotenv import load_dotenv
-from utils import find_words_starting_with, get_text_from_pdf
+from pdf_pages import iter_page_texts, read_metadata, scan_page_texts
+from crossref_search import MIN_TITLE_CONFIDENCE, first_valid_doi, search_title
 import os
-import requests
-
-
-def fetch_crossref_data(url):
-    """Fetch data from CrossRef API using the provided URL.
-
-    Args:
-        url (_type_): _description_
-
-    Returns:
-        _type_: _description_
-    """
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for bad status codes
-        data = response.json()
-        # Check if there are any items in the response
-        if (
-            "message" in data
-            and "items" in data["message"]
-            and len(data["message"]["items"]) > 0
-        ):
-            return data["message"]["items"]
-        else:
-            return None
-    except Exception as e:
-        print(f"Error fetching data: {e}")
-        return None
+from dataclasses import dataclass, field
+from pipeline import Stage, run_pipeline
+from pdf_pool import KillablePool, PdfExtraction, iter_extract_pdfs
+from manifest import IngestManifest
+from doi_fallback import DoiFallbackResult, find_dois, make_ocr_pool
+from metrics import get_metrics
+import atexit
+import threading
 
 
 def files_with_extension(directory, extension):
@@ -53,71 +33,391 @@ def extract_metadata(pdf_path: str) -> tuple[str, list[str], str | None]:
     Extract from PDF file the metadata
     Returns: Title, Authors:list[str], DOI
     """
-    reader = PdfReader(pdf_path)
-    metadata = reader.metadata
-    title = metadata.title
-    authors = metadata.author
-    doi = metadata["/doi"] if "/doi" in metadata else None
-    return title, list(map(str.lstrip, authors.split(","))), doi
+    with get_metrics().span("pdf_parse"):
+        metadata = read_metadata(pdf_path)
+    if metadata is None:  # Usual in scanned documents
+        return None, [], None
+    title = metadata.get("/Title")
+    authors = metadata.get("/Author") or ""
+    doi = metadata.get("/doi")
+    return title, [author for author in map(str.lstrip, authors.split(",")) if author], doi
 
 
-def get_doi_from_title(title: str) -> str | None:
+def get_doi_from_title(
+    title: str, authors: list[str] | None = None, min_confidence: float = MIN_TITLE_CONFIDENCE
+) -> str | None:
     """
-    Get DOI from title using CrossRef API
+    Get DOI from title using CrossRef API, the best of a few candidates by title and
+    author similarity, None if it is not similar enough to be the same paper
     """
-    # Replace spaces with '+' for the query
-    title = title.replace(" ", "+")
-    url = f"https://api.crossref.org/works?query.title={title}&rows=1"
+    with get_metrics().span("doi_resolution", tier="title", found=False) as span:
+        try:
+            match = search_title(title, authors)
+        except Exception as e:
+            print(f"Error fetching data: {e}")
+            return None
+        if match is None:
+            return None
+        print(f"Title match {match.confidence:.2f}: {match.title}")
+        span.fields["confidence"] = match.confidence
+        span.labels["found"] = match.confidence >= min_confidence
+        return match.doi if match.confidence >= min_confidence else None
 
-    data: list[dict] = fetch_crossref_data(url)
 
-    if data:
-        # Extract the DOI from the first item in the response
-        doi = data[0].get("DOI", None)
-        return doi
-    else:
-        return None
+def _find_fallback_dois(
+    file_path: str,
+    ocr_pages: int = 3,
+    ocr_executor: KillablePool | None = None,
+    ocr_timeout: float = 300,
+) -> DoiFallbackResult:
+    with get_metrics().span("doi_resolution", tier="fallback", found=False) as span:
+        fallback = find_dois(file_path, ocr_pages, ocr_executor, ocr_timeout)
+        if fallback.tier:
+            span.labels.update(tier=fallback.tier, found=True)
+        return fallback
 
 
-def _make_table_from_doi(doi: str):
-    print(f"Doi: {doi}")
-    if not doi:
-        return False
-    obj = ExtractInfo(
+_default_ocr_pool: KillablePool | None = None
+_default_ocr_pool_lock = threading.Lock()
+
+
+def _get_ocr_pool() -> KillablePool | None:
+    """
+    OCR workers shared by the process_file callers (sequential run, watcher), sized by
+    PIPELINE_OCR_PROCESSES. None if it is 0, then the OCR runs in the calling process
+    """
+    global _default_ocr_pool
+    with _default_ocr_pool_lock:
+        if _default_ocr_pool is None:
+            config = PipelineConfig.from_env()
+            if config.ocr_pages <= 0 or config.ocr_processes <= 0:
+                return None
+            _default_ocr_pool = make_ocr_pool(config.ocr_processes)
+            atexit.register(_default_ocr_pool.shutdown)
+    return _default_ocr_pool
+
+
+def _get_extract_info() -> ExtractInfo:
+    return ExtractInfo(
         "Publicaciones",
-        "https://minube.uh.cu",
+        os.environ.get("NEXTCLOUD_URL", "https://minube.uh.cu"),
         os.environ.get("UH_CLOUD_ID"),
         os.environ.get("UH_CLOUD_PASSWORD"),
     )
-    return obj.upload_data(doi)
 
 
-def extract_doi_from_text(document_path: str) -> list[str]:
-    dc_str = get_text_from_pdf(document_path)
-    return find_words_starting_with(dc_str, "https://doi.org")
+def _make_table_from_doi(
+    doi: str,
+    extract_info: ExtractInfo | None = None,
+    manifest: IngestManifest | None = None,
+):
+    """Upload the row of the doi
 
+    Args:
+        doi (str): _description_
+        extract_info (ExtractInfo, optional): reuse it across a batch so works, members
+            and journals are fetched once per run
+        manifest (IngestManifest, optional): if the doi is already in the table nothing is uploaded
+    """
+    print(f"Doi: {doi}")
+    if not doi:
+        return False
+    if manifest is not None and manifest.has_doi(doi):
+        print("Already in the table")
+        return True
+    obj = extract_info or _get_extract_info()
+    uploaded = obj.upload_data(doi)
+    if uploaded and manifest is not None:
+        manifest.add_doi(doi)
+    return uploaded
 
-def extract_data():
-    files_path: list[str] = files_with_extension("shared", "pdf")
 
-    print(files_path)
-    for file_path in files_path:
-        title, authors, doi = extract_metadata(file_path)
+def extract_doi_from_text(document_path: str, max_pages: int | None = None) -> list[str]:
+    """
+    DOIs of the text layer, read page by page until the first page with one (or the page/char caps of pdf_pages)
+    """
+    return scan_page_texts(iter_page_texts(document_path, max_pages=max_pages)).dois
 
-        # If doi it,s not ( None or "")  extract metadata from this
-        if doi and _make_table_from_doi(doi):
-            print("Process_from doi")
-            return
-        elif _make_table_from_doi(get_doi_from_title(title)):  # If not doi
-            # Extract from the real title the doi.
-            print("Process_from title")
+
+def process_file(
+    file_path: str,
+    extract_info: ExtractInfo,
+    manifest: IngestManifest,
+    ocr_executor: KillablePool | None = None,
+) -> bool:
+    """Upload the row of one pdf and record the result in the manifest
+
+    Args:
+        ocr_executor (KillablePool, optional): OCR workers, by default the shared ones
+
+    Returns:
+        bool: True if the row was uploaded or the doi was already in the table
+    """
+    with get_metrics().span("document"):
+        return _process_file(file_path, extract_info, manifest, ocr_executor or _get_ocr_pool())
+
+
+def _process_file(
+    file_path: str,
+    extract_info: ExtractInfo,
+    manifest: IngestManifest,
+    ocr_executor: KillablePool | None,
+) -> bool:
+    title, authors, doi = extract_metadata(file_path)
+
+    # If doi it,s not ( None or "")  extract metadata from this
+    if doi and _make_table_from_doi(doi, extract_info, manifest):
+        print("Process_from doi")
+        manifest.record(file_path, doi, "uploaded")
+        return True
+    elif _make_table_from_doi(
+        title_doi := get_doi_from_title(title, authors), extract_info, manifest
+    ):  # If not doi
+        # Extract from the real title the doi.
+        print("Process_from title")
+        manifest.record(file_path, title_doi, "uploaded")
+        return True
+
+    # Scanned or metadata-less pdf: text layer of the first/last pages, then OCR
+    config = PipelineConfig.from_env()
+    fallback = _find_fallback_dois(file_path, config.ocr_pages, ocr_executor, config.ocr_timeout)
+    # The first doi is the document's own, the next ones are usually references.
+    # All of them are checked in one request so an OCR misread is skipped
+    fallback_doi = first_valid_doi(fallback.dois)
+    if fallback_doi and _make_table_from_doi(fallback_doi, extract_info, manifest):
+        print(f"Process_from {fallback.tier}")
+        manifest.record(file_path, fallback_doi, "uploaded")
+        return True
+
+    print(f"No doi found {fallback.error or ''}")
+    manifest.record(file_path, None, "failed", fallback.error or "No doi found")
+    return False
+
+
+@dataclass
+class PipelineConfig:
+    """Workers per stage of the concurrent extract_data and capacity of the queues between them"""
+
+    read_workers: int = 2
+    resolve_workers: int = 4
+    build_workers: int = 4
+    upload_workers: int = 2
+    queue_size: int = 32
+    # If > 0 the pdfs are read by this many worker processes instead of the read stage threads
+    pdf_processes: int = 0
+    pdf_timeout: float = 120
+    # Process pool for the OCR of pdfs without doi, ocr_pages = 0 disables it. Its
+    # workers start with the first pdf that needs OCR
+    ocr_processes: int = 2
+    ocr_pages: int = 3
+    ocr_timeout: float = 300
+
+    @classmethod
+    def from_env(cls) -> "PipelineConfig":
+        return cls(
+            read_workers=int(os.environ.get("PIPELINE_READ_WORKERS", cls.read_workers)),
+            resolve_workers=int(os.environ.get("PIPELINE_RESOLVE_WORKERS", cls.resolve_workers)),
+            build_workers=int(os.environ.get("PIPELINE_BUILD_WORKERS", cls.build_workers)),
+            upload_workers=int(os.environ.get("PIPELINE_UPLOAD_WORKERS", cls.upload_workers)),
+            queue_size=int(os.environ.get("PIPELINE_QUEUE_SIZE", cls.queue_size)),
+            pdf_processes=int(os.environ.get("PIPELINE_PDF_PROCESSES", cls.pdf_processes)),
+            pdf_timeout=float(os.environ.get("PIPELINE_PDF_TIMEOUT", cls.pdf_timeout)),
+            ocr_processes=int(os.environ.get("PIPELINE_OCR_PROCESSES", cls.ocr_processes)),
+            ocr_pages=int(os.environ.get("PIPELINE_OCR_PAGES", cls.ocr_pages)),
+            ocr_timeout=float(os.environ.get("PIPELINE_OCR_TIMEOUT", cls.ocr_timeout)),
+        )
+
+
+@dataclass
+class IngestItem:
+    file_path: str
+    title: str | None = None
+    authors: list[str] = field(default_factory=list)
+    doi: str | None = None
+    source: str | None = None  # "doi", "title", "text_layer" or "ocr"
+    payload: dict | None = None
+    uploaded: bool = False
+    duplicate: bool = False
+    error: str | None = None
+    tried_dois: list[str] = field(default_factory=list)  # rejected by Crossref or Nextcloud
+
+    @classmethod
+    def from_extraction(cls, extraction: PdfExtraction) -> "IngestItem":
+        return cls(
+            extraction.path,
+            extraction.title,
+            extraction.authors,
+            extraction.doi,
+            "doi" if extraction.doi else None,
+            error=extraction.error and f"read: {extraction.error}",
+        )
+
+
+def _read_stage(item: IngestItem):
+    item.title, item.authors, item.doi = extract_metadata(item.file_path)
+    if item.doi:
+        item.source = "doi"
+
+
+def _next_doi(
+    item: IngestItem, config: PipelineConfig, ocr_executor: KillablePool | None
+) -> str | None:
+    """Move the item to the doi of the tier after item.source, as _process_file does when
+    the upload of a doi fails: metadata doi, then title, then text layer / OCR
+
+    Returns:
+        str | None: None if no tier is left or none found a new doi, with the reason
+    """
+    if item.doi:
+        item.tried_dois.append(item.doi)
+    item.doi = None
+    if item.source in (None, "doi"):
+        # Extract from the real title the doi.
+        item.source = "title"
+        title_doi = get_doi_from_title(item.title, item.authors)
+        if title_doi and title_doi not in item.tried_dois:
+            item.doi = title_doi
+            return None
+    if item.source == "title":
+        item.source = "fallback"
+        fallback = _find_fallback_dois(
+            item.file_path, config.ocr_pages, ocr_executor, config.ocr_timeout
+        )
+        # The first doi is the document's own, the next ones are usually references
+        item.doi = first_valid_doi([doi for doi in fallback.dois if doi not in item.tried_dois])
+        if item.doi:
+            item.source = fallback.tier
+            return None
+        return fallback.error or "No doi found"
+    return "No doi found"
+
+
+def _resolve_doi(item: IngestItem, config: PipelineConfig, ocr_executor: KillablePool | None):
+    if not item.doi:
+        error = _next_doi(item, config, ocr_executor)
+        if not item.doi:
+            raise Exception(error)
+
+
+def _ingest_stages(
+    extract_info: ExtractInfo,
+    manifest: IngestManifest,
+    config: PipelineConfig,
+    ocr_executor: KillablePool | None = None,
+) -> list[Stage]:
+    def resolve(item: IngestItem):
+        _resolve_doi(item, config, ocr_executor)
+
+    def build_one(item: IngestItem):
+        # Known dois skip the Crossref lookups and the upload
+        item.duplicate = manifest.has_doi(item.doi)
+        if not item.duplicate:
+            item.payload = extract_info.build_payload(item.doi)
+
+    def upload_one(item: IngestItem):
+        if item.duplicate:
             return
-        # elif any(map(_make_table_from_doi,extract_doi_from_text(file_path))):
-        #    print("Extract from doi text extract ")
-        #    return
+        item.uploaded = extract_info.upload_row(item.payload)
+        if not item.uploaded:
+            raise Exception("Nextcloud rejected the row")
+        manifest.add_doi(item.doi)
+
+    def with_fallback(item: IngestItem, steps: list, retry_steps: list):
+        # A doi Crossref or Nextcloud rejects falls back to the next tiers, like _process_file.
+        # The new doi goes through retry_steps (the work of the previous stages too)
+        while True:
+            try:
+                for step in steps:
+                    step(item)
+                return
+            except Exception as e:
+                print(f"{item.file_path}: {item.source} doi {item.doi} failed: {e}")
+                if _next_doi(item, config, ocr_executor) is not None:
+                    raise
+                steps = retry_steps
+
+    def build(item: IngestItem):
+        with_fallback(item, [build_one], [build_one])
+
+    def upload(item: IngestItem):
+        with_fallback(item, [upload_one], [build_one, upload_one])
+
+    read = [] if config.pdf_processes else [Stage("read", _read_stage, config.read_workers)]
+    return read + [
+        Stage("resolve", resolve, config.resolve_workers),
+        Stage("build", build, config.build_workers),
+        Stage("upload", upload, config.upload_workers),
+    ]
+
+
+def _extract_data_concurrent(
+    files_path: list[str],
+    extract_info: ExtractInfo,
+    manifest: IngestManifest,
+    config: PipelineConfig,
+) -> list[IngestItem]:
+    results = []
+    if config.pdf_processes:
+        items = map(
+            IngestItem.from_extraction,
+            iter_extract_pdfs(files_path, config.pdf_processes, config.pdf_timeout),
+        )
+    else:
+        items = (IngestItem(file_path) for file_path in files_path)
+    ocr_executor = None
+    if config.ocr_pages > 0 and config.ocr_processes > 0:
+        # Killable workers: an OCR past ocr_timeout does not hold a worker or the shutdown
+        ocr_executor = make_ocr_pool(config.ocr_processes)
+    try:
+        stages = _ingest_stages(extract_info, manifest, config, ocr_executor)
+        for item in run_pipeline(items, stages, config.queue_size):
+            if item.error:
+                print(f"{item.file_path}: {item.error}")
+                manifest.record(item.file_path, item.doi, "failed", item.error)
+            else:
+                print(f"{item.file_path}: Process_from {item.source}")
+                status = "duplicate" if item.duplicate else "uploaded"
+                manifest.record(item.file_path, item.doi, status)
+            results.append(item)
+    finally:
+        if ocr_executor is not None:
+            ocr_executor.shutdown()
+    return results
+
 
-        else:
-            print("Hace falta OCR")
+def extract_data(
+    pipeline_config: PipelineConfig | None = None,
+    manifest: IngestManifest | None = None,
+    files_path: list[str] | None = None,
+):
+    """Upload to the table every new or changed pdf of the shared folder
+
+    Args:
+        pipeline_config (PipelineConfig, optional): if given the files are processed
+            concurrently, overlapping pdf reading, Crossref lookups and uploads
+        manifest (IngestManifest, optional): record of the processed files, by default
+            the one at INGEST_MANIFEST_PATH
+        files_path (list[str], optional): the pdfs to process, for example the ones
+            downloaded by the WebDAV sync. By default all the pdfs of the shared folder
+    """
+    extract_info = _get_extract_info()
+    manifest = manifest or IngestManifest.from_env()
+    try:
+        manifest.seed_from_table(extract_info)
+    except Exception as e:
+        print(f"Could not read the table rows: {e}")
+
+    if files_path is None:
+        files_path = files_with_extension("shared", "pdf")
+    # Failed files wait for their retry backoff on both paths
+    files_path = [file_path for file_path in files_path if manifest.is_due(file_path)]
+
+    print(files_path)
+    if pipeline_config is not None:
+        return _extract_data_concurrent(files_path, extract_info, manifest, pipeline_config)
+
+    for file_path in files_path:
+        process_file(file_path, extract_info, manifest)
 
 
 def main():
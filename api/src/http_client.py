@@ -0,0 +1,166 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_metrics
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# A POST that reached the server may have been applied, only retry when it was refused
+NON_IDEMPOTENT_RETRY_STATUSES = frozenset({429})
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PROPFIND", "PUT", "DELETE"})
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """
+    Retry-After may be a number of seconds or an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """Pooled HTTP client shared by the Crossref and Nextcloud calls.
+
+    Keeps keep-alive connections per host, limits the concurrent requests per host,
+    applies default timeouts and retries 429/5xx answers with exponential backoff
+    honoring Retry-After.
+    """
+
+    def __init__(
+        self,
+        timeout: float | tuple[float, float] = (5, 30),
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 60,
+        pool_size: int = 10,
+        per_host_limit: int = 5,
+        host_limits: dict[str, int] | None = None,
+        mailto: str | None = None,
+    ):
+        self.timeout = timeout
+        self.max_retries: int = max_retries
+        self.backoff_factor: float = backoff_factor
+        self.max_backoff: float = max_backoff
+        self.per_host_limit: int = per_host_limit
+        self.host_limits: dict[str, int] = host_limits or {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Crossref "polite pool": identify the client with a contact mail
+        user_agent = "OCR_NODO_WORK/1.0"
+        if mailto:
+            user_agent += f" (mailto:{mailto})"
+        self.session.headers["User-Agent"] = user_agent
+
+        self._host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _host_slot(self, host: str):
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(
+                    self.host_limits.get(host, self.per_host_limit)
+                )
+                self._host_semaphores[host] = semaphore
+        with semaphore:
+            yield
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff_factor * 2**attempt)
+        return delay + random.uniform(0, delay / 2)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send the request retrying on transient failures
+
+        Args:
+            method (str): HTTP method
+            url (str): absolute url
+            **kwargs: forwarded to requests.Session.request
+
+        Raises:
+            requests.RequestException: when the last attempt fails to connect
+
+        Returns:
+            requests.Response: the last response, even if its status is an error
+        """
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else NON_IDEMPOTENT_RETRY_STATUSES
+        host = urlparse(url).netloc
+
+        attempt = 0
+        while True:
+            try:
+                with self._host_slot(host):
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if not retryable or attempt >= self.max_retries:
+                    get_metrics().inc("http_failures", host=host, reason=type(e).__name__)
+                    raise
+                delay = self._backoff(attempt)
+                get_metrics().inc("http_retries", host=host, reason=type(e).__name__)
+            else:
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    return response
+                get_metrics().inc("http_retries", host=host, reason=response.status_code)
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                delay = (
+                    min(self.max_backoff, retry_after)
+                    if retry_after is not None
+                    else self._backoff(attempt)
+                )
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+_default_client: HttpClient | None = None
+_default_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """
+    Shared client configured from the HTTP_TIMEOUT, HTTP_MAX_RETRIES, HTTP_PER_HOST_LIMIT
+    and CROSSREF_MAILTO env vars
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            per_host_limit = int(os.environ.get("HTTP_PER_HOST_LIMIT", 5))
+            _default_client = HttpClient(
+                timeout=float(os.environ.get("HTTP_TIMEOUT", 30)),
+                max_retries=int(os.environ.get("HTTP_MAX_RETRIES", 5)),
+                pool_size=max(10, per_host_limit),
+                per_host_limit=per_host_limit,
+                mailto=os.environ.get("CROSSREF_MAILTO"),
+            )
+    return _default_client
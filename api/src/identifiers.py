@@ -0,0 +1,140 @@
+import re
+from dataclasses import dataclass, field
+from typing import Iterable
+
+# One pass over the text: the alternatives are tried in order at each position, so an
+# ORCID is never reported as an ISSN and the digits inside a DOI are not matched again.
+IDENTIFIER_PATTERN = re.compile(
+    r"""
+    (?:(?:https?://)?(?:dx\.)?doi\.org/|\bdoi:?\s*)?(?P<doi>10\.\d{4,9}/[^\s"'<>]+)
+    | (?:(?:https?://)?orcid\.org/)?(?<![\d-])(?P<orcid>\d{4}-\d{4}-\d{4}-\d{3}[\dX])(?![\d-])
+    | (?<![\d-])(?P<issn>\d{4}-\d{3}[\dX])(?![\d-])
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+DOI_PATTERN = re.compile(r"10\.\d{4,9}/[^\s\"'<>]+")
+
+_TRAILING = ".,;:'\"]}>"
+
+# Longest identifier (with its url prefix) that can be split between two chunks
+_MAX_PENDING = 512
+
+
+def normalize_doi(doi: str) -> str:
+    """
+    Lower case bare DOI without url prefix or trailing punctuation
+    """
+    doi = doi.strip()
+    while doi and (doi[-1] in _TRAILING or (doi[-1] == ")" and doi.count("(") < doi.count(")"))):
+        doi = doi[:-1]
+    return doi.lower()
+
+
+def find_doi(text: str | None) -> str | None:
+    """
+    The first DOI of a text, doi url or doi: string, normalized
+    """
+    if not text:
+        return None
+    match = DOI_PATTERN.search(text)
+    return normalize_doi(match.group(0)) if match else None
+
+
+def is_valid_issn(issn: str) -> bool:
+    digits = issn.replace("-", "").upper()
+    if not re.fullmatch(r"\d{7}[\dX]", digits):
+        return False
+    total = sum(int(digit) * weight for digit, weight in zip(digits[:7], range(8, 1, -1)))
+    check = (11 - total % 11) % 11
+    return digits[7] == ("X" if check == 10 else str(check))
+
+
+def is_valid_orcid(orcid: str) -> bool:
+    digits = orcid.replace("-", "").upper()
+    if not re.fullmatch(r"\d{15}[\dX]", digits):
+        return False
+    # ISO 7064 11,2
+    total = 0
+    for digit in digits[:15]:
+        total = (total + int(digit)) * 2
+    check = (12 - total % 11) % 11
+    return digits[15] == ("X" if check == 10 else str(check))
+
+
+@dataclass
+class Identifiers:
+    dois: list[str] = field(default_factory=list)
+    issns: list[str] = field(default_factory=list)
+    orcids: list[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.dois or self.issns or self.orcids)
+
+
+class IdentifierScanner:
+    """Incremental DOI / ISSN / ORCID extraction over a stream of text chunks.
+
+    Only the tail that may hold an identifier cut by the chunk border is kept between
+    feeds, so the whole document is never in memory. Results are normalized, checksum
+    validated (ISSN, ORCID) and deduplicated in order of appearance.
+    """
+
+    def __init__(self):
+        self.result = Identifiers()
+        self._seen: set[tuple[str, str]] = set()
+        self._pending: str = ""
+
+    def _add(self, kind: str, value: str):
+        if (kind, value) in self._seen:
+            return
+        self._seen.add((kind, value))
+        getattr(self.result, f"{kind}s").append(value)
+
+    def _accept(self, match: re.Match):
+        if match.group("doi"):
+            self._add("doi", normalize_doi(match.group("doi")))
+        elif match.group("orcid"):
+            orcid = match.group("orcid").upper()
+            if is_valid_orcid(orcid):
+                self._add("orcid", orcid)
+        elif match.group("issn"):
+            issn = match.group("issn").upper()
+            if is_valid_issn(issn):
+                self._add("issn", issn)
+
+    def feed(self, chunk: str) -> Identifiers:
+        text = self._pending + chunk
+        keep_from = max(0, len(text) - _MAX_PENDING)
+        for match in IDENTIFIER_PATTERN.finditer(text):
+            if match.end() == len(text):
+                # May continue in the next chunk
+                keep_from = min(keep_from, match.start())
+                break
+            if match.start() >= keep_from:
+                # Will be found again (complete) in the next feed
+                break
+            self._accept(match)
+            keep_from = max(keep_from, match.end())
+        self._pending = text[keep_from:]
+        return self.result
+
+    def close(self) -> Identifiers:
+        for match in IDENTIFIER_PATTERN.finditer(self._pending):
+            self._accept(match)
+        self._pending = ""
+        return self.result
+
+
+def scan_pages(pages: Iterable[str]) -> Identifiers:
+    """
+    Identifiers of a document given as an iterable (possibly lazy) of page texts
+    """
+    scanner = IdentifierScanner()
+    for page in pages:
+        scanner.feed(page + "\n")
+    return scanner.close()
+
+
+def scan_text(text: str) -> Identifiers:
+    return scan_pages([text])
@@ -1,29 +1,32 @@
-from webdav3.client import Client
-
+import argparse
 import os
 from dotenv import load_dotenv
-from extract_metadata  import extract_data
+from extract_metadata import PipelineConfig, _get_extract_info, extract_data, files_with_extension, process_file
+from manifest import IngestManifest
+from metrics import get_metrics, profile_call
+from watch import Watcher
+from webdav_sync import WebdavSync
 
 
 
-def _get_webdab3_client(cloud_url="minube.uh.cu"):
+def _get_webdav_sync(cloud_url="minube.uh.cu") -> WebdavSync:
     cloud_id = os.environ.get("UH_CLOUD_ID")
     cloud_password = os.environ.get("UH_CLOUD_PASSWORD")
 
-    options = {
-        "webdav_hostname": f"http://{cloud_url}/remote.php/{cloud_id}",
-        "webdav_login": cloud_id,
-        "webdav_password": cloud_password,
-    }
-
-    return Client(options)
-    # client.verify = False  # omitir verificación de certificado SSL si es necesario
+    return WebdavSync(
+        f"http://{cloud_url}/remote.php/{cloud_id}",
+        (cloud_id, cloud_password),
+        os.environ.get("WEBDAV_SYNC_STATE_PATH", ".webdav_sync_state.json"),
+        workers=int(os.environ.get("WEBDAV_SYNC_WORKERS", 4)),
+    )
 
 
 
-def _sync_folders(remote_directory_path:str,local_directory_path:str,cloud_url:str="minube.uh.cu"):
-    client=_get_webdab3_client(cloud_url)
-    client.sync(remote_directory_path,local_directory_path)
+def _sync_folders(remote_directory_path:str,local_directory_path:str,cloud_url:str="minube.uh.cu") -> list[str]:
+    """
+    Download the new or changed pdfs and return their local paths
+    """
+    return _get_webdav_sync(cloud_url).sync(remote_directory_path,local_directory_path)
     
     
 
@@ -31,16 +34,75 @@ def _sync_folders(remote_directory_path:str,local_directory_path:str,cloud_url:s
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--watch", action="store_true", help="keep running and process the pdfs as they arrive")
+    parser.add_argument("--interval", type=float, default=30, help="seconds between polls in watch mode")
+    parser.add_argument("--profile", metavar="PDF", help="process only this pdf under cProfile")
+    parser.add_argument("--profile-output", default="profile.prof", help="raw cProfile stats of --profile")
+    parser.add_argument("--metrics", action="store_true", help="print the timings and counters at the end")
+    args = parser.parse_args()
     
     load_dotenv()
-    
+    try:
+        _run(args)
+    finally:
+        _export_metrics(args.metrics)
+
+
+def _export_metrics(show: bool):
+    """
+    Prometheus text file at METRICS_PROM_PATH (e.g. for the node_exporter textfile collector)
+    """
+    metrics = get_metrics()
+    prom_path = os.environ.get("METRICS_PROM_PATH")
+    if prom_path:
+        metrics.write_prometheus(prom_path)
+    if show:
+        print(metrics.summary())
+    metrics.close()
+
+
+def _run(args):
     local_folder="/shared"
     
-    _sync_folders("/shared",local_folder,"localhost:8080")
-    
-    extract_data()
-    
-        
-    
+    if args.profile:
+        profile_call(
+            process_file,
+            args.profile,
+            _get_extract_info(),
+            IngestManifest.from_env(),
+            output=args.profile_output,
+        )
+        return
+
+    if args.watch:
+        Watcher(
+            local_folder,
+            _get_extract_info(),
+            IngestManifest.from_env(),
+            _get_webdav_sync("localhost:8080"),
+            "/shared",
+            poll_interval=args.interval,
+            workers=int(os.environ.get("WATCH_WORKERS", 2)),
+        ).run()
+        return
     
-    
\ No newline at end of file
+    changed_files=_sync_folders("/shared",local_folder,"localhost:8080")
+
+    # Plus the pdfs downloaded before that failed (Crossref or Nextcloud down, no doi yet)
+    # and are due for another attempt, their ETag does not change so the sync skips them
+    manifest = IngestManifest.from_env()
+    changed = {os.path.realpath(file_path) for file_path in changed_files}
+    retry_files = [
+        file_path
+        for file_path in files_with_extension(local_folder, "pdf")
+        if file_path not in changed and manifest.is_due(file_path)
+    ]
+    if retry_files:
+        print(f"Retrying {len(retry_files)} unfinished pdfs")
+
+    extract_data(PipelineConfig.from_env(), manifest, changed_files + retry_files)
+
+
+if __name__ == "__main__":
+    main()
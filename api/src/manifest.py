@@ -0,0 +1,190 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from identifiers import find_doi
+from metrics import get_metrics
+
+# A file in one of these states is not processed again while its content is unchanged
+DONE_STATUSES = ("uploaded", "duplicate")
+
+# Failed files are retried after RETRY_BACKOFF seconds, doubled after each failure,
+# up to MAX_ATTEMPTS times (INGEST_RETRY_BACKOFF, INGEST_MAX_ATTEMPTS)
+RETRY_BACKOFF = 600
+MAX_ATTEMPTS = 5
+
+URL_COLUMN_ID = 155
+
+
+def doi_key(doi: str | None) -> str | None:
+    """
+    Canonical form of a doi or doi url: the bare 10.xxxx/... part in lower case
+    """
+    return find_doi(doi)
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """Persistent record of the processed pdfs and of the dois already in the table.
+
+    Files are identified by the sha256 of their content. The (path, size, mtime)
+    triple is checked first so unchanged files are not hashed again.
+    """
+
+    def __init__(
+        self,
+        path: str = ".ingest_manifest.sqlite",
+        retry_backoff: float = RETRY_BACKOFF,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.path: str = path
+        self.retry_backoff: float = retry_backoff
+        self.max_attempts: int = max_attempts
+        self._lock = threading.Lock()
+        # (path, size, mtime) -> sha256 of the files hashed during this run
+        self._hashes: dict[tuple[str, int, float], str] = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                doi TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS files_path ON files (path);
+            CREATE TABLE IF NOT EXISTS dois (
+                doi TEXT PRIMARY KEY,
+                source TEXT NOT NULL
+            );
+            """
+        )
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(files)")]
+        if "attempts" not in columns:  # manifest of a previous version
+            self._connection.execute(
+                "ALTER TABLE files ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+            )
+        self._connection.commit()
+
+    @classmethod
+    def from_env(cls) -> "IngestManifest":
+        return cls(
+            os.environ.get("INGEST_MANIFEST_PATH", ".ingest_manifest.sqlite"),
+            float(os.environ.get("INGEST_RETRY_BACKOFF", RETRY_BACKOFF)),
+            int(os.environ.get("INGEST_MAX_ATTEMPTS", MAX_ATTEMPTS)),
+        )
+
+    def _file_row(self, path: str) -> tuple:
+        stat = os.stat(path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sha256, doi, status, attempts, updated_at FROM files WHERE path = ? AND size = ? AND mtime = ?",
+                (path, stat.st_size, stat.st_mtime),
+            ).fetchone()
+        if row is not None:
+            return row
+        # Moved, touched or new file: fall back to the content hash
+        key = (path, stat.st_size, stat.st_mtime)
+        sha256 = self._hashes.get(key)
+        if sha256 is None:
+            sha256 = self._hashes[key] = file_hash(path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sha256, doi, status, attempts, updated_at FROM files WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+        return row or (sha256, None, None, 0, None)
+
+    def status(self, path: str) -> str | None:
+        return self._file_row(path)[2]
+
+    def is_processed(self, path: str) -> bool:
+        return self.status(path) in DONE_STATUSES
+
+    def is_due(self, path: str, now: float | None = None) -> bool:
+        """
+        True for new files and for failed ones whose backoff has passed and attempts are left
+        """
+        _, _, status, attempts, updated_at = self._file_row(path)
+        if status is None:
+            return True
+        if status in DONE_STATUSES or attempts >= self.max_attempts:
+            return False
+        backoff = self.retry_backoff * 2 ** max(0, attempts - 1)
+        return (now or time.time()) - updated_at >= backoff
+
+    def record(self, path: str, doi: str | None, status: str, error: str | None = None):
+        get_metrics().inc("files", status=status)
+        stat = os.stat(path)
+        sha256, _, previous_status, attempts, _ = self._file_row(path)
+        if status in DONE_STATUSES:
+            attempts = 0
+        elif previous_status in DONE_STATUSES or previous_status is None:
+            attempts = 1
+        else:
+            attempts += 1
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files "
+                "(sha256, path, size, mtime, doi, status, error, updated_at, attempts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha256, path, stat.st_size, stat.st_mtime, doi_key(doi), status, error, time.time(), attempts),
+            )
+            self._connection.commit()
+
+    def has_doi(self, doi: str | None) -> bool:
+        key = doi_key(doi)
+        if key is None:
+            return False
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM dois WHERE doi = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def add_doi(self, doi: str, source: str = "uploaded"):
+        key = doi_key(doi)
+        if key is None:
+            return
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO dois VALUES (?, ?)", (key, source)
+            )
+            self._connection.commit()
+
+    def seed_from_table(self, extract_info) -> int:
+        """Register the dois found in the URL column of the rows already in the table
+
+        Args:
+            extract_info (ExtractInfo): _description_
+
+        Returns:
+            int: number of dois found in the table
+        """
+        dois = set()
+        for row in extract_info.get_rows():
+            for cell in row.get("data", []):
+                if cell.get("columnId") == URL_COLUMN_ID:
+                    key = doi_key(str(cell.get("value")))
+                    if key:
+                        dois.add(key)
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO dois VALUES (?, 'table')",
+                [(doi,) for doi in dois],
+            )
+            self._connection.commit()
+        return len(dois)
@@ -0,0 +1,125 @@
+import os
+import re
+import threading
+from importlib.metadata import PackageNotFoundError, version
+from typing import Callable
+
+from manifest import file_hash
+
+
+def _markitdown_version() -> str:
+    try:
+        return version("markitdown")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class MarkdownCache:
+    """On-disk cache of document conversions keyed by the content hash of the file.
+
+    Entries are stored as `<converter version>-<variant>-<sha256>.md`, so a new
+    converter version never reuses old conversions (they are deleted on start). When
+    the folder exceeds `max_bytes` the least recently used entries are removed.
+    """
+
+    def __init__(
+        self,
+        directory: str = ".markdown_cache",
+        max_bytes: int = 1 << 30,
+        converter_version: str | None = None,
+    ):
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.converter_version: str = converter_version or _markitdown_version()
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._purge_other_versions()
+
+    def _purge_other_versions(self):
+        prefix = f"{self.converter_version}-"
+        for name in os.listdir(self.directory):
+            if name.endswith(".md") and not name.startswith(prefix):
+                os.remove(os.path.join(self.directory, name))
+
+    def _path(self, sha256: str, variant: str) -> str:
+        variant = re.sub(r"[^A-Za-z0-9.]+", "_", variant)
+        return os.path.join(
+            self.directory, f"{self.converter_version}-{variant}-{sha256}.md"
+        )
+
+    def get_or_convert(
+        self,
+        file_path: str,
+        convert: Callable[[str], str],
+        variant: str = "default",
+        max_chars: int | None = None,
+        sha256: str | None = None,
+    ) -> str:
+        """Return the cached conversion of the file or convert it and store the result
+
+        Args:
+            file_path (str): _description_
+            convert (Callable[[str], str]): converter called with file_path on a miss
+            variant (str, optional): converter options that change the output
+            max_chars (int, optional): return only the first max_chars characters, a cached
+                entry is then only read that far
+            sha256 (str, optional): file_hash of the file if the caller already has it
+
+        Returns:
+            str: the converted text
+        """
+        path = self._path(sha256 or file_hash(file_path), variant)
+        try:
+            with open(path, encoding="utf-8") as file:
+                text = file.read(max_chars)
+            # mtime is the last access time used by the eviction
+            os.utime(path)
+            self.hits += 1
+            return text
+        except FileNotFoundError:
+            self.misses += 1
+
+        text = convert(file_path)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temp_path, path)
+        self._evict()
+        return text if max_chars is None else text[:max_chars]
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".md"):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+_default_cache: MarkdownCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_markdown_cache() -> MarkdownCache:
+    """
+    Shared cache configured from the MARKDOWN_CACHE_DIR and MARKDOWN_CACHE_MAX_BYTES env vars
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MarkdownCache(
+                os.environ.get("MARKDOWN_CACHE_DIR", ".markdown_cache"),
+                int(os.environ.get("MARKDOWN_CACHE_MAX_BYTES", 1 << 30)),
+            )
+    return _default_cache
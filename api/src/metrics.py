@@ -0,0 +1,247 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+# Upper bounds (seconds) of the Prometheus histogram buckets of the spans
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+PREFIX = "ocr_nodo"
+
+LabelKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def _escape(value: str) -> str:
+    """
+    A label value as the Prometheus text format expects it between quotes
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _key(name: str, labels: dict) -> LabelKey:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+@dataclass
+class Timing:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+
+@dataclass
+class Span:
+    """What a `with metrics.span(...)` block can fill in before it ends"""
+
+    name: str
+    labels: dict = field(default_factory=dict)
+    fields: dict = field(default_factory=dict)  # only written to the JSON lines
+
+
+class Metrics:
+    """Thread safe counters and timing spans of a run.
+
+    Spans are aggregated as histograms for the Prometheus text format and, if
+    `jsonl_path` is given, every span and event is also appended as a JSON line.
+    """
+
+    def __init__(self, jsonl_path: str | None = None):
+        self.jsonl_path: str | None = jsonl_path
+        self.counters: dict[LabelKey, float] = {}
+        self.timings: dict[LabelKey, Timing] = {}
+        self._lock = threading.Lock()
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.timings.setdefault(key, Timing()).observe(seconds)
+
+    def event(self, name: str, **fields):
+        """
+        Write a JSON line (if enabled) without touching the aggregates
+        """
+        if self._jsonl is None:
+            return
+        line = json.dumps({"ts": time.time(), "event": name, **fields}, default=str)
+        with self._lock:
+            if self._jsonl is None:  # closed meanwhile
+                return
+            self._jsonl.write(line + "\n")
+            self._jsonl.flush()
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[Span]:
+        """Time the block as `name`. Failures (exceptions) are counted as `{name}_failures`
+
+        The labels can be changed inside the block, for example once the outcome is known.
+        """
+        span = Span(name, dict(labels))
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield span
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(name, seconds, **span.labels)
+            if not ok:
+                self.inc(f"{name}_failures", **span.labels)
+            self.event(name, seconds=seconds, ok=ok, labels=span.labels, **span.fields)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+                "timings": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": timing.count,
+                        "sum": timing.total,
+                        "max": timing.max,
+                    }
+                    for (name, labels), timing in self.timings.items()
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Counters as `ocr_nodo_<name>_total` and spans as `ocr_nodo_<name>_seconds` histograms
+        """
+
+        def labels_text(labels: tuple, extra: str = "") -> str:
+            parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+            if extra:
+                parts.append(extra)
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items(), key=lambda item: item[0])
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{labels_text(labels)} {value}")
+        for (name, labels), timing in timings:
+            metric = f"{PREFIX}_{name}_seconds"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            # The buckets of Timing are already cumulative (a value counts in every bound above it)
+            for bound, count in zip(BUCKETS, timing.buckets):
+                bucket_labels = labels_text(labels, 'le="%s"' % bound)
+                lines.append(f"{metric}_bucket{bucket_labels} {count}")
+            bucket_labels = labels_text(labels, 'le="+Inf"')
+            lines.append(f"{metric}_bucket{bucket_labels} {timing.count}")
+            lines.append(f"{metric}_sum{labels_text(labels)} {timing.total}")
+            lines.append(f"{metric}_count{labels_text(labels)} {timing.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        temp = f"{path}.tmp"
+        with open(temp, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(temp, path)
+
+    def summary(self) -> str:
+        """
+        One line per span (count, total and mean seconds) and per counter, slowest first
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for timing in sorted(snapshot["timings"], key=lambda item: item["sum"], reverse=True):
+            labels = ",".join(f"{key}={value}" for key, value in timing["labels"].items())
+            mean = timing["sum"] / timing["count"] if timing["count"] else 0
+            lines.append(
+                f"{timing['name']}[{labels}] n={timing['count']} total={timing['sum']:.3f}s "
+                f"mean={mean:.3f}s max={timing['max']:.3f}s"
+            )
+        for counter in snapshot["counters"]:
+            labels = ",".join(f"{key}={value}" for key, value in counter["labels"].items())
+            lines.append(f"{counter['name']}[{labels}] {counter['value']:g}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    def close(self):
+        """
+        Flush and close the JSON lines file, later spans and events are only aggregated
+        """
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.flush()
+                self._jsonl.close()
+                self._jsonl = None
+
+    def __enter__(self) -> "Metrics":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_metrics: Metrics | None = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """
+    Shared metrics, also written as JSON lines to METRICS_JSONL_PATH if it is set
+    """
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics(os.environ.get("METRICS_JSONL_PATH") or None)
+    return _default_metrics
+
+
+def profile_call(func: Callable, *args, output: str | None = None, limit: int = 30, **kwargs):
+    """Run func under cProfile, print the `limit` most expensive functions and return its result
+
+    Args:
+        func (Callable): for example process_file of a single document
+        output (str, optional): also dump the raw stats here (open with snakeviz or pstats)
+        limit (int, optional): _description_
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        if output:
+            profiler.dump_stats(output)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+        print(stream.getvalue())
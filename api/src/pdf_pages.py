@@ -0,0 +1,127 @@
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from pypdf import PdfReader
+
+from identifiers import IdentifierScanner, Identifiers
+
+# Caps of the text read per stage, so a several hundred pages scanned thesis costs
+# the same as a paper (PDF_MAX_TEXT_PAGES, PDF_MAX_TEXT_CHARS)
+MAX_TEXT_PAGES = 20
+MAX_TEXT_CHARS = 200_000
+
+
+def text_limits(max_pages: int | None = None, max_chars: int | None = None) -> tuple[int, int]:
+    """
+    The caps given or, for the missing ones, PDF_MAX_TEXT_PAGES and PDF_MAX_TEXT_CHARS
+    """
+    if max_pages is None:
+        max_pages = int(os.environ.get("PDF_MAX_TEXT_PAGES", MAX_TEXT_PAGES))
+    if max_chars is None:
+        max_chars = int(os.environ.get("PDF_MAX_TEXT_CHARS", MAX_TEXT_CHARS))
+    return max_pages, max_chars
+
+
+@contextmanager
+def open_pdf(pdf_path: str, use_mmap: bool = True) -> Iterator[PdfReader]:
+    """PdfReader of the file, over a memory map of it by default
+
+    PdfReader(path) copies the whole file into memory. Over the map only the parts
+    of the file it touches are paged in, and the OS can drop them again under
+    pressure (they are backed by the file, not by the worker's heap).
+    """
+    with open(pdf_path, "rb") as file:
+        if not use_mmap or os.fstat(file.fileno()).st_size == 0:
+            yield PdfReader(file)
+            return
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield PdfReader(mapped)
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                # A view of the map is still referenced, it is released with it
+                pass
+
+
+def page_indexes(total: int, first_pages: int | None = None, last_pages: int = 0) -> list[int]:
+    """
+    Indexes of the first first_pages (all if None) and then the last last_pages pages, without repeats
+    """
+    first = list(range(total if first_pages is None else min(first_pages, total)))
+    seen = set(first)
+    return first + [index for index in range(max(0, total - last_pages), total) if index not in seen]
+
+
+def iter_page_texts(
+    pdf_path: str,
+    first_pages: int | None = None,
+    last_pages: int = 0,
+    max_pages: int | None = None,
+    max_chars: int | None = None,
+    use_mmap: bool = True,
+) -> Iterator[str]:
+    """Text layer of the pdf one page at a time
+
+    Only the page being extracted is in memory, stopping the iteration stops the reading.
+
+    Args:
+        pdf_path (str): _description_
+        first_pages (int, optional): read only the first pages, all if None
+        last_pages (int, optional): then also the last pages
+        max_pages (int, optional): pages at most, by default PDF_MAX_TEXT_PAGES
+        max_chars (int, optional): characters at most (the last page is cut), by default PDF_MAX_TEXT_CHARS
+        use_mmap (bool, optional): read the file through a memory map
+
+    Yields:
+        str: text of each page, "" for pages without text layer (scanned)
+    """
+    max_pages, max_chars = text_limits(max_pages, max_chars)
+    with open_pdf(pdf_path, use_mmap) as reader:
+        indexes = page_indexes(len(reader.pages), first_pages, last_pages)[:max_pages]
+        remaining = max_chars
+        for index in indexes:
+            if remaining <= 0:
+                return
+            text = (reader.pages[index].extract_text() or "")[:remaining]
+            remaining -= len(text)
+            yield text
+
+
+def scan_page_texts(pages: Iterable[str], stop_when_found: bool = True) -> Identifiers:
+    """Identifiers of a stream of page texts
+
+    Args:
+        pages (Iterable[str]): for example iter_page_texts(path)
+        stop_when_found (bool, optional): stop reading after the first page with a doi
+    """
+    scanner = IdentifierScanner()
+    pages = iter(pages)
+    try:
+        for page in pages:
+            scanner.feed(page + "\n")
+            # The newline ends every identifier, so the page is settled now instead of
+            # keeping its tail pending for the next one (which would defeat the early stop)
+            if scanner.close().dois and stop_when_found:
+                break
+    finally:
+        # Closes the pdf of iter_page_texts now instead of when the generator is collected
+        close = getattr(pages, "close", None)
+        if close is not None:
+            close()
+    return scanner.close()
+
+
+def read_metadata(pdf_path: str, use_mmap: bool = True) -> dict | None:
+    """
+    Document information dictionary of the pdf ({"/Title": ..., "/Author": ..., "/doi": ...}), None if it has none
+    """
+    with open_pdf(pdf_path, use_mmap) as reader:
+        metadata = reader.metadata
+        if metadata is None:
+            return None
+        # Plain strings so nothing keeps the reader (and the map) alive
+        return {key: str(metadata[key]) for key in metadata if isinstance(metadata[key], str)}
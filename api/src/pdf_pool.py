@@ -0,0 +1,285 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from multiprocessing.connection import wait
+from typing import Callable, Iterable, Iterator
+
+
+@dataclass
+class PdfExtraction:
+    path: str
+    title: str | None = None
+    authors: list[str] = field(default_factory=list)
+    doi: str | None = None
+    text: str | None = None
+    error: str | None = None
+
+
+def _extract_one(path: str, with_text: bool) -> PdfExtraction:
+    # Imported here so the worker processes only load what they use
+    from extract_metadata import extract_metadata
+    from utils import get_text_from_pdf
+
+    result = PdfExtraction(path)
+    try:
+        result.title, result.authors, result.doi = extract_metadata(path)
+        if with_text:
+            result.text = get_text_from_pdf(path)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _worker(connection, task: Callable):
+    while True:
+        path = connection.recv()
+        if path is None:
+            break
+        connection.send(task(path))
+
+
+class _Worker:
+    def __init__(self, context, task: Callable):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_worker, args=(child_connection, task), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.path: str | None = None
+        self.started_at: float = 0
+
+    def submit(self, path: str):
+        self.path = path
+        self.started_at = time.monotonic()
+        self.connection.send(path)
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def iter_process_pool(
+    paths: Iterable[str],
+    task: Callable,
+    on_error: Callable[[str, str], object],
+    workers: int | None = None,
+    timeout: float = 120,
+) -> Iterator:
+    """Run task(path) for every path in worker processes
+
+    Every worker handles one file at a time. A file that takes longer than `timeout`
+    seconds or crashes its worker (malformed pdf) gives on_error(path, message) and
+    its worker is replaced, the other files are not affected.
+
+    Args:
+        paths (Iterable[str]): _description_
+        task (Callable): picklable top level function (or partial) run in the workers
+        on_error (Callable[[str, str], object]): builds the result of a failed file
+        workers (int, optional): number of processes, defaults to the cpu count
+        timeout (float, optional): seconds allowed per file
+
+    Yields:
+        the results in completion order
+    """
+    context = multiprocessing.get_context("spawn")
+    pending = iter(paths)
+    pool = [_Worker(context, task) for _ in range(workers or os.cpu_count() or 1)]
+    idle = list(pool)
+    busy: list[_Worker] = []
+    try:
+        while True:
+            while idle:
+                path = next(pending, None)
+                if path is None:
+                    break
+                worker = idle.pop()
+                worker.submit(path)
+                busy.append(worker)
+            if not busy:
+                break
+
+            now = time.monotonic()
+            wait_for = max(0.0, min(w.started_at + timeout for w in busy) - now)
+            ready = wait([w.connection for w in busy], wait_for)
+
+            for worker in list(busy):
+                restart = True
+                if worker.connection in ready:
+                    try:
+                        result = worker.connection.recv()
+                        restart = False
+                    except (EOFError, OSError):
+                        worker.process.join(1)
+                        code = worker.process.exitcode
+                        result = on_error(worker.path, f"worker crashed (exit code {code})")
+                elif time.monotonic() - worker.started_at >= timeout:
+                    result = on_error(worker.path, f"timeout after {timeout}s")
+                else:
+                    continue
+
+                busy.remove(worker)
+                if restart:
+                    worker.kill()
+                    worker = _Worker(context, task)
+                idle.append(worker)
+                yield result
+    finally:
+        for worker in idle + busy:
+            worker.stop()
+
+
+def _call_safely(func: Callable, args: tuple) -> tuple[bool, object]:
+    # An exception in the task must not be confused with a crash of the worker
+    try:
+        return True, func(*args)
+    except Exception as e:
+        return False, f"{type(e).__name__}: {e}"
+
+
+class KillablePool:
+    """Worker processes for calls that may hang (OCR of a broken scan), usable from many threads.
+
+    Unlike ProcessPoolExecutor a call that exceeds its timeout kills its worker, which
+    is replaced, so a hung job neither keeps a worker busy nor blocks the shutdown.
+    Workers are started on demand, a pool that is never used costs no process.
+    """
+
+    def __init__(self, func: Callable, workers: int | None = None):
+        """
+        Args:
+            func (Callable): picklable top level function run in the workers
+            workers (int, optional): maximum number of processes, defaults to the cpu count
+        """
+        self._context = multiprocessing.get_context("spawn")
+        self._task = partial(_call_safely, func)
+        self._size: int = workers or os.cpu_count() or 1
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._workers: set[_Worker] = set()
+        self._lock = threading.Lock()
+        self._closed: bool = False
+
+    def _grow(self):
+        """
+        Start a worker if none is idle and the pool is below its size
+        """
+        with self._lock:
+            if self._closed or not self._idle.empty() or len(self._workers) >= self._size:
+                return
+            worker = _Worker(self._context, self._task)
+            self._workers.add(worker)
+        self._idle.put(worker)
+
+    def _discard(self, worker: _Worker):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+
+    def run(self, *args, timeout: float = 300):
+        """Call func(*args) in a free worker, waiting for one if all are busy
+
+        Raises:
+            TimeoutError: after `timeout` seconds, the worker is killed and replaced
+            Exception: if func raised or the worker crashed
+        """
+        while True:
+            if self._closed:
+                raise Exception("KillablePool is shut down")
+            self._grow()
+            try:
+                worker = self._idle.get(timeout=1)
+                break
+            except queue.Empty:
+                continue
+        try:
+            worker.submit(args)
+            if not worker.connection.poll(timeout):
+                raise TimeoutError(f"timeout after {timeout}s")
+            ok, value = worker.connection.recv()
+        except BaseException as e:
+            # Its replacement is started by the next call that finds no idle worker
+            self._discard(worker)
+            # TimeoutError is an OSError too
+            if isinstance(e, (EOFError, OSError)) and not isinstance(e, TimeoutError):
+                raise Exception(f"worker crashed (exit code {worker.process.exitcode})")
+            raise
+        self._idle.put(worker)
+        if not ok:
+            raise Exception(value)
+        return value
+
+    def shutdown(self):
+        """
+        Stop the idle workers and kill the busy ones, without waiting for their calls
+        """
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        idle = set()
+        while True:
+            try:
+                idle.add(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in workers:
+            if worker in idle:
+                worker.stop()
+            else:
+                worker.kill()
+
+
+def _extraction_error(path: str, message: str) -> PdfExtraction:
+    return PdfExtraction(path, error=message)
+
+
+def iter_extract_pdfs(
+    paths: Iterable[str],
+    workers: int | None = None,
+    timeout: float = 120,
+    with_text: bool = False,
+) -> Iterator[PdfExtraction]:
+    """Extract the metadata (and optionally the text) of many pdfs in worker processes
+
+    Args:
+        paths (Iterable[str]): _description_
+        workers (int, optional): number of processes, defaults to the cpu count
+        timeout (float, optional): seconds allowed per file
+        with_text (bool, optional): also the text of the first pages (see get_text_from_pdf)
+
+    Yields:
+        PdfExtraction: in completion order, failures have `error` set
+    """
+    task = partial(_extract_one, with_text=with_text)
+    return iter_process_pool(paths, task, _extraction_error, workers, timeout)
+
+
+def extract_pdfs(
+    paths: list[str],
+    workers: int | None = None,
+    timeout: float = 120,
+    with_text: bool = False,
+) -> list[PdfExtraction]:
+    """
+    Same as iter_extract_pdfs but returns the results in the order of `paths`
+    """
+    results = {
+        result.path: result
+        for result in iter_extract_pdfs(paths, workers, timeout, with_text)
+    }
+    return [results[path] for path in paths]
@@ -0,0 +1,102 @@
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+
+from metrics import get_metrics
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """A step of the pipeline run by `workers` threads
+
+    `func` receives the item and updates it in place. If it raises, the error is
+    stored in `item.error` and the item skips the remaining stages.
+    """
+
+    name: str
+    func: Callable
+    workers: int = 1
+
+
+def _run_stage(stage: Stage, inbox: queue.Queue, outbox: queue.Queue, remaining: list, lock):
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            # Let the sibling workers of this stage see the end too
+            inbox.put(_DONE)
+            break
+        if getattr(item, "error", None) is None:
+            try:
+                with get_metrics().span("pipeline_stage", stage=stage.name):
+                    stage.func(item)
+            except Exception as e:
+                item.error = f"{stage.name}: {e}"
+        outbox.put(item)
+
+    with lock:
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            outbox.put(_DONE)
+
+
+def run_pipeline(items: Iterable, stages: list[Stage], queue_size: int = 32) -> Iterator:
+    """Push the items through the stages concurrently
+
+    Stages are connected by bounded queues, so a slow stage blocks the previous ones
+    instead of piling up work in memory.
+
+    Args:
+        items (Iterable): objects with an `error` attribute, consumed lazily
+        stages (list[Stage]): _description_
+        queue_size (int, optional): capacity of each queue between stages
+
+    Yields:
+        the items in completion order once they leave the last stage
+
+    Raises:
+        Exception: the error of the `items` iterator, after the items it produced
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    threads = []
+    feed_error: list[BaseException] = []
+
+    def feed():
+        try:
+            for item in items:
+                queues[0].put(item)
+        except BaseException as e:
+            feed_error.append(e)
+        finally:
+            # Always, or the stages and the consumer below would wait forever
+            queues[0].put(_DONE)
+
+    threads.append(threading.Thread(target=feed, name="pipeline-feed", daemon=True))
+    for index, stage in enumerate(stages):
+        workers = max(1, stage.workers)
+        remaining, lock = [workers], threading.Lock()
+        for number in range(workers):
+            threads.append(
+                threading.Thread(
+                    target=_run_stage,
+                    args=(stage, queues[index], queues[index + 1], remaining, lock),
+                    name=f"pipeline-{stage.name}-{number}",
+                    daemon=True,
+                )
+            )
+
+    for thread in threads:
+        thread.start()
+
+    while True:
+        item = queues[-1].get()
+        if item is _DONE:
+            break
+        yield item
+
+    for thread in threads:
+        thread.join()
+    if feed_error:
+        raise feed_error[0]
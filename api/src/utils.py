@@ -1,37 +1,34 @@
+import re
 
-from markitdown import MarkItDown
+from functools import partial
+
+from markdown_cache import get_default_markdown_cache
+from pdf_pages import iter_page_texts, text_limits
 
 
 def find_words_starting_with(text:str, substring:str):
     """
     Returns a list of all substrings in 'text' that start with 'substring' and end at the next whitespace.
     """
-    words = []
-    start = 0
-    text_len = len(text)
-    while True:
-        index = text.find(substring, start)
-        if index == -1:
-            break
-
-        # Find end of the word (next space/newline/tab or end of text)
-        end = index
-        while end < text_len and not text[end].isspace():
-            end += 1
-
-        word = text[index:end]
-        words.append(word)
-        start = end   # Continue searching after the current word
-
-    return words
-
+    return re.findall(re.escape(substring) + r"\S*", text)
 
 
-
-def get_text_from_pdf(pdf_path:str)->str:
+def pdf_pages_text(pdf_path: str, max_pages: int | None = None, max_chars: int | None = None) -> str:
+    """
+    Text layer of the pdf built page by page, never more than max_pages / max_chars
+    """
+    return "\n\n".join(iter_page_texts(pdf_path, max_pages=max_pages, max_chars=max_chars))
 
 
-    md = MarkItDown(enable_plugins=True) # Set to True to enable plugins
-    result = md.convert("document.pdf")
-    return result.text_content
+def get_text_from_pdf(pdf_path:str, max_pages:int|None=None, max_chars:int|None=None)->str:
+    """
+    Text of the first pages of the pdf (by default PDF_MAX_TEXT_PAGES pages and
+    PDF_MAX_TEXT_CHARS characters), converted once per file content and then read from
+    the markdown cache. Streamed page by page so a huge scanned thesis is never whole in memory
+    """
+    max_pages, max_chars = text_limits(max_pages, max_chars)
+    convert = partial(pdf_pages_text, max_pages=max_pages, max_chars=max_chars)
+    return get_default_markdown_cache().get_or_convert(
+        pdf_path, convert, f"pages-{max_pages}-{max_chars}", max_chars
+    )
     
\ No newline at end of file
@@ -0,0 +1,149 @@
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+
+from extract_info import ExtractInfo
+from extract_metadata import files_with_extension, process_file
+from manifest import IngestManifest
+from webdav_sync import WebdavSync
+
+_STOP = object()
+
+
+class Watcher:
+    """Long running ingest: polls for new pdfs and uploads them as they arrive.
+
+    New files are found by syncing the WebDAV folder (if `webdav_sync` is given) or
+    by scanning `local_folder`, and go through a bounded queue to `workers` threads
+    that run the usual extract_metadata / ExtractInfo.upload_data path. The manifest
+    is the only state, so after a crash or restart the pdfs that were not finished
+    are picked up again by the first scan.
+    """
+
+    def __init__(
+        self,
+        local_folder: str,
+        extract_info: ExtractInfo,
+        manifest: IngestManifest,
+        webdav_sync: WebdavSync | None = None,
+        remote_folder: str = "/shared",
+        poll_interval: float = 30,
+        workers: int = 2,
+        queue_size: int = 64,
+        settle_time: float = 2,
+    ):
+        self.local_folder: str = local_folder
+        self.extract_info: ExtractInfo = extract_info
+        self.manifest: IngestManifest = manifest
+        self.webdav_sync: WebdavSync | None = webdav_sync
+        self.remote_folder: str = remote_folder
+        self.poll_interval: float = poll_interval
+        self.workers: int = workers
+        # Files modified less than settle_time seconds ago may still be being copied
+        self.settle_time: float = settle_time
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self._in_flight: set[str] = set()
+        self._in_flight_lock = threading.Lock()
+
+    def stop(self, *args):
+        if not self.stop_event.is_set():
+            print("Stopping, waiting for the files in progress")
+        self.stop_event.set()
+
+    def _pending_local_files(self) -> list[str]:
+        now = time.time()
+        files = []
+        for file_path in files_with_extension(self.local_folder, "pdf"):
+            try:
+                if now - os.path.getmtime(file_path) < self.settle_time:
+                    continue
+                # Failed files come back after the manifest backoff, not on every poll
+                if self.manifest.is_due(file_path):
+                    files.append(file_path)
+            except FileNotFoundError:
+                continue
+        return files
+
+    def poll(self) -> list[str]:
+        """
+        Paths that arrived since the last poll or are still unprocessed
+        """
+        if self.webdav_sync is not None:
+            try:
+                self.webdav_sync.sync(self.remote_folder, self.local_folder)
+            except Exception as e:
+                print(f"Error syncing {self.remote_folder}: {e}")
+        return self._pending_local_files()
+
+    def _enqueue(self, file_path: str) -> bool:
+        with self._in_flight_lock:
+            if file_path in self._in_flight:
+                return True
+            self._in_flight.add(file_path)
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(file_path, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        with self._in_flight_lock:
+            self._in_flight.discard(file_path)
+        return False
+
+    def _work(self):
+        while True:
+            file_path = self.queue.get()
+            if file_path is _STOP:
+                break
+            try:
+                process_file(file_path, self.extract_info, self.manifest)
+            except Exception as e:
+                print(f"Error processing {file_path}: {e}\n{traceback.format_exc()}")
+                self.manifest.record(file_path, None, "failed", str(e))
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight.discard(file_path)
+
+    def run(self):
+        """
+        Block until SIGINT/SIGTERM (or stop()), then finish the files in progress and return
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        try:
+            self.manifest.seed_from_table(self.extract_info)
+        except Exception as e:
+            print(f"Could not read the table rows: {e}")
+
+        threads = [
+            threading.Thread(target=self._work, name=f"watch-{number}")
+            for number in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        while not self.stop_event.is_set():
+            # One memo per poll: it does not grow for the life of the process and a
+            # record that failed is looked up again when the manifest retries the file
+            self.extract_info.new_context()
+            for file_path in self.poll():
+                if not self._enqueue(file_path):
+                    break
+            self.stop_event.wait(self.poll_interval)
+
+        # Files still queued stay unprocessed in the manifest and are resumed on restart
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in threads:
+            self.queue.put(_STOP)
+        for thread in threads:
+            thread.join()
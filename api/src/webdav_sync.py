@@ -0,0 +1,182 @@
+import json
+import os
+import posixpath
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, unquote, urlparse
+
+from http_client import HttpClient, get_http_client
+from metrics import get_metrics
+
+PROPFIND_BODY = """<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:">
+  <d:prop>
+    <d:resourcetype/>
+    <d:getetag/>
+    <d:getcontentlength/>
+    <d:getlastmodified/>
+  </d:prop>
+</d:propfind>"""
+
+DAV = "{DAV:}"
+
+
+@dataclass
+class RemoteEntry:
+    path: str
+    etag: str | None
+    size: int | None
+    mtime: float | None
+
+
+def _parse_multistatus(xml: bytes, base_path: str) -> tuple[list[RemoteEntry], list[str]]:
+    """
+    Split a PROPFIND answer in files and sub folders, with paths relative to base_path
+    """
+    files, folders = [], []
+    for response in ET.fromstring(xml).iter(f"{DAV}response"):
+        href = unquote(response.findtext(f"{DAV}href", ""))
+        path = "/" + href.removeprefix(base_path).strip("/")
+        prop = response.find(f"{DAV}propstat/{DAV}prop")
+        if prop is None:
+            continue
+        if prop.find(f"{DAV}resourcetype/{DAV}collection") is not None:
+            folders.append(path)
+            continue
+        size = prop.findtext(f"{DAV}getcontentlength")
+        modified = prop.findtext(f"{DAV}getlastmodified")
+        files.append(
+            RemoteEntry(
+                path,
+                prop.findtext(f"{DAV}getetag"),
+                int(size) if size else None,
+                parsedate_to_datetime(modified).timestamp() if modified else None,
+            )
+        )
+    return files, folders
+
+
+class WebdavSync:
+    """Incremental one-way sync of a WebDAV folder.
+
+    Remote entries are listed with PROPFIND and compared (ETag, size, mtime) with
+    the state saved by the previous run, only new or changed files are downloaded.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        auth: tuple[str, str],
+        state_path: str = ".webdav_sync_state.json",
+        http_client: HttpClient | None = None,
+        workers: int = 4,
+        extension: str = "pdf",
+    ):
+        self.base_url: str = base_url.rstrip("/")
+        self.base_path: str = urlparse(self.base_url).path
+        self.auth = auth
+        self.state_path: str = state_path
+        self.http_client: HttpClient = http_client or get_http_client()
+        self.workers: int = workers
+        self.extension: str = extension
+
+    def _url(self, path: str) -> str:
+        return self.base_url + quote(path)
+
+    def _load_state(self) -> dict[str, dict]:
+        try:
+            with open(self.state_path) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, state: dict[str, dict]):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(temp_path, self.state_path)
+
+    def list_remote(self, remote_path: str) -> list[RemoteEntry]:
+        """
+        All the files with the extension under remote_path, walking the folders with Depth: 1
+        """
+        entries = []
+        pending = ["/" + remote_path.strip("/")]
+        seen = set()
+        while pending:
+            folder = pending.pop()
+            seen.add(folder)
+            response = self.http_client.request(
+                "PROPFIND",
+                self._url(folder + "/"),
+                data=PROPFIND_BODY,
+                headers={"Depth": "1", "Content-Type": "application/xml"},
+                auth=self.auth,
+            )
+            response.raise_for_status()
+            files, folders = _parse_multistatus(response.content, self.base_path)
+            entries.extend(e for e in files if e.path.lower().endswith(f".{self.extension}"))
+            pending.extend(f for f in folders if f not in seen and f != folder)
+        return entries
+
+    def _download(self, entry: RemoteEntry, local_path: str):
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        temp_path = f"{local_path}.part"
+        with get_metrics().span("webdav_download") as span, self.http_client.get(
+            self._url(entry.path), auth=self.auth, stream=True
+        ) as response:
+            response.raise_for_status()
+            with open(temp_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    file.write(chunk)
+            span.fields["bytes"] = entry.size
+        os.replace(temp_path, local_path)
+        if entry.mtime is not None:
+            os.utime(local_path, (entry.mtime, entry.mtime))
+
+    def sync(self, remote_path: str, local_path: str) -> list[str]:
+        """Download the new or changed files of remote_path into local_path
+
+        Args:
+            remote_path (str): folder relative to the WebDAV root
+            local_path (str): _description_
+
+        Returns:
+            list[str]: local paths of the downloaded files
+        """
+        with get_metrics().span("webdav_sync") as span:
+            downloaded = self._sync(remote_path, local_path)
+            span.fields["downloaded"] = len(downloaded)
+        return downloaded
+
+    def _sync(self, remote_path: str, local_path: str) -> list[str]:
+        remote_root = "/" + remote_path.strip("/")
+        state = self._load_state()
+        changed: list[tuple[RemoteEntry, str]] = []
+        for entry in self.list_remote(remote_path):
+            relative = posixpath.relpath(entry.path, remote_root)
+            local_file = os.path.join(local_path, *relative.split("/"))
+            previous = state.get(entry.path)
+            if previous == asdict(entry) and os.path.exists(local_file):
+                continue
+            changed.append((entry, local_file))
+
+        downloaded = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self._download, entry, local_file): (entry, local_file)
+                for entry, local_file in changed
+            }
+            for future, (entry, local_file) in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error downloading {entry.path}: {e}")
+                    continue
+                state[entry.path] = asdict(entry)
+                downloaded.append(local_file)
+
+        self._save_state(state)
+        return downloaded
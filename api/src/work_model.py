@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+
+from crossref_cache import get_default_cache
+from crossref_search import MAX_DOIS_PER_QUERY, fetch_items
+from identifiers import find_doi
+
+# Everything the table columns use, the rest of a work (references, links, facets...)
+# is most of its size and is not downloaded
+WORK_FIELDS = (
+    "DOI",
+    "title",
+    "author",
+    "ISSN",
+    "issn-type",
+    "funder",
+    "indexed",
+    "member",
+    "publisher",
+    "container-title",
+)
+
+# Cache endpoint of the projected works, kept apart from the full "works" messages
+CACHE_ENDPOINT = "works-select"
+
+
+def _year(date: dict | None) -> int | None:
+    try:
+        return date["date-parts"][0][0]
+    except (TypeError, KeyError, IndexError):
+        return None
+
+
+@dataclass(slots=True, frozen=True)
+class Author:
+    given: str
+    family: str
+    sequence: str
+    affiliations: tuple[str, ...]
+    affiliation_ids: tuple[str, ...] = ()  # ROR ids, when the publisher deposited them
+
+    @classmethod
+    def from_message(cls, author: dict) -> "Author":
+        affiliations = author.get("affiliation", [])
+        return cls(
+            author.get("given", ""),
+            author.get("family", author.get("name", "")),
+            author.get("sequence", ""),
+            tuple(aff["name"] for aff in affiliations if aff.get("name")),
+            tuple(
+                item["id"]
+                for aff in affiliations
+                for item in aff.get("id", [])
+                if item.get("id-type") == "ROR" and item.get("id")
+            ),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class Funder:
+    name: str
+    awards: tuple[str, ...] | None  # None if Crossref has no "award" key
+
+
+@dataclass(slots=True, frozen=True)
+class CrossrefWork:
+    """The fields of a Crossref work used to build a table row, parsed once"""
+
+    doi: str
+    title: str
+    authors: tuple[Author, ...]
+    issns: tuple[str, ...]
+    issn_types: tuple[tuple[str, str], ...]  # (type, value), type is "print" or "electronic"
+    funders: tuple[Funder, ...]
+    indexed_year: int | None
+    member: str | None
+    publisher: str | None
+    container_title: str | None
+
+    @classmethod
+    def from_message(cls, message: dict) -> "CrossrefWork":
+        """
+        Parse a Crossref work message, full or projected with WORK_FIELDS
+        """
+        member = message.get("member")
+        return cls(
+            doi=message["DOI"],
+            title=(message.get("title") or [""])[0],
+            authors=tuple(Author.from_message(author) for author in message.get("author", [])),
+            issns=tuple(message.get("ISSN", [])),
+            issn_types=tuple((item["type"], item["value"]) for item in message.get("issn-type", [])),
+            funders=tuple(
+                Funder(
+                    funder.get("name", ""),
+                    tuple(funder["award"]) if "award" in funder else None,
+                )
+                for funder in message.get("funder", [])
+            ),
+            indexed_year=_year(message.get("indexed")),
+            member=str(member).split("/")[-1] if member else None,
+            publisher=message.get("publisher"),
+            container_title=(message.get("container-title") or [None])[0],
+        )
+
+    def issn_of_type(self, issn_type: str) -> str | None:
+        return next((value for kind, value in self.issn_types if kind == issn_type), None)
+
+
+def fetch_works(dois: list[str]) -> dict[str, CrossrefWork | None]:
+    """Projected works of many dois, cached one by one and fetched with filter=doi:... queries
+
+    /works/{doi} does not support select=, so the list endpoint is used even for one doi.
+
+    Returns:
+        dict[str, CrossrefWork | None]: normalized doi -> work, None if Crossref does not know it
+    """
+    cache = get_default_cache()
+    works: dict[str, CrossrefWork | None] = {}
+    missing = []
+    for doi in dict.fromkeys(filter(None, map(find_doi, dois))):
+        message = cache.get(CACHE_ENDPOINT, doi)
+        if message is None:
+            missing.append(doi)
+            works[doi] = None
+        else:
+            works[doi] = CrossrefWork.from_message(message)
+
+    for start in range(0, len(missing), MAX_DOIS_PER_QUERY):
+        batch = missing[start : start + MAX_DOIS_PER_QUERY]
+        items = fetch_items(
+            {
+                "filter": ",".join(f"doi:{doi}" for doi in batch),
+                "select": ",".join(WORK_FIELDS),
+                "rows": len(batch),
+            },
+            use_cache=False,
+        )
+        for item in items:
+            doi = find_doi(item.get("DOI"))
+            if doi in works:
+                cache.set(CACHE_ENDPOINT, doi, item)
+                works[doi] = CrossrefWork.from_message(item)
+    return works
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The modules of api/src and api/ocr_llm import each other as top level modules
+API = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API / "ocr_llm"))
+sys.path.insert(0, str(API / "src"))
@@ -0,0 +1,65 @@
+import pytest
+
+from affiliations import AffiliationMatcher
+from work_model import Author, CrossrefWork
+
+
+@pytest.fixture
+def matcher():
+    return AffiliationMatcher()
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "Universidad de La Habana",
+        "Facultad de Matemática y Computación, Universidad de La Habana, La Habana, Cuba",
+        "Faculty of Mathematics and Computer Science, University of Havana, Havana 10400, Cuba",
+        "MATCOM (UH), Cuba",
+        "IMRE, University of Havana",
+    ],
+)
+def test_internal_affiliations(matcher, name):
+    assert matcher.is_internal_affiliation(name)
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "Technological University of Havana",
+        "Medical University of Havana",
+        "Agrarian University of Havana",
+        "Universidad Tecnológica de La Habana José Antonio Echeverría, CUJAE, Cuba",
+        "Universidad de Ciencias Médicas de La Habana, Cuba",
+        "UCM Habana, Cuba",
+        "Universidad Agraria de La Habana (UNAH), Mayabeque, Cuba",
+        "Havana University of Medical Sciences",
+        "University of Havana Technological Campus CUJAE",
+        "UH Hospital, Cleveland, USA",
+        "IMRE, Singapore",
+    ],
+)
+def test_other_institutions_are_external(matcher, name):
+    assert not matcher.is_internal_affiliation(name)
+
+
+def test_classify_first_author():
+    work = CrossrefWork(
+        "10.1/x", "t",
+        (
+            Author("Ana", "Pérez", "first", ("Medical University of Havana",)),
+            Author("Juan", "García", "additional", ("Universidad de La Habana",)),
+        ),
+        (), (), (), None, None, None, None,
+    )
+    classes = AffiliationMatcher().classify(work)
+    assert [author.family for author in classes.internal] == ["García"]
+    assert not classes.first_is_internal
+
+
+def test_affiliation_decisions_are_bounded():
+    matcher = AffiliationMatcher(max_names=2)
+    for name in ("Universidad de La Habana", "CUJAE, La Habana", "MATCOM, Universidad de La Habana"):
+        matcher.is_internal_affiliation(name)
+    assert list(matcher._names) == ["CUJAE, La Habana", "MATCOM, Universidad de La Habana"]
+    assert matcher.is_internal_affiliation("Universidad de La Habana")
@@ -0,0 +1,86 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import markdown_cache
+from async_llm_structure import AsyncDocumentChat
+from markdown_cache import MarkdownCache
+from response_cache import ResponseCache
+
+
+def _rate_limited() -> openai.RateLimitError:
+    request = httpx.Request("POST", "http://llm.invalid/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": "0"}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class SlowCompletions:
+    """Async chat.completions that answers {"result": <query>} and tracks the requests in flight"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise _rate_limited()
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        query = messages[-1]["content"].split(" /n")[0]
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps({"result": query})))],
+            usage=None,
+        )
+
+
+@pytest.fixture
+def chat(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        markdown_cache, "_default_cache", MarkdownCache(str(tmp_path / "markdown"), converter_version="test")
+    )
+    path = tmp_path / "paper.md"
+    path.write_text("# Paper\n\nText of the paper.\n", encoding="utf-8")
+    chat = AsyncDocumentChat(
+        str(path),
+        "http://llm.invalid/v1",
+        "key",
+        "model",
+        "Answer in json",
+        max_concurrency=3,
+        response_cache=ResponseCache(str(tmp_path / "llm_cache.sqlite")),
+        use_cache=False,
+    )
+    chat.async_client = SimpleNamespace(chat=SimpleNamespace(completions=SlowCompletions()))
+    return chat
+
+
+def test_ask_many_is_bounded_by_the_limiter(chat):
+    queries = [f"question {index}" for index in range(10)]
+    assert asyncio.run(chat.ask_many(queries)) == queries
+    completions = chat.async_client.chat.completions
+    assert completions.calls == 10
+    assert 1 < completions.peak <= 3
+
+
+def test_rate_limits_are_retried(chat):
+    chat.async_client.chat.completions.failures = 2
+    assert asyncio.run(chat.ask_document("title")) == "title"
+    assert chat.async_client.chat.completions.calls == 3
+
+
+def test_retries_give_up_after_max_retries(chat):
+    chat.max_retries = 1
+    chat.async_client.chat.completions.failures = 5
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(chat.ask_document("title"))
+    assert chat.async_client.chat.completions.calls == 2
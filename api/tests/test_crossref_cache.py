@@ -0,0 +1,46 @@
+import crossref_cache
+from crossref_cache import DAY, CrossrefCache
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    CrossrefCache(path).set("works", "10.5555/A.1", {"DOI": "10.5555/a.1"})
+    cache = CrossrefCache(path)
+    assert cache.get("works", " 10.5555/a.1 ") == {"DOI": "10.5555/a.1"}
+    assert cache.get("members", "10.5555/a.1") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_entries_expire_after_the_endpoint_ttl(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(crossref_cache.time, "time", clock)
+    cache = CrossrefCache(str(tmp_path / "cache.sqlite"), ttls={"works": DAY})
+    cache.set("works", "10.5555/a.1", {"DOI": "10.5555/a.1"})
+    cache.set("journals", "1234-5678", {"title": "Journal"})
+    clock.now += 2 * DAY
+    assert cache.get("works", "10.5555/a.1") is None
+    assert cache.get("journals", "1234-5678") == {"title": "Journal"}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(crossref_cache.time, "time", clock)
+    cache = CrossrefCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for identifier in ("a", "b"):
+        clock.now += 1
+        cache.set("works", identifier, {"id": identifier})
+    clock.now += 1
+    assert cache.get("works", "a") == {"id": "a"}
+    clock.now += 1
+    cache.set("works", "c", {"id": "c"})
+    assert cache.get("works", "b") is None
+    assert cache.get("works", "a") == {"id": "a"}
+    assert cache.get("works", "c") == {"id": "c"}
@@ -0,0 +1,55 @@
+import pytest
+
+from crossref_search import (
+    DEFAULT_CROSSREF_API_URL,
+    MIN_TITLE_CONFIDENCE,
+    api_url,
+    score_candidate,
+    search_title,
+    validate_dois,
+)
+
+ITEM = {
+    "DOI": "10.1016/j.example.2020.1",
+    "title": ["Optimal control of an epidemic model with vaccination"],
+    "author": [{"given": "Ana", "family": "Pérez"}, {"given": "Luis", "family": "García"}],
+}
+# Similar but not identical to the title of ITEM (about 0.9)
+PDF_TITLE = "Optimal control of epidemic models with vaccination"
+
+
+def test_placeholder_authors_do_not_lower_the_confidence():
+    without_authors = score_candidate(PDF_TITLE, [], ITEM)
+    placeholder = score_candidate(PDF_TITLE, ["Admin"], ITEM)
+    assert placeholder.author_score == 0
+    assert placeholder.confidence == without_authors.confidence
+    assert placeholder.confidence >= MIN_TITLE_CONFIDENCE
+
+
+def test_matching_authors_raise_the_confidence():
+    without_authors = score_candidate(PDF_TITLE, [], ITEM)
+    with_authors = score_candidate(PDF_TITLE, ["Ana Pérez", "Luis García"], ITEM)
+    assert with_authors.author_score == 1
+    assert with_authors.confidence > without_authors.confidence
+
+
+def test_different_title_is_rejected():
+    match = score_candidate("Homogenization of elastic composites", ["Ana Pérez"], ITEM)
+    assert match.confidence < MIN_TITLE_CONFIDENCE
+
+
+def test_api_url_is_read_on_each_call(monkeypatch):
+    monkeypatch.delenv("CROSSREF_API_URL", raising=False)
+    assert api_url() == DEFAULT_CROSSREF_API_URL
+    monkeypatch.setenv("CROSSREF_API_URL", "http://127.0.0.1:8000/")
+    assert api_url() == "http://127.0.0.1:8000"
+
+
+def test_offline_without_a_store_does_not_go_online(monkeypatch):
+    monkeypatch.setenv("CROSSREF_OFFLINE", "1")
+    monkeypatch.delenv("CROSSREF_STORE_PATH", raising=False)
+    monkeypatch.setattr("crossref_search.fetch_items", lambda params: pytest.fail("went online"))
+    with pytest.raises(Exception, match="CROSSREF_STORE_PATH"):
+        validate_dois(["10.5555/a.1"])
+    with pytest.raises(Exception, match="CROSSREF_STORE_PATH"):
+        search_title(PDF_TITLE)
@@ -0,0 +1,43 @@
+import gzip
+import json
+
+import pytest
+
+import crossref_store
+from crossref_store import CrossrefStore, iter_records
+
+WORKS = [
+    {"DOI": "10.5555/a.1", "title": ["First paper"], "member": "78"},
+    {"DOI": "10.5555/b.2", "title": ["Second paper"], "member": "78"},
+]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        WORKS,
+        {"items": WORKS},
+        {"message": {"items": WORKS}},
+        [{"message": WORKS[0]}, {"message": WORKS[1]}],
+    ],
+)
+def test_iter_records_json_shapes(tmp_path, content):
+    path = tmp_path / "dump.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        json.dump(content, file)
+    assert [record["DOI"] for record in iter_records(str(path))] == ["10.5555/a.1", "10.5555/b.2"]
+
+
+def test_iter_records_array_without_ijson(tmp_path, monkeypatch):
+    monkeypatch.setitem(__import__("sys").modules, "ijson", None)
+    path = tmp_path / "dump.json"
+    path.write_text(json.dumps(WORKS), encoding="utf-8")
+    assert [record["DOI"] for record in iter_records(str(path))] == ["10.5555/a.1", "10.5555/b.2"]
+
+
+def test_import_array_dump(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_text(json.dumps(WORKS), encoding="utf-8")
+    store = CrossrefStore(str(tmp_path / "store.sqlite"))
+    store.import_file(str(path))
+    assert store.get_work("10.5555/B.2")["title"] == ["Second paper"]
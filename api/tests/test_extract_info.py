@@ -0,0 +1,155 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from extract_info import ExtractInfo, ResolutionContext
+from work_model import CrossrefWork
+
+DOIS = ["10.5555/a.1", "10.5555/b.2"]
+JOURNAL = {"publisher": "Elsevier"}
+MEMBER = {"location": "Netherlands", "primary-name": "Elsevier"}
+
+
+def _work(doi: str) -> CrossrefWork:
+    return CrossrefWork.from_message(
+        {"DOI": doi, "title": [f"Paper {doi}"], "ISSN": ["0025-5564"], "member": "78", "author": []}
+    )
+
+
+class BatchFailingContext(ResolutionContext):
+    """The filter=doi:... request of a whole batch fails, single works are found"""
+
+    def __init__(self):
+        super().__init__()
+        self.fetched: list[tuple[str, str]] = []
+
+    def prefetch_works(self, dois):
+        if len(dois) > 1:
+            raise requests.ConnectionError("batch request failed")
+        with self._lock:
+            for doi in dois:
+                self.resolved[("parsed", doi)] = _work(doi)
+        return {doi: self.resolved[("parsed", doi)] for doi in dois}
+
+    def _fetch(self, endpoint, identifier):
+        self.fetched.append((endpoint, identifier))
+        return JOURNAL if endpoint == "journals" else MEMBER
+
+
+def _extract_info(context: ResolutionContext) -> ExtractInfo:
+    info = ExtractInfo("Publicaciones", "http://nextcloud.invalid", "user", "password", context)
+    info._table_id = 1
+    info._columns_verified = True
+    return info
+
+
+def test_build_payloads_falls_back_to_single_works():
+    context = BatchFailingContext()
+    payloads = _extract_info(context).build_payloads(DOIS)
+    assert all(isinstance(payloads[doi], dict) for doi in DOIS)
+    assert payloads[DOIS[0]]["data"]["151"] == "Elsevier"
+    assert payloads[DOIS[1]]["data"]["154"] == "Netherlands"
+
+
+def test_prefetch_related_fetches_each_journal_and_member_once():
+    context = BatchFailingContext()
+    context.prefetch_related([_work(doi) for doi in DOIS], workers=4)
+    assert sorted(context.fetched) == [("journals", "0025-5564"), ("members", "78")]
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+
+class FlakyContext(ResolutionContext):
+    def __init__(self, errors: list[int]):
+        super().__init__(store=None, offline=False)
+        self.errors = errors
+        self.calls = 0
+
+    def _fetch(self, endpoint, identifier):
+        self.calls += 1
+        if self.errors:
+            raise _http_error(self.errors.pop(0))
+        return JOURNAL
+
+
+def test_transient_errors_are_not_remembered():
+    context = FlakyContext([429, 503])
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            context.get_journal("0025-5564")
+    assert context.get_journal("0025-5564") == JOURNAL
+    assert context.calls == 3
+
+
+def test_not_found_is_remembered():
+    context = FlakyContext([404])
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError):
+            context.get_journal("0025-5564")
+    assert context.calls == 1
+
+
+def test_new_context_drops_the_memo():
+    info = _extract_info(FlakyContext([404]))
+    with pytest.raises(requests.HTTPError):
+        info.context.get_journal("0025-5564")
+    previous = info.context
+    info.new_context()
+    assert info.context is not previous
+    assert info.context.resolved == {}
+    assert info.context.store is previous.store
+
+
+class DoiSet:
+    """The has_doi / add_doi part of IngestManifest"""
+
+    def __init__(self, dois):
+        self.dois = set(dois)
+
+    def has_doi(self, doi):
+        return doi in self.dois
+
+    def add_doi(self, doi):
+        self.dois.add(doi)
+
+
+def test_upload_many_reports_each_doi(monkeypatch):
+    dois = ["10.5555/in.table", "10.5555/unknown", "10.5555/broken", "10.5555/rejected"]
+    dois += [f"10.5555/ok.{index}" for index in range(8)]
+    info = _extract_info(ResolutionContext(store=None, offline=False))
+    known = {doi: None if "unknown" in doi else _work(doi) for doi in dois}
+    payloads = {doi: ValueError("no title") if "broken" in doi else {"data": doi} for doi in dois}
+    monkeypatch.setattr(info.context, "prefetch_works", lambda dois: known)
+    monkeypatch.setattr(info, "build_payloads", lambda dois, workers: payloads)
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def post_row(payload):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        response = requests.Response()
+        response.status_code = 500 if "rejected" in payload["data"] else 200
+        response._content = b"error"
+        return response
+
+    monkeypatch.setattr(info, "_post_row", post_row)
+    manifest = DoiSet(["10.5555/in.table"])
+    report = info.upload_many(dois + dois[:2], workers=3, manifest=manifest)
+
+    assert set(report) == set(dois)
+    assert report["10.5555/in.table"].duplicate
+    assert report["10.5555/unknown"].status_code == 404
+    assert report["10.5555/broken"].error == "ValueError: no title"
+    assert (report["10.5555/rejected"].ok, report["10.5555/rejected"].status_code) == (False, 500)
+    assert all(report[f"10.5555/ok.{index}"].ok for index in range(8))
+    assert manifest.dois == {"10.5555/in.table"} | {f"10.5555/ok.{index}" for index in range(8)}
+    assert 1 < peak[0] <= 3
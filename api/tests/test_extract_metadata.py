@@ -0,0 +1,23 @@
+import extract_metadata
+from manifest import IngestManifest
+
+
+def test_sequential_run_skips_files_waiting_for_their_retry(tmp_path, monkeypatch):
+    manifest = IngestManifest(str(tmp_path / "m.sqlite"), retry_backoff=3600)
+    paths = []
+    for name in ("new.pdf", "failed.pdf", "done.pdf"):
+        path = tmp_path / name
+        path.write_bytes(b"%PDF-1.4 " + name.encode())
+        paths.append(str(path))
+    new, failed, done = paths
+    manifest.record(failed, None, "failed", "Crossref down")
+    manifest.record(done, "10.5555/a.1", "uploaded")
+
+    processed = []
+    monkeypatch.setattr(extract_metadata, "_get_extract_info", lambda: None)
+    monkeypatch.setattr(manifest, "seed_from_table", lambda extract_info: None)
+    monkeypatch.setattr(
+        extract_metadata, "process_file", lambda file_path, *args, **kwargs: processed.append(file_path)
+    )
+    extract_metadata.extract_data(manifest=manifest, files_path=paths)
+    assert processed == [new]
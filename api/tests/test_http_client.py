@@ -0,0 +1,85 @@
+import io
+
+import pytest
+import requests
+
+import http_client
+from http_client import HttpClient, _parse_retry_after
+
+
+class FakeSession:
+    """Answers the requests with the given statuses (or exceptions) in order"""
+
+    def __init__(self, session: requests.Session, answers: list):
+        self.headers = session.headers
+        self.answers = list(answers)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        status, headers = answer if isinstance(answer, tuple) else (answer, {})
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.raw = io.BytesIO(b"")
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def _client(answers, **kwargs) -> tuple[HttpClient, FakeSession]:
+    client = HttpClient(**kwargs)
+    client.session = FakeSession(client.session, answers)
+    return client, client.session
+
+
+def test_retries_honor_retry_after(sleeps):
+    client, session = _client([(503, {"Retry-After": "2"}), (429, {"Retry-After": "1"}), 200])
+    assert client.get("https://api.crossref.org/works").status_code == 200
+    assert session.calls == 3
+    assert sleeps == [2.0, 1.0]
+
+
+def test_the_last_response_is_returned_after_max_retries(sleeps):
+    client, session = _client([500, 502, 503], max_retries=2)
+    assert client.get("https://api.crossref.org/works").status_code == 503
+    assert session.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_post_is_only_retried_when_refused(sleeps):
+    client, session = _client([503])
+    assert client.post("https://cloud.example/rows").status_code == 503
+    client, session = _client([429, 200])
+    assert client.post("https://cloud.example/rows").status_code == 200
+    assert session.calls == 2
+
+
+def test_connection_errors(sleeps):
+    client, session = _client([requests.ConnectionError("reset"), 200])
+    assert client.get("https://api.crossref.org/works").status_code == 200
+    # The POST may have reached the server
+    client, session = _client([requests.ConnectionError("reset"), 200])
+    with pytest.raises(requests.ConnectionError):
+        client.post("https://cloud.example/rows")
+    assert session.calls == 1
+
+
+def test_polite_pool_user_agent():
+    assert "mailto:team@example.org" in HttpClient(mailto="team@example.org").session.headers["User-Agent"]
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after("3") == 3.0
+    assert _parse_retry_after("-1") == 0.0
+    assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert _parse_retry_after("soon") is None
+    assert _parse_retry_after(None) is None
@@ -0,0 +1,67 @@
+import pytest
+
+from identifiers import _MAX_PENDING, IdentifierScanner, normalize_doi, scan_text
+
+VALID_ISSN = "0317-8471"
+VALID_ORCID = "0000-0002-1825-0097"
+
+
+def test_checksums_reject_invalid_issns_and_orcids():
+    found = scan_text(f"ISSN {VALID_ISSN}, 0317-8472. ORCID {VALID_ORCID} and 0000-0002-1825-0098.")
+    assert found.issns == [VALID_ISSN]
+    assert found.orcids == [VALID_ORCID]
+
+
+def test_orcid_is_not_reported_as_issn():
+    found = scan_text(f"https://orcid.org/{VALID_ORCID}")
+    assert found.orcids == [VALID_ORCID]
+    assert found.issns == []
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "see doi:10.5555/ABC.1.",
+        "(https://doi.org/10.5555/abc.1),",
+        "[10.5555/abc.1];",
+        '"10.5555/abc.1"',
+    ],
+)
+def test_trailing_punctuation_is_stripped(text):
+    assert scan_text(text).dois == ["10.5555/abc.1"]
+
+
+def test_balanced_parentheses_are_kept():
+    assert normalize_doi("10.1002/(SICI)1097-4636(199912)") == "10.1002/(sici)1097-4636(199912)"
+
+
+@pytest.mark.parametrize("cut", [3, 10, 18, 25, 50])
+def test_identifiers_split_between_feeds(cut):
+    text = f"paper https://doi.org/10.5555/split.doi.1 issn {VALID_ISSN} end"
+    scanner = IdentifierScanner()
+    scanner.feed(text[:cut])
+    scanner.feed(text[cut:])
+    found = scanner.close()
+    assert found.dois == ["10.5555/split.doi.1"]
+    assert found.issns == [VALID_ISSN]
+
+
+def test_close_flushes_the_pending_tail():
+    scanner = IdentifierScanner()
+    # At the end of the chunk the doi may still go on, so it is not reported yet
+    assert scanner.feed("doi 10.5555/last.1").dois == []
+    assert scanner.close().dois == ["10.5555/last.1"]
+
+
+def test_pending_text_is_bounded():
+    scanner = IdentifierScanner()
+    for _ in range(100):
+        scanner.feed("no identifiers here " * 50)
+    assert len(scanner._pending) <= _MAX_PENDING
+
+
+def test_duplicates_are_reported_once():
+    scanner = IdentifierScanner()
+    scanner.feed("10.5555/a.1 and DOI: 10.5555/A.1\n")
+    scanner.feed("again https://doi.org/10.5555/a.1\n")
+    assert scanner.close().dois == ["10.5555/a.1"]
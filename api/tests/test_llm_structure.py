@@ -0,0 +1,172 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from pydantic import BaseModel, Field
+
+import markdown_cache
+from llm_structure import DocumentChat
+from markdown_cache import MarkdownCache
+from response_cache import ResponseCache
+
+DOCUMENT = "# Optimal control of an epidemic model\n\nAna Pérez, Universidad de La Habana, 2021.\n"
+
+
+class FakeCompletions:
+    """chat.completions of an OpenAI client answering with the given contents in order"""
+
+    def __init__(self, answers: list[str]):
+        self.answers = list(answers)
+        self.requests: list[dict] = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.answers.pop(0)))],
+            usage=SimpleNamespace(
+                prompt_tokens=100,
+                completion_tokens=10,
+                prompt_tokens_details=SimpleNamespace(cached_tokens=80),
+            ),
+        )
+
+
+@pytest.fixture(autouse=True)
+def markdown(tmp_path, monkeypatch):
+    cache = MarkdownCache(str(tmp_path / "markdown_cache"), converter_version="test")
+    monkeypatch.setattr(markdown_cache, "_default_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def document(tmp_path) -> str:
+    path = tmp_path / "paper.md"
+    path.write_text(DOCUMENT, encoding="utf-8")
+    return str(path)
+
+
+def _chat(document: str, tmp_path, answers: list[str], **kwargs):
+    chat = DocumentChat(
+        document,
+        "http://llm.invalid/v1",
+        "key",
+        "model",
+        "Answer in json",
+        response_cache=ResponseCache(str(tmp_path / "llm_cache.sqlite")),
+        **kwargs,
+    )
+    completions = FakeCompletions(answers)
+    chat.api_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return chat, completions
+
+
+class Record(BaseModel):
+    title: str = Field(description="title of the paper")
+    year: int = Field(description="year of publication")
+    country: str = Field(description="country of the first author")
+
+
+def test_extract_record_in_one_call(document, tmp_path):
+    answer = {"title": "Optimal control", "year": 2021, "country": "Cuba"}
+    chat, completions = _chat(document, tmp_path, [json.dumps(answer)])
+    assert chat.extract_record(Record) == Record(**answer)
+    assert len(completions.requests) == 1
+    assert "- year: year of publication" in completions.requests[0]["messages"][-1]["content"]
+
+
+def test_extract_record_re_asks_only_the_invalid_fields(document, tmp_path):
+    answers = [
+        json.dumps({"title": "Optimal control", "year": "unknown"}),
+        json.dumps({"result": 2021}),
+        json.dumps({"result": "Cuba"}),
+    ]
+    chat, completions = _chat(document, tmp_path, answers)
+    assert chat.extract_record(Record) == Record(title="Optimal control", year=2021, country="Cuba")
+    asked = [request["messages"][-1]["content"] for request in completions.requests[1:]]
+    assert ["- year:" in query for query in asked] == [True, False]
+    assert ["- country:" in query for query in asked] == [False, True]
+
+
+def test_extract_record_by_groups_of_fields(document, tmp_path):
+    answers = [json.dumps({"title": "Optimal control", "year": 2021}), json.dumps({"country": "Cuba"})]
+    chat, completions = _chat(document, tmp_path, answers)
+    assert chat.extract_record(Record, fields_per_call=2).country == "Cuba"
+    schemas = [request["response_format"]["schema"]["properties"] for request in completions.requests]
+    assert [sorted(schema) for schema in schemas] == [["title", "year"], ["country"]]
+
+
+class Title(BaseModel):
+    result: str
+
+
+class Year(BaseModel):
+    result: int
+
+
+class Author(BaseModel):
+    result: str = Field(description="family name of the first author")
+
+
+def test_answers_are_reused_across_chats(document, tmp_path):
+    chat, completions = _chat(document, tmp_path, ['{"result": "Optimal control"}'])
+    assert chat.ask_with_json_format("title?", Title).result == "Optimal control"
+    again, completions = _chat(document, tmp_path, [])
+    assert again.ask_with_json_format("title?", Title).result == "Optimal control"
+    assert completions.requests == []
+
+
+def test_cache_key_covers_schema_model_and_document(document, tmp_path):
+    chat, completions = _chat(document, tmp_path, ['{"result": "a"}', '{"result": 2021}', '{"result": "b"}'])
+    chat.ask_with_json_format("question", Title)
+    chat.ask_with_json_format("question", Year)
+    chat.llm_model = "other-model"
+    chat.ask_with_json_format("question", Title)
+    assert len(completions.requests) == 3
+    with open(document, "a", encoding="utf-8") as file:
+        file.write("Corrected version.\n")
+    changed, completions = _chat(document, tmp_path, ['{"result": "c"}'])
+    assert changed.ask_with_json_format("question", Title).result == "c"
+
+
+def test_bypass_asks_again_and_refreshes_the_entry(document, tmp_path):
+    chat, _ = _chat(document, tmp_path, ['{"result": "old"}'])
+    chat.ask_with_json_format("title?", Title)
+    bypass, completions = _chat(document, tmp_path, ['{"result": "new"}'], use_cache=False)
+    assert bypass.ask_with_json_format("title?", Title).result == "new"
+    cached, _ = _chat(document, tmp_path, [])
+    assert cached.ask_with_json_format("title?", Title).result == "new"
+
+
+def test_response_cache_evicts_the_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1, 100))
+    monkeypatch.setattr("response_cache.time.time", lambda: next(clock))
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=25)
+    cache.set("a", "x" * 10)
+    cache.set("b", "x" * 10)
+    assert cache.get("a") is not None
+    cache.set("c", "x" * 10)
+    assert [cache.get(key) is not None for key in "abc"] == [True, False, True]
+
+
+def test_stable_prefix_keeps_the_document_prefix_identical(document, tmp_path):
+    answers = ['{"result": "a"}', '{"result": "b"}', '{"result": "c"}']
+    chat, completions = _chat(document, tmp_path, answers, stable_prefix=True, retrieval_top_k=1)
+    chat.ask_batch([("title?", Title), ("author?", Author), ("journal?", Title)])
+    messages = [request["messages"] for request in completions.requests]
+    # The whole document, not the retrieved chunks, and the same bytes on every query
+    assert messages[0][:2] == messages[1][:2] == messages[2][:2]
+    assert messages[0][1]["content"] == chat.file_context
+    assert all(request["extra_body"] == {"cache_prompt": True} for request in completions.requests)
+    # Queries sharing a schema are sent one after the other
+    asked = [request["messages"][-1]["content"] for request in completions.requests]
+    order = [query.split(" /n ")[1] for query in asked]
+    assert abs(order.index("title?") - order.index("journal?")) == 1
+
+
+def test_usage_counts_cached_prompt_tokens(document, tmp_path):
+    chat, _ = _chat(document, tmp_path, ['{"result": "a"}', '{"result": "b"}'])
+    chat.ask_with_json_format("title?", Title)
+    chat.ask_with_json_format("journal?", Title)
+    assert (chat.usage.calls, chat.usage.prompt_tokens, chat.usage.cached_prompt_tokens) == (2, 200, 160)
+    assert chat.usage.uncached_prompt_tokens == 40
+    assert chat.usage.cache_ratio == 0.8
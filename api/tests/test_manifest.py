@@ -0,0 +1,52 @@
+import sqlite3
+
+from manifest import IngestManifest
+
+
+def _pdf(tmp_path, name="a.pdf", content=b"%PDF-1.4 a"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_failed_files_are_retried_with_backoff(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "m.sqlite"), retry_backoff=10, max_attempts=3)
+    path = _pdf(tmp_path)
+    assert manifest.is_due(path)
+
+    manifest.record(path, None, "failed", "Crossref down")
+    recorded = manifest._file_row(path)[4]
+    assert not manifest.is_due(path, recorded + 5)
+    assert manifest.is_due(path, recorded + 10)
+
+    manifest.record(path, None, "failed", "Crossref down")
+    recorded = manifest._file_row(path)[4]
+    # The backoff doubles after each failure
+    assert not manifest.is_due(path, recorded + 15)
+    assert manifest.is_due(path, recorded + 20)
+
+    manifest.record(path, None, "failed", "Crossref down")
+    assert not manifest.is_due(path, recorded + 10_000)
+
+
+def test_uploaded_files_are_not_due(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "m.sqlite"))
+    path = _pdf(tmp_path)
+    manifest.record(path, None, "failed")
+    manifest.record(path, "10.5555/a.1", "uploaded")
+    assert not manifest.is_due(path, float("inf"))
+
+
+def test_manifest_without_attempts_column(tmp_path):
+    database = str(tmp_path / "old.sqlite")
+    connection = sqlite3.connect(database)
+    connection.execute(
+        "CREATE TABLE files (sha256 TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, "
+        "mtime REAL NOT NULL, doi TEXT, status TEXT NOT NULL, error TEXT, updated_at REAL NOT NULL)"
+    )
+    connection.commit()
+    connection.close()
+    manifest = IngestManifest(database, retry_backoff=0)
+    path = _pdf(tmp_path)
+    manifest.record(path, None, "failed")
+    assert manifest.is_due(path)
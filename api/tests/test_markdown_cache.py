@@ -0,0 +1,61 @@
+import os
+
+from manifest import file_hash
+from markdown_cache import MarkdownCache
+
+
+class Converter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, file_path: str) -> str:
+        self.calls += 1
+        with open(file_path, encoding="utf-8") as file:
+            return f"# {file.read()}"
+
+
+def _document(tmp_path, name: str, content: str) -> str:
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+
+def test_converts_once_per_content_and_variant(tmp_path):
+    cache = MarkdownCache(str(tmp_path / "cache"), converter_version="1")
+    convert = Converter()
+    path = _document(tmp_path, "a.pdf", "first")
+    copy = _document(tmp_path, "copy.pdf", "first")
+    assert cache.get_or_convert(path, convert) == "# first"
+    assert cache.get_or_convert(copy, convert) == "# first"
+    assert convert.calls == 1
+    cache.get_or_convert(path, convert, variant="llm-model")
+    assert convert.calls == 2
+    # A changed file is a new entry
+    _document(tmp_path, "a.pdf", "second")
+    assert cache.get_or_convert(path, convert) == "# second"
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_a_new_converter_version_purges_the_old_entries(tmp_path):
+    directory = str(tmp_path / "cache")
+    path = _document(tmp_path, "a.pdf", "text")
+    MarkdownCache(directory, converter_version="1").get_or_convert(path, Converter())
+    convert = Converter()
+    cache = MarkdownCache(directory, converter_version="2")
+    assert not [name for name in os.listdir(directory) if name.startswith("1-")]
+    cache.get_or_convert(path, convert)
+    assert convert.calls == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = MarkdownCache(str(tmp_path / "cache"), max_bytes=250, converter_version="1")
+    convert = Converter()
+    paths = [_document(tmp_path, f"{name}.pdf", name * 100) for name in "abc"]
+    for age, path in zip((30, 20), paths):
+        cache.get_or_convert(path, convert)
+        entry = cache._path(file_hash(path), "default")
+        os.utime(entry, (os.path.getmtime(entry) - age,) * 2)
+    cache.get_or_convert(paths[2], convert)
+    assert len(os.listdir(cache.directory)) == 2
+    assert not os.path.exists(cache._path(file_hash(paths[0]), "default"))
+
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from metrics import Metrics, profile_call
+
+
+def test_spans_are_timed_and_failures_counted(tmp_path):
+    with Metrics(str(tmp_path / "metrics.jsonl")) as metrics:
+        with metrics.span("upload", host="cloud") as span:
+            span.labels["status"] = 200
+            span.fields["rows"] = 3
+        with pytest.raises(ValueError):
+            with metrics.span("upload", host="cloud"):
+                raise ValueError("rejected")
+        metrics.inc("crossref_cache_hits", endpoint="works")
+        metrics.inc("crossref_cache_hits", 2, endpoint="works")
+
+    snapshot = metrics.snapshot()
+    counters = {(item["name"], tuple(item["labels"].items())): item["value"] for item in snapshot["counters"]}
+    assert counters[("crossref_cache_hits", (("endpoint", "works"),))] == 3
+    assert counters[("upload_failures", (("host", "cloud"),))] == 1
+    assert sorted(timing["count"] for timing in snapshot["timings"]) == [1, 1]
+
+    lines = [json.loads(line) for line in (tmp_path / "metrics.jsonl").read_text().splitlines()]
+    assert [(line["event"], line["ok"]) for line in lines] == [("upload", True), ("upload", False)]
+    assert lines[0]["labels"] == {"host": "cloud", "status": 200}
+    assert lines[0]["rows"] == 3
+
+
+def test_prometheus_histograms_are_cumulative():
+    metrics = Metrics()
+    for seconds in (0.003, 0.3, 200):
+        metrics.observe("pdf_parse", seconds)
+    metrics.inc("http_retries", host="api.crossref.org")
+    text = metrics.to_prometheus()
+    assert "# TYPE ocr_nodo_http_retries_total counter" in text
+    assert 'ocr_nodo_http_retries_total{host="api.crossref.org"} 1' in text
+    assert 'ocr_nodo_pdf_parse_seconds_bucket{le="0.005"} 1' in text
+    assert 'ocr_nodo_pdf_parse_seconds_bucket{le="0.5"} 2' in text
+    assert 'ocr_nodo_pdf_parse_seconds_bucket{le="120"} 2' in text
+    assert 'ocr_nodo_pdf_parse_seconds_bucket{le="+Inf"} 3' in text
+    assert "ocr_nodo_pdf_parse_seconds_count 3" in text
+
+
+def test_events_after_close_are_only_aggregated(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics = Metrics(str(path))
+    metrics.close()
+    with metrics.span("sync"):
+        pass
+    assert path.read_text() == ""
+    assert metrics.snapshot()["timings"][0]["count"] == 1
+
+
+def test_profile_call_returns_the_result(capsys):
+    assert profile_call(sum, [1, 2, 3], limit=5) == 6
+    assert "function calls" in capsys.readouterr().out
+
+
+def test_prometheus_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.inc("row_build_failures", error='bad "title"\nC:\\file')
+    assert 'ocr_nodo_row_build_failures_total{error="bad \\"title\\"\\nC:\\\\file"} 1' in metrics.to_prometheus()
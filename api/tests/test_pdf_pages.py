@@ -0,0 +1,65 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench"))
+from corpus import make_pdf  # noqa: E402
+
+import markdown_cache  # noqa: E402
+from markdown_cache import MarkdownCache  # noqa: E402
+from pdf_pages import iter_page_texts, scan_page_texts  # noqa: E402
+from utils import get_text_from_pdf  # noqa: E402
+
+
+@pytest.fixture
+def big_pdf(tmp_path):
+    path = str(tmp_path / "thesis.pdf")
+    make_pdf(path, [f"Page {index} " + "text " * 200 for index in range(60)])
+    return path
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    cache = MarkdownCache(str(tmp_path / "markdown_cache"), converter_version="test")
+    monkeypatch.setattr(markdown_cache, "_default_cache", cache)
+    return cache
+
+
+def test_page_and_char_caps(big_pdf):
+    assert len(list(iter_page_texts(big_pdf, max_pages=5))) == 5
+    assert sum(map(len, iter_page_texts(big_pdf, max_pages=100, max_chars=1500))) == 1500
+
+
+def test_scan_stops_at_the_first_doi(tmp_path):
+    path = str(tmp_path / "paper.pdf")
+    make_pdf(path, ["doi 10.5555/first.1 here"] + [f"Page {index}" for index in range(20)] + ["10.5555/last.2"])
+    read = []
+    pages = iter_page_texts(path, max_pages=100)
+    found = scan_page_texts(page for page in pages if not read.append(page))
+    assert found.dois == ["10.5555/first.1"]
+    assert len(read) == 1
+
+
+def test_get_text_from_pdf_is_capped(big_pdf, monkeypatch):
+    monkeypatch.setenv("PDF_MAX_TEXT_PAGES", "3")
+    text = get_text_from_pdf(big_pdf)
+    assert "Page 2 " in text and "Page 3 " not in text
+    assert len(get_text_from_pdf(big_pdf, max_pages=60, max_chars=2000)) == 2000
+
+
+def test_cache_reads_only_a_prefix(tmp_path, cache):
+    path = tmp_path / "doc.txt"
+    path.write_text("x" * 10_000)
+    assert len(cache.get_or_convert(str(path), lambda file_path: Path(file_path).read_text(), max_chars=100)) == 100
+    assert len(cache.get_or_convert(str(path), lambda file_path: Path(file_path).read_text(), max_chars=100)) == 100
+    assert cache.hits == 1
+
+
+def test_cache_uses_the_given_hash(tmp_path, cache, monkeypatch):
+    path = tmp_path / "doc.txt"
+    path.write_text("text")
+    digest = markdown_cache.file_hash(str(path))
+    monkeypatch.setattr(markdown_cache, "file_hash", lambda file_path: pytest.fail("hashed again"))
+    assert cache.get_or_convert(str(path), lambda file_path: "converted", sha256=digest) == "converted"
+    assert cache.get_or_convert(str(path), lambda file_path: "other", sha256=digest) == "converted"
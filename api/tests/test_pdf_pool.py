@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pdf_pool import KillablePool
+
+
+def test_timeout_kills_and_replaces_the_worker():
+    pool = KillablePool(time.sleep, workers=1)
+    try:
+        began = time.monotonic()
+        with pytest.raises(TimeoutError):
+            pool.run(60, timeout=0.5)
+        assert time.monotonic() - began < 10
+        # The replacement worker takes the next call
+        assert pool.run(0, timeout=30) is None
+    finally:
+        pool.shutdown()
+
+
+def test_task_errors_and_crashes_are_reported():
+    errors = KillablePool(int, workers=1)
+    crashes = KillablePool(os._exit, workers=1)
+    try:
+        with pytest.raises(Exception, match="ValueError"):
+            errors.run("not a number", timeout=30)
+        assert errors.run("7", timeout=30) == 7
+        with pytest.raises(Exception, match="worker crashed"):
+            crashes.run(3, timeout=30)
+    finally:
+        errors.shutdown()
+        crashes.shutdown()
+
+
+def test_shutdown_does_not_wait_for_a_hung_call():
+    pool = KillablePool(time.sleep, workers=1)
+    pool.run(0, timeout=30)  # the worker is up
+    failures = []
+
+    def hung():
+        try:
+            pool.run(60, timeout=120)
+        except Exception as e:
+            failures.append(e)
+
+    thread = threading.Thread(target=hung)
+    thread.start()
+    time.sleep(0.5)
+    began = time.monotonic()
+    pool.shutdown()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert time.monotonic() - began < 10
+    assert failures
+
+
+def test_workers_start_on_demand():
+    pool = KillablePool(int, workers=2)
+    try:
+        assert not pool._workers
+        assert pool.run("1", timeout=30) == 1
+        assert pool.run("2", timeout=30) == 2
+        # Sequential calls reuse the idle worker
+        assert len(pool._workers) == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+
+import pytest
+
+from pipeline import Stage, run_pipeline
+
+
+@dataclass
+class Item:
+    value: int
+    error: str | None = None
+
+
+def _double(item: Item):
+    item.value *= 2
+
+
+def _fail_on_three(item: Item):
+    if item.value == 6:
+        raise Exception("bad item")
+
+
+def test_items_go_through_every_stage():
+    stages = [Stage("double", _double, 3), Stage("check", _fail_on_three, 2)]
+    items = list(run_pipeline((Item(value) for value in range(10)), stages, queue_size=2))
+    assert sorted(item.value for item in items) == [value * 2 for value in range(10)]
+    assert [item.error for item in items if item.error] == ["check: bad item"]
+
+
+def test_source_error_ends_the_pipeline_and_is_raised():
+    def source():
+        yield Item(1)
+        yield Item(2)
+        raise OSError("folder vanished")
+
+    produced = []
+    with pytest.raises(OSError, match="folder vanished"):
+        for item in run_pipeline(source(), [Stage("double", _double, 2)], queue_size=1):
+            produced.append(item.value)
+    assert sorted(produced) == [2, 4]
@@ -0,0 +1,51 @@
+from retrieval import BM25Index, DocumentRetriever, estimate_tokens, split_markdown, tokenize
+
+DOCUMENT = """# Optimal control of an epidemic model
+
+Abstract about vaccination strategies.
+
+## Authors
+
+Ana Pérez, Universidad de La Habana.
+
+## Funding
+
+This work was funded by the Agencia Nacional de Investigación, project PN-2021-7.
+
+## Results
+
+The vaccination rate reduces the peak of infections.
+"""
+
+
+def test_tokenize_folds_case_and_accents():
+    assert tokenize("Investigación ÁREA área") == ["investigacion", "area", "area"]
+
+
+def test_split_keeps_sections_and_respects_the_size():
+    chunks = split_markdown(DOCUMENT, max_chars=120)
+    assert chunks[1] == "## Authors\n\nAna Pérez, Universidad de La Habana."
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    long = split_markdown("x" * 250, max_chars=100)
+    assert [len(chunk) for chunk in long] == [100, 100, 50]
+
+
+def test_bm25_ranks_the_chunk_with_the_rare_terms_first():
+    index = BM25Index(["vaccination model results", "funded by the agencia nacional", "vaccination"])
+    scores = index.scores("Who funded the project? Agencia")
+    assert max(range(3), key=scores.__getitem__) == 1
+    assert index.scores("unknown words") == [0, 0, 0]
+    # The shorter chunk wins for the same term
+    scores = index.scores("vaccination")
+    assert scores[2] > scores[0] > 0
+
+
+def test_context_returns_the_top_chunks_in_document_order_within_the_budget():
+    retriever = DocumentRetriever(DOCUMENT, chunk_chars=120)
+    context = retriever.context("funding agency project and authors university", top_k=2, token_budget=1000)
+    assert context.index("## Authors") < context.index("## Funding")
+    assert "## Results" not in context
+    # The best chunk is always included, the rest only if they fit
+    context = retriever.context("funding agency project", top_k=4, token_budget=1)
+    assert context.startswith("## Funding") and estimate_tokens(context) > 1
+    assert "## Authors" not in context
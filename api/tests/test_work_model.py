@@ -0,0 +1,60 @@
+import work_model
+from crossref_cache import CrossrefCache
+from work_model import WORK_FIELDS, CrossrefWork, fetch_works
+
+# A /works/{doi} message, with some of the fields the batch query does not select
+FULL_MESSAGE = {
+    "DOI": "10.5555/a.1",
+    "title": ["Optimal control of an epidemic model"],
+    "author": [
+        {
+            "given": "Ana",
+            "family": "Pérez",
+            "sequence": "first",
+            "affiliation": [
+                {
+                    "name": "Universidad de La Habana",
+                    "id": [{"id": "https://ror.org/04wj7ac65", "id-type": "ROR"}],
+                }
+            ],
+        },
+        {"given": "Luis", "family": "García", "sequence": "additional", "affiliation": []},
+    ],
+    "ISSN": ["1234-5678", "8765-4321"],
+    "issn-type": [{"type": "print", "value": "1234-5678"}, {"type": "electronic", "value": "8765-4321"}],
+    "funder": [{"name": "Agency", "award": ["A-1"]}, {"name": "Foundation"}],
+    "indexed": {"date-parts": [[2024, 5, 1]]},
+    "published": {"date-parts": [[2021, 3]]},
+    "member": "78",
+    "publisher": "Elsevier BV",
+    "container-title": ["Journal of Examples"],
+    "reference": [{"key": "ref1", "DOI": "10.5555/ref.1"}],
+    "link": [{"URL": "https://example.org/a.pdf"}],
+    "is-referenced-by-count": 12,
+}
+
+
+def test_batch_item_parses_like_the_full_work(tmp_path, monkeypatch):
+    cache = CrossrefCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(work_model, "get_default_cache", lambda: cache)
+    queries = []
+
+    def fetch_items(params, use_cache=True):
+        queries.append(params)
+        # What filter=doi:...&select=WORK_FIELDS returns
+        return [{key: value for key, value in FULL_MESSAGE.items() if key in WORK_FIELDS}]
+
+    monkeypatch.setattr(work_model, "fetch_items", fetch_items)
+    expected = CrossrefWork.from_message(FULL_MESSAGE)
+    assert fetch_works(["https://doi.org/10.5555/A.1"]) == {"10.5555/a.1": expected}
+    assert queries[0]["filter"] == "doi:10.5555/a.1"
+    # The second time from the cache, without querying
+    assert fetch_works(["10.5555/a.1"]) == {"10.5555/a.1": expected}
+    assert len(queries) == 1
+
+
+def test_unknown_dois_are_none(tmp_path, monkeypatch):
+    cache = CrossrefCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(work_model, "get_default_cache", lambda: cache)
+    monkeypatch.setattr(work_model, "fetch_items", lambda params, use_cache=True: [])
+    assert fetch_works(["10.5555/missing.1"]) == {"10.5555/missing.1": None}